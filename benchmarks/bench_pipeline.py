@@ -0,0 +1,221 @@
+"""
+Time each stage of the LeanSchema pipeline against a generated Schema
+and Query corpus, and report wall time and peak RSS as JSON.
+
+The report can be saved as a baseline and later runs compared against
+it, ie:
+
+    python -m benchmarks.bench_pipeline --types 20000 --output baseline.json
+    python -m benchmarks.bench_pipeline --types 20000 --compare baseline.json
+
+Peak RSS is the high-water mark of the process after each stage, so it
+only grows from one stage to the next.
+
+Usage: python -m benchmarks.bench_pipeline [--types N] [--queries N] ...
+
+"""
+
+__author__ = "prussell"
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import graphql
+
+from benchmarks.schema_generator import generate_queries, generate_schema, write_corpus
+from lean_schema import decomp, get_types, stats
+from lean_schema.cache import load_schema_with_digest
+from lean_schema.project_logging import logger
+
+# A stage is a regression if it's this much slower than the baseline
+DEFAULT_TOLERANCE = 0.25
+# Stages faster than this are too noisy to compare
+MIN_COMPARED_WALL_S = 0.05
+
+
+class StageTimer(object):
+    def __init__(self):
+        self.stages = []
+
+    def run(self, stage: str, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.stages.append(
+            {
+                "stage": stage,
+                "wall_s": round(time.perf_counter() - start, 6),
+                "peak_rss_kb": stats.peak_rss_kb(),
+            }
+        )
+        return result
+
+
+def generate_corpus(args, work_dir: str):
+    schema = generate_schema(
+        num_types=args.types,
+        fan_out=args.fan_out,
+        interface_ratio=args.interface_ratio,
+        union_ratio=args.union_ratio,
+        input_object_depth=args.input_object_depth,
+        description_size=args.description_size,
+        seed=args.seed,
+    )
+    queries = generate_queries(
+        schema, num_queries=args.queries, depth=args.query_depth, seed=args.seed
+    )
+    write_corpus(work_dir, schema, queries)
+
+
+def run_pipeline(args, work_dir: str) -> dict:
+    # Generate in another process so the generated objects don't count
+    # towards the peak RSS of the stages
+    process = multiprocessing.Process(target=generate_corpus, args=(args, work_dir))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError("Generating the Schema and Queries failed")
+    schema_path = os.path.join(work_dir, "graphql_schema.json")
+    queries_path = os.path.join(work_dir, "queries")
+
+    timer = StageTimer()
+    schema, _ = timer.run("load_schema", load_schema_with_digest, schema_path)
+    schema = schema["data"]
+    client_schema = timer.run(
+        "build_client_schema", graphql.build_client_schema, schema
+    )
+    type_names = timer.run(
+        "get_types",
+        get_types.get_types,
+        queries_path,
+        client_schema,
+        jobs=args.jobs,
+        schema_path=schema_path,
+    )
+    graph, scalars = timer.run("build_graph", decomp.build_graph, schema)
+    graph_types = len(graph)
+    lean_schema = timer.run(
+        "decompose",
+        decomp.decompose,
+        schema,
+        input_types=type_names,
+        input_object_depth_level=args.input_object_depth_level,
+        graph=graph,
+        scalar_types=scalars,
+    )
+    lean_types = len(lean_schema["__schema"]["types"])
+    output = timer.run("serialize", json.dumps, {"data": lean_schema})
+    del schema, client_schema, graph, lean_schema
+    timer.run("load_schema_streaming", decomp.load_schema_streaming, schema_path)
+
+    return {
+        "params": {
+            key: getattr(args, key)
+            for key in (
+                "types",
+                "fan_out",
+                "interface_ratio",
+                "union_ratio",
+                "input_object_depth",
+                "description_size",
+                "queries",
+                "query_depth",
+                "input_object_depth_level",
+                "jobs",
+                "seed",
+            )
+        },
+        "python": platform.python_version(),
+        "counts": {
+            "queries": len(get_types.find_document_files(queries_path)),
+            "query_types": len(type_names),
+            "graph_types": graph_types,
+            "lean_schema_types": lean_types,
+            "output_bytes": len(output),
+        },
+        "stages": timer.stages,
+        "total_wall_s": round(sum(stage["wall_s"] for stage in timer.stages), 6),
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    return: (stage, baseline wall time, wall time) of every stage that
+    got slower than the tolerance allows
+
+    """
+    baseline_stages = {stage["stage"]: stage for stage in baseline["stages"]}
+    regressions = []
+    for stage in report["stages"]:
+        before = baseline_stages.get(stage["stage"])
+        if before is None or before["wall_s"] < MIN_COMPARED_WALL_S:
+            continue
+        if stage["wall_s"] > before["wall_s"] * (1 + tolerance):
+            regressions.append((stage["stage"], before["wall_s"], stage["wall_s"]))
+
+    return regressions
+
+
+def main(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--types", type=int, default=20000)
+    parser.add_argument("--fan-out", type=int, default=8)
+    parser.add_argument("--interface-ratio", type=float, default=0.05)
+    parser.add_argument("--union-ratio", type=float, default=0.02)
+    parser.add_argument("--input-object-depth", type=int, default=3)
+    parser.add_argument("--description-size", type=int, default=80)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--query-depth", type=int, default=3)
+    parser.add_argument("--input-object-depth-level", type=int, default=1)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--corpus-dir",
+        help="Directory to write the generated Schema and Queries to, a temporary directory by default",
+    )
+    parser.add_argument("--output", help="Write the JSON report here, not to stdout")
+    parser.add_argument(
+        "--compare",
+        metavar="BASELINE",
+        help="Exit with status 1 if any stage is slower than in this earlier report",
+    )
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(args)
+    logger.setLevel(logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.corpus_dir:
+        report = run_pipeline(args, args.corpus_dir)
+    else:
+        with tempfile.TemporaryDirectory() as work_dir:
+            report = run_pipeline(args, work_dir)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as ofile:
+            ofile.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as ifile:
+            baseline = json.load(ifile)
+        regressions = compare(report, baseline, args.tolerance)
+        for stage, before, after in regressions:
+            print(
+                "Regression in {}: {:.3f}s -> {:.3f}s".format(stage, before, after),
+                file=sys.stderr,
+            )
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
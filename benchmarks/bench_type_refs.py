@@ -0,0 +1,112 @@
+"""
+Benchmark the Introspection-shape aware Type reference extraction in
+decomp against the generic deep walk it replaced, which visited every
+dict, list and (key, value) pair of a Type.
+
+Usage: python -m benchmarks.bench_type_refs [--types N] [--repeat N]
+
+"""
+
+__author__ = "prussell"
+
+import argparse
+import sys
+import time
+
+from benchmarks.schema_generator import generate_schema
+from lean_schema import decomp
+
+
+def generic_outbound_type_refs(root: dict) -> list:
+    """The generic walk, as decomp.get_outbound_type_refs used to be"""
+    res = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if type(node) is list:
+            stack.extend(node)
+        elif type(node) is dict:
+            if decomp.is_graphql_type_ref(node):
+                res.append(node["name"])
+            stack.extend(node.items())
+        elif type(node) is tuple:
+            stack.append(node[0])
+            stack.append(node[1])
+
+    return res
+
+
+def generic_all_scalar_types(root) -> set:
+    """The generic walk, as decomp.all_scalar_types used to be"""
+    stack = [root]
+    R = set()
+    while stack:
+        node = stack.pop()
+        if type(node) is list:
+            stack.extend(node)
+        elif type(node) is dict:
+            if "kind" in node and node["kind"].lower() == "scalar":
+                R.add(node["name"])
+            stack.extend(node.items())
+        elif type(node) is tuple:
+            stack.append(node[0])
+            stack.append(node[1])
+
+    return R
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--types", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(args)
+
+    schema = generate_schema(num_types=args.types)
+    types = decomp.get_schema_types(schema)
+
+    # Same edges, except that the generic walk also reports each Type
+    # as referencing itself
+    for T in types:
+        generic = set(generic_outbound_type_refs(T)) - {T["name"]}
+        typed = set(decomp.get_outbound_type_refs(T)) - {T["name"]}
+        assert generic == typed, T["name"]
+    assert generic_all_scalar_types(schema) == decomp.all_scalar_types(schema)
+
+    results = [
+        (
+            "outbound refs",
+            best_of(
+                args.repeat, lambda: [generic_outbound_type_refs(T) for T in types]
+            ),
+            best_of(
+                args.repeat, lambda: [decomp.get_outbound_type_refs(T) for T in types]
+            ),
+        ),
+        (
+            "scalar types",
+            best_of(args.repeat, lambda: generic_all_scalar_types(schema)),
+            best_of(args.repeat, lambda: decomp.all_scalar_types(schema)),
+        ),
+    ]
+
+    print("{} Types".format(len(types)))
+    print("{:<16}{:>12}{:>12}{:>10}".format("stage", "generic", "typed", "speedup"))
+    for stage, generic, typed in results:
+        print(
+            "{:<16}{:>11.3f}s{:>11.3f}s{:>9.1f}x".format(
+                stage, generic, typed, generic / typed
+            )
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,125 @@
+"""
+Benchmark the AllTypesVisitor, which only handles the kinds of nodes
+that enter a new Type, against the generic visitor it replaced, which
+looked up all four Types of the TypeInfo at every AST node.
+
+Usage: python -m benchmarks.bench_visitor [--types N] [--queries N] ...
+
+"""
+
+__author__ = "prussell"
+
+import argparse
+import logging
+import sys
+import time
+
+import graphql
+from graphql.language import visit
+from graphql.language.visitor import TypeInfoVisitor, Visitor
+from graphql.utilities import TypeInfo
+from graphql.validation.validation_context import ValidationContext
+
+from benchmarks.schema_generator import generate_queries, generate_schema
+from lean_schema.project_logging import logger
+from lean_schema.visitors import AllTypesVisitor
+
+
+class GenericAllTypesVisitor(Visitor):
+    """The generic visitor, as visitors.AllTypesVisitor used to be"""
+
+    def __init__(self, context):
+        self.types = set()
+        self.fields = set()
+        self.context = context
+        self.num_nodes = 0
+
+    def enter(self, node, *args):
+        self.num_nodes += 1
+        if node.kind == "field":
+            parent_type = self.context.get_parent_type()
+            field_name = node.name.value
+            if parent_type is not None and not field_name.startswith("__"):
+                self.fields.add((parent_type.name, field_name))
+        self.types.add(self.context.get_type())
+        self.types.add(self.context.get_input_type())
+        self.types.add(self.context.get_parent_type())
+        self.types.add(self.context.get_parent_input_type())
+
+
+def visit_documents(documents, schema, visitor_class) -> tuple:
+    """
+    return: the Types and fields all documents reference, as
+    get_types.visit_document visits them
+
+    """
+    types = set()
+    fields = set()
+    for document in documents:
+        type_info = TypeInfo(schema)
+        context = ValidationContext(schema, document, type_info)
+        for definition in document.definitions:
+            visitor = visitor_class(context)
+            visit(definition, TypeInfoVisitor(type_info, visitor))
+            types.update(visitor.types)
+            fields.update(visitor.fields)
+
+    return types, fields
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--types", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--query-depth", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(args)
+    logger.setLevel(logging.WARNING)
+
+    ischema = generate_schema(num_types=args.types)
+    schema = graphql.build_client_schema(ischema["data"])
+    documents = [
+        graphql.parse(text, no_location=True)
+        for _, text in generate_queries(
+            ischema, num_queries=args.queries, depth=args.query_depth
+        )
+    ]
+
+    # Same Types and fields, except for the None of Types the TypeInfo
+    # isn't in, which get_types.expand_types drops anyway. Wrapped Types
+    # of Variables are created anew for each visit, so Types are
+    # compared by how they print.
+    generic_types, generic_fields = visit_documents(
+        documents, schema, GenericAllTypesVisitor
+    )
+    types, fields = visit_documents(documents, schema, AllTypesVisitor)
+    assert {str(T) for T in generic_types if T} == {str(T) for T in types if T}
+    assert generic_fields == fields
+
+    generic_s = best_of(
+        args.repeat,
+        lambda: visit_documents(documents, schema, GenericAllTypesVisitor),
+    )
+    typed_s = best_of(
+        args.repeat, lambda: visit_documents(documents, schema, AllTypesVisitor)
+    )
+    print("{} Queries, {} Types".format(len(documents), len(types)))
+    print("{:<16}{:>12}{:>12}{:>10}".format("stage", "generic", "typed", "speedup"))
+    print(
+        "{:<16}{:>11.3f}s{:>11.3f}s{:>9.1f}x".format(
+            "visit", generic_s, typed_s, generic_s / typed_s
+        )
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
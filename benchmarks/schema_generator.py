@@ -0,0 +1,458 @@
+"""
+Deterministic generator of large Introspection format Schemas.
+
+The test Schemas (SWAPI, tweets) are far too small to show how decomp
+and get_types scale. generate_schema builds a Schema of any size with
+Objects, Interfaces, Unions, Enums, InputObject chains and padded
+descriptions. The same parameters and seed always give the same
+Schema.
+
+Type names look like D3_Object17, so each of the num_domains prefixes
+is a Domain for the types.yaml "domains" option.
+
+generate_queries builds a matching corpus of Query files: Queries
+with nested selections, fragments on Interfaces and Unions, and
+Mutations taking InputObject variables.
+
+Objects are split into layers and only reference Objects of later
+layers. graphql-core builds its type map recursively, so a Graph with
+long reference chains would exceed the recursion limit, and real
+Schemas tend to be shallow trees of Domains anyway.
+
+"""
+
+__author__ = "prussell"
+
+import copy
+import json
+import os
+import random
+import typing
+
+OBJECT_LAYERS = 8
+BUILTIN_SCALARS = ["String", "Int", "Float", "Boolean", "ID"]
+SCALAR_LITERALS = {"Int": "1", "Float": "1.5", "Boolean": "true", "Long": "1"}
+CUSTOM_SCALARS = ["BigDecimal", "Long"]
+WORDS = (
+    "the of a value that is used for when this field type returns "
+    "record entity account amount deprecated"
+).split()
+
+
+def description(rng: random.Random, size: int) -> typing.Optional[str]:
+    if size <= 0:
+        return None
+
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+
+    return " ".join(words)[:size]
+
+
+def named_ref(kind: str, name: str) -> dict:
+    return {"kind": kind, "name": name, "ofType": None}
+
+
+def wrap(rng: random.Random, ref: dict) -> dict:
+    """Randomly wrap a named ref in NonNull/List, ie Foo, Foo!, [Foo!]!"""
+    if rng.random() < 0.3:
+        ref = {"kind": "NON_NULL", "name": None, "ofType": ref}
+    if rng.random() < 0.3:
+        ref = {"kind": "LIST", "name": None, "ofType": ref}
+        if rng.random() < 0.5:
+            ref = {"kind": "NON_NULL", "name": None, "ofType": ref}
+    return ref
+
+
+def input_value(rng: random.Random, name: str, ref: dict, description_size: int):
+    return {
+        "name": name,
+        "description": description(rng, description_size),
+        "type": ref,
+        "defaultValue": None,
+    }
+
+
+def field(
+    rng: random.Random, name: str, ref: dict, args: list, description_size: int
+) -> dict:
+    deprecated = rng.random() < 0.05
+    return {
+        "name": name,
+        "description": description(rng, description_size),
+        "args": args,
+        "type": ref,
+        "isDeprecated": deprecated,
+        "deprecationReason": "No longer supported" if deprecated else None,
+    }
+
+
+def type_def(kind: str, name: str, rng: random.Random, description_size: int):
+    return {
+        "kind": kind,
+        "name": name,
+        "description": description(rng, description_size),
+        "fields": None,
+        "inputFields": None,
+        "interfaces": None,
+        "enumValues": None,
+        "possibleTypes": None,
+    }
+
+
+def generate_schema(
+    num_types: int = 1000,
+    fan_out: int = 8,
+    interface_ratio: float = 0.05,
+    union_ratio: float = 0.02,
+    input_ratio: float = 0.2,
+    enum_ratio: float = 0.1,
+    input_object_depth: int = 3,
+    description_size: int = 80,
+    num_domains: int = 20,
+    seed: int = 0,
+) -> dict:
+    """
+    Generate an Introspection format Schema of about num_types Types.
+
+    @param fan_out: number of fields per Object/Interface/InputObject
+    @param input_object_depth: length of the chains of InputObjects
+    referencing each other
+    @param description_size: characters per description, 0 for none
+
+    """
+    rng = random.Random(seed)
+    num_interfaces = max(1, int(num_types * interface_ratio))
+    num_unions = max(1, int(num_types * union_ratio))
+    num_inputs = max(input_object_depth, int(num_types * input_ratio))
+    num_enums = max(1, int(num_types * enum_ratio))
+    num_objects = max(
+        1, num_types - num_interfaces - num_unions - num_inputs - num_enums
+    )
+
+    def names(kind, count):
+        return ["D{}_{}{}".format(i % num_domains, kind, i) for i in range(count)]
+
+    objects = names("Object", num_objects)
+    interfaces = names("Interface", num_interfaces)
+    unions = names("Union", num_unions)
+    inputs = names("Input", num_inputs)
+    enums = names("Enum", num_enums)
+    scalars = BUILTIN_SCALARS + CUSTOM_SCALARS
+
+    def scalar_ref():
+        return named_ref("SCALAR", rng.choice(scalars))
+
+    layer_size = max(1, num_objects // OBJECT_LAYERS)
+
+    def leaf_ref():
+        if rng.random() < 0.8:
+            return scalar_ref()
+        return named_ref("ENUM", rng.choice(enums))
+
+    def output_ref(i):
+        """Output Type ref for a field of the i-th Object"""
+        below = objects[(i // layer_size + 1) * layer_size :]
+        roll = rng.random()
+        if roll < 0.5 or not below:
+            return leaf_ref()
+        elif roll < 0.6:
+            return named_ref("INTERFACE", rng.choice(interfaces))
+        return named_ref("OBJECT", rng.choice(below))
+
+    def args():
+        return [
+            input_value(rng, "arg{}".format(i), wrap(rng, scalar_ref()), 0)
+            for i in range(rng.randrange(3))
+        ]
+
+    types = []
+
+    # Interfaces first, Objects copy their fields
+    interface_fields = {}
+    for k, name in enumerate(interfaces):
+        T = type_def("INTERFACE", name, rng, description_size)
+        T["fields"] = [
+            field(rng, "id", named_ref("SCALAR", "ID"), [], description_size)
+        ] + [
+            field(rng, "iface{}_{}".format(k, i), wrap(rng, leaf_ref()), [], 0)
+            for i in range(max(1, fan_out // 4))
+        ]
+        T["possibleTypes"] = []
+        interface_fields[name] = T["fields"]
+        types.append(T)
+    interface_types = {T["name"]: T for T in types}
+
+    for i, name in enumerate(objects):
+        T = type_def("OBJECT", name, rng, description_size)
+        implements = rng.sample(interfaces, min(len(interfaces), rng.randrange(3)))
+        T["interfaces"] = [named_ref("INTERFACE", iface) for iface in implements]
+        fields = {}
+        for iface in implements:
+            interface_types[iface]["possibleTypes"].append(named_ref("OBJECT", name))
+            for f in interface_fields[iface]:
+                fields[f["name"]] = copy.deepcopy(f)
+        for j in range(fan_out):
+            fields["field{}".format(j)] = field(
+                rng,
+                "field{}".format(j),
+                wrap(rng, output_ref(i)),
+                args(),
+                description_size,
+            )
+        T["fields"] = list(fields.values())
+        types.append(T)
+
+    for name in unions:
+        T = type_def("UNION", name, rng, description_size)
+        T["possibleTypes"] = [
+            named_ref("OBJECT", obj)
+            for obj in rng.sample(objects, min(len(objects), 2 + rng.randrange(4)))
+        ]
+        types.append(T)
+
+    for name in enums:
+        T = type_def("ENUM", name, rng, description_size)
+        T["enumValues"] = [
+            {
+                "name": "VALUE_{}".format(i),
+                "description": description(rng, description_size),
+                "isDeprecated": False,
+                "deprecationReason": None,
+            }
+            for i in range(2 + rng.randrange(6))
+        ]
+        types.append(T)
+
+    # InputObjects reference the next level's InputObjects, the last
+    # level only has Scalars and Enums
+    level_size = max(1, num_inputs // input_object_depth)
+    for i, name in enumerate(inputs):
+        T = type_def("INPUT_OBJECT", name, rng, description_size)
+        level = min(i // level_size, input_object_depth - 1)
+        next_level = []
+        if level < input_object_depth - 1:
+            next_level = inputs[(level + 1) * level_size : (level + 2) * level_size]
+        input_fields = []
+        for j in range(fan_out):
+            if next_level and j < 2:
+                ref = named_ref("INPUT_OBJECT", rng.choice(next_level))
+            elif j % 3 == 0:
+                ref = named_ref("ENUM", rng.choice(enums))
+            else:
+                ref = scalar_ref()
+            input_fields.append(
+                input_value(rng, "input{}".format(j), wrap(rng, ref), description_size)
+            )
+        T["inputFields"] = input_fields
+        types.append(T)
+
+    for name in scalars:
+        types.append(type_def("SCALAR", name, rng, description_size))
+
+    query = type_def("OBJECT", "Query", rng, description_size)
+    query["interfaces"] = []
+    query["fields"] = [
+        field(rng, "get{}".format(obj), named_ref("OBJECT", obj), args(), 0)
+        for obj in objects
+    ] + [
+        field(rng, "find{}".format(union), wrap(rng, named_ref("UNION", union)), [], 0)
+        for union in unions
+    ]
+    mutation = type_def("OBJECT", "Mutation", rng, description_size)
+    mutation["interfaces"] = []
+    mutation["fields"] = [
+        field(
+            rng,
+            "update{}".format(inp),
+            named_ref("OBJECT", rng.choice(objects)),
+            [input_value(rng, "input", wrap(rng, named_ref("INPUT_OBJECT", inp)), 0)],
+            0,
+        )
+        for inp in inputs[:level_size]
+    ]
+    types = [query, mutation] + types
+
+    return {
+        "data": {
+            "__schema": {
+                "queryType": {"name": "Query"},
+                "mutationType": {"name": "Mutation"},
+                "subscriptionType": None,
+                "types": types,
+                "directives": [
+                    {
+                        "name": "include",
+                        "description": description(rng, description_size),
+                        "locations": ["FIELD", "FRAGMENT_SPREAD", "INLINE_FRAGMENT"],
+                        "args": [
+                            input_value(
+                                rng,
+                                "if",
+                                wrap(rng, named_ref("SCALAR", "Boolean")),
+                                0,
+                            )
+                        ],
+                    }
+                ],
+            }
+        }
+    }
+
+
+def named_type(ref: dict) -> dict:
+    while ref["ofType"] is not None:
+        ref = ref["ofType"]
+    return ref
+
+
+def type_ref_sdl(ref: dict) -> str:
+    """Type ref as written in a Query, ie [Foo!]!"""
+    if ref["kind"] == "NON_NULL":
+        return type_ref_sdl(ref["ofType"]) + "!"
+    elif ref["kind"] == "LIST":
+        return "[" + type_ref_sdl(ref["ofType"]) + "]"
+    return ref["name"]
+
+
+def arguments(args: list) -> str:
+    if not args:
+        return ""
+    return "({})".format(
+        ", ".join(
+            "{}: {}".format(
+                arg["name"],
+                SCALAR_LITERALS.get(named_type(arg["type"])["name"], '"x"'),
+            )
+            for arg in args
+        )
+    )
+
+
+def generate_queries(
+    schema: dict,
+    num_queries: int = 100,
+    depth: int = 3,
+    fields_per_selection: int = 4,
+    mutation_ratio: float = 0.1,
+    seed: int = 0,
+) -> typing.List[typing.Tuple[str, str]]:
+    """
+    Generate Query documents against a Schema from generate_schema.
+
+    @param depth: how deeply selections nest
+    @param fields_per_selection: fields selected per Object/Interface
+
+    return: (file name, document text) pairs, Mutations are in a
+    "mutations" sub-directory
+
+    """
+    rng = random.Random(seed)
+    types = {T["name"]: T for T in schema["data"]["__schema"]["types"]}
+    query_fields = types["Query"]["fields"]
+    mutation_fields = types["Mutation"]["fields"]
+
+    def selection(T: dict, level: int, indent: str, alias: str = "") -> str:
+        """
+        Selection set on T. Fields get the alias prefix, so fragments on
+        different Union members can't conflict.
+
+        """
+        lines = ["__typename"]
+        if T["kind"] == "UNION":
+            for member in rng.sample(
+                T["possibleTypes"], min(2, len(T["possibleTypes"]))
+            ):
+                lines.append(
+                    "... on {} {}".format(
+                        member["name"],
+                        selection(
+                            types[member["name"]],
+                            level + 1,
+                            indent + "  ",
+                            alias=member["name"].lower() + "_",
+                        ),
+                    )
+                )
+        else:
+            fields = T["fields"]
+            if level >= depth:
+                fields = [
+                    f
+                    for f in fields
+                    if named_type(f["type"])["kind"] in ("SCALAR", "ENUM")
+                ]
+            for f in rng.sample(fields, min(fields_per_selection, len(fields))):
+                ref = named_type(f["type"])
+                line = f["name"] + arguments(f["args"])
+                if alias:
+                    line = alias + f["name"] + ": " + line
+                if ref["kind"] not in ("SCALAR", "ENUM"):
+                    line += " " + selection(
+                        types[ref["name"]], level + 1, indent + "  "
+                    )
+                lines.append(line)
+            if T["kind"] == "INTERFACE" and T["possibleTypes"]:
+                member = rng.choice(T["possibleTypes"])
+                lines.append(
+                    "... on {} {}".format(
+                        member["name"],
+                        selection(types[member["name"]], level + 1, indent + "  "),
+                    )
+                )
+
+        inner = indent + "  "
+        return "{\n" + "".join(inner + line + "\n" for line in lines) + indent + "}"
+
+    queries = []
+    for i in range(num_queries):
+        if mutation_fields and rng.random() < mutation_ratio:
+            f = rng.choice(mutation_fields)
+            arg = f["args"][0]
+            text = "mutation Mutation{}($input: {}) {{\n  {}(input: $input) {}\n}}\n".format(
+                i,
+                type_ref_sdl(arg["type"]),
+                f["name"],
+                selection(types[named_type(f["type"])["name"]], 1, "  "),
+            )
+            queries.append(
+                (os.path.join("mutations", "mutation{}.graphql".format(i)), text)
+            )
+        else:
+            f = rng.choice(query_fields)
+            text = "query Query{} {{\n  {}{} {}\n}}\n".format(
+                i,
+                f["name"],
+                arguments(f["args"]),
+                selection(types[named_type(f["type"])["name"]], 1, "  "),
+            )
+            queries.append(("query{}.graphql".format(i), text))
+
+    return queries
+
+
+def write_corpus(
+    out_dir: str, schema: dict, queries: typing.List[typing.Tuple[str, str]]
+) -> str:
+    """
+    Write the Schema and its Queries under out_dir.
+
+    return: the path of the Schema file
+
+    """
+    schema_path = os.path.join(out_dir, "graphql_schema.json")
+    os.makedirs(out_dir, exist_ok=True)
+    with open(schema_path, "w") as ofile:
+        json.dump(schema, ofile)
+
+    for name, text in queries:
+        path = os.path.join(out_dir, "queries", name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as ofile:
+            ofile.write(text)
+
+    return schema_path
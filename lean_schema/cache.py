@@ -0,0 +1,478 @@
+"""
+On-disk cache of the Schema Graph that decomp computes.
+
+The Schema changes rarely compared to how often codegen runs, so the
+adjacency list and the set of Scalar Types are stored in a cache
+directory keyed by the SHA-256 of the Schema file contents. A changed
+Schema has a different key, so it can never be served a stale Graph.
+
+Parsed Query documents are cached the same way, keyed by the Query
+file contents, see ParseCache.
+
+"""
+
+__author__ = "prussell"
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import tempfile
+import time
+import typing
+
+import graphql
+from graphql.language import DocumentNode
+
+# Bump whenever the cached record layout or the way Graphs are built
+# changes, so old entries are ignored instead of misread
+CACHE_FORMAT_VERSION = 3
+MANIFEST_FORMAT_VERSION = 2
+CACHE_DIR_ENV_VAR = "LEAN_SCHEMA_CACHE_DIR"
+DEFAULT_CACHE_DIR = os.getenv(
+    CACHE_DIR_ENV_VAR, os.path.join(os.path.expanduser("~"), ".cache", "lean_schema")
+)
+# How many Graphs for older Schemas to keep around
+MAX_GRAPH_ENTRIES = 4
+GRAPH_FILE_PREFIX = "graph-v{}-".format(CACHE_FORMAT_VERSION)
+# Graph entries of any format version
+GRAPH_FILE_RE = re.compile(r"graph-v[0-9]+-[0-9a-f]+\.json$")
+PARSE_CACHE_FORMAT_VERSION = 1
+# Size of the parse cache before the least recently used documents are
+# evicted
+DEFAULT_PARSE_CACHE_MAX_BYTES = 256 << 20
+# Pickled ASTs are only readable by the graphql-core version that wrote them
+AST_DIR_NAME = "ast-v{}-graphql-{}".format(
+    PARSE_CACHE_FORMAT_VERSION, graphql.__version__
+)
+# Files modified this close to a manifest save are re-hashed even if
+# their size and mtime match
+RACY_MTIME_WINDOW_NS = 2000000000
+
+
+def digest_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Digest of a file's contents without reading it all into memory
+
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as ifile:
+        for chunk in iter(lambda: ifile.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def load_schema_with_digest(file_path: str) -> typing.Tuple[dict, str]:
+    """
+    Load a Schema JSON file and compute the digest of its contents
+    from the same read
+
+    """
+    with open(file_path, "rb") as ifile:
+        data = ifile.read()
+
+    return json.loads(data), digest_bytes(data)
+
+
+@contextlib.contextmanager
+def open_atomic(file_path: str, mode: str = "w", suffix: str = ".json"):
+    """
+    Open a temp file in the same directory for writing, and rename it
+    into place once the block completes, so concurrent readers never
+    see a partial file
+
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(file_path)), prefix=".tmp-", suffix=suffix
+    )
+    try:
+        # mkstemp files are only readable by the owner
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        if "b" in mode:
+            ofile = os.fdopen(fd, mode)
+        else:
+            ofile = os.fdopen(fd, mode, encoding="utf-8")
+        with ofile:
+            yield ofile
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_atomic(file_path: str, text: str):
+    with open_atomic(file_path) as ofile:
+        ofile.write(text)
+
+
+class GraphCache(object):
+    """
+    Compact, precomputed form of a Schema Graph. Each entry is a JSON
+    object like:
+
+    {"version": 3,
+     "digest": "<sha256 of the Schema file>",
+     "names": ["Query", "Character", ...],
+     "kinds": ["OBJECT", "INTERFACE", ...],
+     "outbound": [[1, 5], [0, 2], ...],
+     "inbound": [[1], [0], ...],
+     "scalars": ["Boolean", "String", ...]}
+
+    Edges are indexes into "names". Graphs from a streamed Schema also
+    have the byte "spans" of each Type in the Schema file and the
+    "skeleton" of the Schema without its Types.
+
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.cache_dir = os.path.abspath(cache_dir)
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, GRAPH_FILE_PREFIX + digest + ".json")
+
+    def get(self, digest: str) -> typing.Optional[dict]:
+        """
+        Get the cached record for a Schema digest, None on a miss or
+        an unusable entry
+
+        """
+        path = self.path_for(digest)
+        if not os.path.isfile(path):
+            logging.debug("Graph cache miss for {}".format(digest))
+            return None
+
+        try:
+            with open(path, encoding="utf-8") as ifile:
+                record = json.load(ifile)
+        except (OSError, ValueError):
+            logging.warning("Ignoring unreadable Graph cache entry {}".format(path))
+            return None
+
+        if (
+            type(record) is not dict
+            or record.get("version") != CACHE_FORMAT_VERSION
+            or record.get("digest") != digest
+        ):
+            logging.warning("Ignoring invalid Graph cache entry {}".format(path))
+            return None
+
+        logging.debug("Graph cache hit for {}".format(digest))
+        return record
+
+    def put(
+        self,
+        digest: str,
+        graph: dict,
+        scalars: typing.Iterable[str],
+        skeleton: dict = None,
+    ):
+        """
+        Store the Graph and Scalar Types for a Schema digest. Failing
+        to write the cache is never fatal.
+
+        @param skeleton: the Schema without its Types, only for Graphs
+        of LazySchemaNodes
+
+        """
+        names = list(graph)
+        index = {name: i for i, name in enumerate(names)}
+        record = {
+            "version": CACHE_FORMAT_VERSION,
+            "digest": digest,
+            "names": names,
+            "kinds": [graph[name].kind for name in names],
+            "outbound": [[index[K2] for K2 in graph[name].outbound] for name in names],
+            "inbound": [[index[K2] for K2 in graph[name].inbound] for name in names],
+            "scalars": sorted(scalars),
+        }
+        if skeleton is not None:
+            record["skeleton"] = skeleton
+            record["spans"] = [list(graph[name].span) for name in names]
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            write_atomic(
+                self.path_for(digest), json.dumps(record, separators=(",", ":"))
+            )
+            self.prune(keep=digest)
+        except OSError as e:
+            logging.warning("Could not write Graph cache entry: {}".format(e))
+
+    def prune(self, keep: str, max_entries: int = MAX_GRAPH_ENTRIES):
+        """
+        Remove the oldest entries so the cache doesn't grow with every
+        Schema change. Entries of other format versions are never read
+        again, so they are all removed.
+
+        """
+        keep_fname = os.path.basename(self.path_for(keep))
+        entries = []
+        stale = []
+        for fname in os.listdir(self.cache_dir):
+            if not GRAPH_FILE_RE.match(fname) or fname == keep_fname:
+                continue
+            path = os.path.join(self.cache_dir, fname)
+            if fname.startswith(GRAPH_FILE_PREFIX):
+                entries.append(path)
+            else:
+                stale.append(path)
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for path in stale + entries[max_entries - 1 :]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class ParseCache(object):
+    """
+    Pickled DocumentNodes of Query files, one file per document named
+    by the SHA-256 of the Query source. A Schema change doesn't change
+    the key, so re-running against a new Schema skips parsing all
+    unchanged Queries.
+
+    Documents are parsed without locations, which makes them a lot
+    smaller; nothing that visits them needs locations. Reading an
+    entry bumps its mtime, and prune evicts the least recently used
+    entries until the cache fits in max_bytes.
+
+    Entries are unpickled, so the cache directory must only be writable
+    by the user running LeanSchema, like any other cache directory.
+
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        max_bytes: int = DEFAULT_PARSE_CACHE_MAX_BYTES,
+    ):
+        self.cache_dir = os.path.join(os.path.abspath(cache_dir), AST_DIR_NAME)
+        self.max_bytes = max_bytes
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, digest + ".pickle")
+
+    def get(self, digest: str) -> typing.Optional[DocumentNode]:
+        path = self.path_for(digest)
+        try:
+            with open(path, "rb") as ifile:
+                document = pickle.load(ifile)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logging.warning("Ignoring unreadable parse cache entry {}".format(path))
+            return None
+
+        if not isinstance(document, DocumentNode):
+            logging.warning("Ignoring invalid parse cache entry {}".format(path))
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return document
+
+    def put(self, digest: str, document: DocumentNode):
+        """
+        Store a parsed document. Failing to write the cache is never
+        fatal.
+
+        """
+        try:
+            data = pickle.dumps(document, protocol=pickle.HIGHEST_PROTOCOL)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open_atomic(self.path_for(digest), "wb", suffix=".pickle") as ofile:
+                ofile.write(data)
+        except (OSError, pickle.PicklingError, RecursionError) as e:
+            logging.warning("Could not write parse cache entry: {}".format(e))
+
+    def parse(self, source: bytes, digest: str = None) -> DocumentNode:
+        """
+        Get the parsed document of a Query source from the cache, or
+        parse and store it
+
+        @param digest: the digest of source, if already known
+
+        """
+        if digest is None:
+            digest = digest_bytes(source)
+        document = self.get(digest)
+        if document is None:
+            document = graphql.parse(source.decode("utf-8"), no_location=True)
+            self.put(digest, document)
+        return document
+
+    def prune(self, max_bytes: int = None) -> int:
+        """
+        Remove the least recently used documents until the cache is
+        no larger than max_bytes
+
+        return: the number of removed documents
+
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        try:
+            with os.scandir(self.cache_dir) as it:
+                entries = [
+                    (entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+                    for entry in it
+                    if entry.name.endswith(".pickle")
+                    and not entry.name.startswith(".tmp-")
+                ]
+        except OSError:
+            return 0
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+
+        if removed:
+            logging.debug("Evicted {} parse cache entries".format(removed))
+        return removed
+
+
+class QueryManifest(object):
+    """
+    What get_types found in each Query file on the last run, so
+    unchanged files don't have to be parsed and visited again. The
+    manifest file is a JSON object like:
+
+    {"version": 2,
+     "schema_digest": "<sha256 of the Schema file>",
+     "saved_at_ns": 1600000000000000000,
+     "files": {"/abs/path/query.graphql": {"mtime_ns": ...,
+                                           "size": 123,
+                                           "sha256": "...",
+                                           "types": ["Query", ...],
+                                           "fields": {"Query": ["hero"],
+                                                      ...}}}}
+
+    Type names depend on the Schema, so a manifest written for another
+    Schema is discarded as a whole. Files that aren't seen again are
+    dropped from the manifest on save.
+
+    A manifest without a path is only kept in memory, for the next
+    visit by the same process.
+
+    """
+
+    def __init__(self, path: typing.Optional[str], schema_digest: str):
+        self.path = os.path.abspath(path) if path is not None else None
+        self.schema_digest = schema_digest
+        self.saved_at_ns = 0
+        self.previous = {}
+        self.current = {}
+
+    def load(self):
+        if self.path is None or not os.path.isfile(self.path):
+            return self
+
+        try:
+            with open(self.path, encoding="utf-8") as ifile:
+                manifest = json.load(ifile)
+        except (OSError, ValueError):
+            logging.warning("Ignoring unreadable manifest {}".format(self.path))
+            return self
+
+        if (
+            type(manifest) is dict
+            and manifest.get("version") == MANIFEST_FORMAT_VERSION
+            and manifest.get("schema_digest") == self.schema_digest
+        ):
+            self.saved_at_ns = manifest["saved_at_ns"]
+            self.previous = manifest["files"]
+        else:
+            logging.debug("Manifest {} is for another Schema".format(self.path))
+
+        return self
+
+    def get_by_stat(self, file_path: str, stat: os.stat_result) -> dict:
+        """
+        Get the previous entry for a file if its size and mtime haven't
+        changed. Files modified around the time the manifest was saved
+        could have changed within the same mtime tick, so they are
+        never trusted by stat alone.
+
+        """
+        entry = self.previous.get(file_path)
+        if (
+            entry is not None
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+            and stat.st_mtime_ns < self.saved_at_ns - RACY_MTIME_WINDOW_NS
+        ):
+            return entry
+
+        return None
+
+    def get_by_digest(self, file_path: str, digest: str) -> dict:
+        """
+        Get the previous entry for a file if its contents haven't
+        changed, ie it was only touched or copied
+
+        """
+        entry = self.previous.get(file_path)
+        if entry is not None and entry["sha256"] == digest:
+            return entry
+
+        return None
+
+    def update(
+        self,
+        file_path: str,
+        stat: os.stat_result,
+        digest: str,
+        types: typing.Iterable[str],
+        fields: typing.Dict[str, typing.List[str]],
+    ):
+        self.current[file_path] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": digest,
+            "types": sorted(types),
+            "fields": fields,
+        }
+
+    def keep(self, file_path: str, entry: dict):
+        self.current[file_path] = entry
+
+    def save(self):
+        saved_at_ns = time.time_ns()
+        if self.path is None:
+            self.saved_at_ns = saved_at_ns
+            self.previous, self.current = self.current, {}
+            return
+
+        manifest = {
+            "version": MANIFEST_FORMAT_VERSION,
+            "schema_digest": self.schema_digest,
+            "saved_at_ns": saved_at_ns,
+            "files": self.current,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            write_atomic(self.path, json.dumps(manifest, separators=(",", ":")))
+        except OSError as e:
+            logging.warning("Could not write manifest {}: {}".format(self.path, e))
@@ -0,0 +1,513 @@
+"""
+Long running LeanSchema process for iterating on Queries.
+
+Every `make codegen` pays for starting Python, importing graphql,
+building the GraphQLSchema and the Schema Graph before it gets to the
+Queries. `serve` does all that once and keeps it in memory, along with
+the Types and fields found in each Query file. It polls the Schema
+file, the Types file and the Query files, and rewrites the Lean Schema
+whenever what it depends on changes:
+
+    python3 -m lean_schema.daemon serve graphql_schema.json queries/ --output lean_schema.json
+
+Only new or changed Query files are visited again, and a changed Schema
+file is loaded again. The output is the same as pipeline writes for
+the same inputs.
+
+`wait` blocks until the Lean Schema reflects the inputs as they were
+when it was called, ie before running Codegen:
+
+    python3 -m lean_schema.daemon wait && apollo client:codegen ...
+
+It exits with status 1 if the Lean Schema couldn't be built, ie a
+Query doesn't parse. `stop` shuts the daemon down.
+
+"""
+
+__author__ = "prussell"
+
+import argparse
+import enum
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import typing
+
+import graphql
+
+from lean_schema import decomp, get_types
+from lean_schema.cache import (
+    GraphCache,
+    ParseCache,
+    QueryManifest,
+    load_schema_with_digest,
+)
+from lean_schema.output import add_output_arguments, write_schema_file
+from lean_schema.project_logging import logger
+
+DEFAULT_SOCKET_PATH = ".lean_schema.sock"
+DEFAULT_OUTPUT_PATH = "lean_schema.json"
+DEFAULT_POLL_INTERVAL_S = 0.5
+DEFAULT_WAIT_TIMEOUT_S = 300.0
+
+
+class ExitErrorCodes(enum.Enum):
+    """
+    Exit codes for the daemon.py program
+
+    """
+
+    OK = 0
+    BUILD_FAILED = 1
+    NOT_RUNNING = 2
+    TIMEOUT = 3
+    ALREADY_RUNNING = 4
+
+
+def file_stamp(file_path: str) -> typing.Optional[tuple]:
+    """
+    What changes when a file is modified or replaced, None if it
+    doesn't exist
+
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class LeanSchemaDaemon(object):
+    """
+    Keeps the Lean Schema at output_path up to date with the Schema
+    file, the Types file and the Queries under input_path. See
+    pipeline.run for the other parameters.
+
+    """
+
+    def __init__(
+        self,
+        schema_path: str,
+        input_path: str,
+        output_path: str = DEFAULT_OUTPUT_PATH,
+        types_file_path: str = None,
+        input_object_depth_level: int = 0,
+        target_language: str = decomp.SwiftLanguage.KEY,
+        graph_cache: GraphCache = None,
+        strip: str = "none",
+        prune_fields: bool = False,
+        compact: bool = False,
+        json_backend: str = "auto",
+        jobs: int = 1,
+        parse_cache: ParseCache = None,
+        state_path: str = None,
+    ):
+        self.schema_path = os.path.abspath(schema_path)
+        self.input_path = os.path.abspath(input_path)
+        self.output_path = os.path.abspath(output_path)
+        self.types_file_path = types_file_path
+        self.input_object_depth_level = input_object_depth_level
+        self.target_language = target_language
+        self.graph_cache = graph_cache
+        self.strip = strip
+        self.prune_fields = prune_fields
+        self.compact = compact
+        self.json_backend = json_backend
+        self.jobs = jobs
+        self.parse_cache = parse_cache
+        self.state_path = state_path
+
+        # The Schema as loaded, it's never modified
+        self.schema = None
+        self.client_schema = None
+        self.graph = None
+        self.scalar_types = None
+        self.possible_types = None
+        self.schema_stamp = None
+        self.types_file = {}
+        self.types_file_stamp = None
+        # Types and fields of each Query file, for the loaded Schema
+        self.manifest = None
+        # The sub-graph and serialized Types of the output, see
+        # decomp.DecompState
+        self.state = None
+        # What the output was last written for
+        self.inputs = None
+
+        self.condition = threading.Condition()
+        self.generation = 0
+        self.refreshing = False
+        self.wake = False
+        self.stopped = False
+        self.error = None
+
+    def load_schema(self):
+        schema, schema_digest = load_schema_with_digest(self.schema_path)
+        schema = schema["data"] if "data" in schema else schema
+        self.client_schema = graphql.build_client_schema(schema)
+        self.graph, self.scalar_types = decomp.build_graph(
+            schema, self.graph_cache, schema_digest
+        )
+        self.possible_types = get_types.get_possible_types_index(self.client_schema)
+        self.schema = schema
+        # Type names depend on the Schema, so all Queries are visited again
+        self.manifest = QueryManifest(None, schema_digest)
+        self.state = decomp.DecompState(
+            self.state_path,
+            target_language=self.target_language,
+            strip=self.strip,
+            prune_fields=self.prune_fields,
+            compact=self.compact,
+            json_backend=self.json_backend,
+        ).load(schema_digest)
+        logger.info(
+            "Loaded %s Types from %s",
+            len(self.graph),
+            os.path.basename(self.schema_path),
+        )
+
+    def decompose(self, type_names: set, fields: dict) -> dict:
+        """
+        Decompose a copy of the loaded Schema. decompose modifies the
+        Schema, the Graph and the Types in the sub-graph in place.
+
+        """
+        schema = dict(self.schema)
+        schema["__schema"] = dict(schema["__schema"])
+        schema["__schema"]["directives"] = decomp.copy_json(
+            schema["__schema"].get("directives")
+        )
+        return decomp.decompose(
+            schema,
+            types_file=self.types_file,
+            input_types=type_names,
+            input_object_depth_level=self.input_object_depth_level,
+            target_language=self.target_language,
+            graph=decomp.copy_graph(self.graph),
+            scalar_types=self.scalar_types,
+            strip=self.strip,
+            selected_fields=fields,
+            prune=self.prune_fields,
+            possible_types=self.possible_types,
+            state=self.state,
+        )
+
+    def refresh(self) -> bool:
+        """
+        Bring the output up to date with the inputs
+
+        return: whether the output was written
+
+        """
+        # Stamps are taken before reading, so a change while reading
+        # is picked up by the next refresh
+        schema_stamp = file_stamp(self.schema_path)
+        if schema_stamp != self.schema_stamp:
+            self.load_schema()
+            self.schema_stamp = schema_stamp
+
+        types_file_stamp = (
+            file_stamp(self.types_file_path) if self.types_file_path else None
+        )
+        if types_file_stamp != self.types_file_stamp:
+            self.types_file = decomp.load_types_file(self.types_file_path)
+            self.types_file_stamp = types_file_stamp
+
+        fields = {}
+        # Drop what a failed refresh left behind
+        self.manifest.current = {}
+        type_names = get_types.visit_document_files_incremental(
+            get_types.find_document_files(self.input_path),
+            self.client_schema,
+            self.manifest,
+            self.jobs,
+            self.schema_path,
+            fields,
+            self.parse_cache,
+        )
+        inputs = (
+            schema_stamp,
+            types_file_stamp,
+            frozenset(type_names),
+            get_types.sorted_fields(fields),
+        )
+        if inputs == self.inputs and os.path.exists(self.output_path):
+            return False
+
+        start = time.perf_counter()
+        schema = self.decompose(type_names, fields)
+        write_schema_file(
+            self.output_path,
+            schema,
+            compact=self.compact,
+            backend=self.json_backend,
+        )
+        self.inputs = inputs
+        self.state.save()
+        if self.parse_cache is not None:
+            self.parse_cache.prune()
+        logger.info(
+            "Wrote %s Types to %s in %.2fs",
+            len(schema["__schema"]["types"]),
+            self.output_path,
+            time.perf_counter() - start,
+        )
+        return True
+
+    def run(self, interval: float = DEFAULT_POLL_INTERVAL_S):
+        """
+        Refresh every interval seconds, or as soon as a client waits,
+        until stopped
+
+        """
+        while True:
+            with self.condition:
+                if self.stopped:
+                    return
+                self.refreshing = True
+
+            try:
+                self.refresh()
+                error = None
+            except Exception as e:
+                error = "{}: {}".format(type(e).__name__, e)
+                if error != self.error:
+                    logger.error("Could not build the Lean Schema: %s", error)
+                    logger.debug("Refresh failed", exc_info=True)
+
+            with self.condition:
+                self.refreshing = False
+                self.generation += 1
+                self.error = error
+                self.condition.notify_all()
+                self.condition.wait_for(lambda: self.wake or self.stopped, interval)
+                self.wake = False
+
+    def wait_fresh(self, timeout: float = None) -> dict:
+        """
+        Wait until a refresh that started after this call is done
+
+        return: the response to the client
+
+        """
+        with self.condition:
+            # A refresh in progress may have already looked at the inputs
+            target = self.generation + (2 if self.refreshing else 1)
+            self.wake = True
+            self.condition.notify_all()
+            done = self.condition.wait_for(
+                lambda: self.generation >= target or self.stopped, timeout
+            )
+            if not done:
+                return {"ok": False, "error": "Timed out", "timeout": True}
+            if self.generation < target:
+                return {"ok": False, "error": "The daemon was stopped"}
+            return {
+                "ok": self.error is None,
+                "error": self.error,
+                "output": self.output_path,
+            }
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one command per connection: a line of "wait [TIMEOUT]" or
+    "stop", answered with a line of JSON
+
+    """
+
+    def handle(self):
+        daemon = self.server.lean_schema_daemon
+        words = self.rfile.readline().decode("utf-8").split()
+        command = words[0] if words else ""
+        if command == "wait":
+            timeout = float(words[1]) if len(words) > 1 else None
+            response = daemon.wait_fresh(timeout)
+        elif command == "stop":
+            daemon.stop()
+            response = {"ok": True}
+        else:
+            response = {"ok": False, "error": "Unknown command {}".format(command)}
+
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def is_listening(socket_path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+    return True
+
+
+def request(socket_path: str, command: str, timeout: float = None) -> dict:
+    """
+    Send a command to the daemon listening on socket_path
+
+    raise: OSError if no daemon is listening
+
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(command.encode("utf-8") + b"\n")
+        with sock.makefile("rb") as ifile:
+            return json.loads(ifile.readline().decode("utf-8"))
+
+
+def serve(
+    daemon: LeanSchemaDaemon,
+    socket_path: str = DEFAULT_SOCKET_PATH,
+    interval: float = DEFAULT_POLL_INTERVAL_S,
+):
+    """
+    Listen for clients on socket_path and keep the output up to date
+    until stopped
+
+    """
+    if os.path.exists(socket_path):
+        if is_listening(socket_path):
+            raise FileExistsError(
+                "A daemon is already listening on {}".format(socket_path)
+            )
+        # Left behind by a daemon that didn't shut down cleanly
+        os.remove(socket_path)
+
+    server = Server(socket_path, RequestHandler)
+    server.lean_schema_daemon = daemon
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    logger.info("Listening on %s", socket_path)
+    try:
+        daemon.run(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        os.remove(socket_path)
+
+
+def add_socket_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--socket",
+        help="Path of the UNIX socket the daemon listens on",
+        default=DEFAULT_SOCKET_PATH,
+    )
+
+
+def main_serve(args) -> int:
+    get_types.check_input_paths(args.SCHEMA_FILE, args.INPUT_TLD)
+    decomp.setup_logging(args.log_level, args.log_file)
+    logger.setLevel(args.log_level)
+    daemon = LeanSchemaDaemon(
+        args.SCHEMA_FILE,
+        args.INPUT_TLD,
+        output_path=args.output or DEFAULT_OUTPUT_PATH,
+        types_file_path=args.types_file,
+        input_object_depth_level=args.input_object_depth_level,
+        target_language=args.target_language,
+        graph_cache=decomp.graph_cache_from_args(args),
+        strip=args.strip,
+        prune_fields=args.prune_fields,
+        compact=args.compact,
+        json_backend=args.json_backend,
+        jobs=args.jobs,
+        parse_cache=get_types.parse_cache_from_args(args),
+        state_path=args.incremental_state,
+    )
+    try:
+        serve(daemon, args.socket, args.interval)
+    except FileExistsError as e:
+        print(e, file=sys.stderr)
+        return ExitErrorCodes.ALREADY_RUNNING.value
+
+    return ExitErrorCodes.OK.value
+
+
+def main_client(args) -> int:
+    if args.command == "wait":
+        command = "wait {}".format(args.timeout)
+    else:
+        command = args.command
+
+    try:
+        response = request(args.socket, command)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(
+            "No LeanSchema daemon is listening on {}".format(args.socket),
+            file=sys.stderr,
+        )
+        return ExitErrorCodes.NOT_RUNNING.value
+
+    if response.get("timeout"):
+        print("Timed out waiting for the Lean Schema", file=sys.stderr)
+        return ExitErrorCodes.TIMEOUT.value
+    if not response["ok"]:
+        print(response["error"], file=sys.stderr)
+        return ExitErrorCodes.BUILD_FAILED.value
+
+    return ExitErrorCodes.OK.value
+
+
+def main(args: typing.List[str]) -> int:
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    serve_parser = commands.add_parser(
+        "serve", help="Keep the Lean Schema up to date as the inputs change"
+    )
+    serve_parser.add_argument("SCHEMA_FILE", help="Path to the Intuit Schema JSON file")
+    serve_parser.add_argument(
+        "INPUT_TLD", help="Top-level-directory of the set of Queries to process"
+    )
+    decomp.add_decomp_arguments(serve_parser)
+    get_types.add_visit_arguments(serve_parser, manifest=False)
+    add_output_arguments(serve_parser)
+    add_socket_argument(serve_parser)
+    serve_parser.add_argument(
+        "--interval",
+        help="Seconds between checks of the inputs for changes",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL_S,
+    )
+
+    wait_parser = commands.add_parser(
+        "wait", help="Wait until the Lean Schema reflects the current inputs"
+    )
+    add_socket_argument(wait_parser)
+    wait_parser.add_argument(
+        "--timeout",
+        help="Seconds to wait at most",
+        type=float,
+        default=DEFAULT_WAIT_TIMEOUT_S,
+    )
+
+    stop_parser = commands.add_parser("stop", help="Stop the daemon")
+    add_socket_argument(stop_parser)
+
+    args = parser.parse_args(args)
+    if args.command == "serve":
+        return main_serve(args)
+    return main_client(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
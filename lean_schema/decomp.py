@@ -2,12 +2,14 @@
 Create some subset of a GraphQL Schema given some input parameters
 
 """
+
 __author__ = "prussell"
 
 import argparse
 import json
 import logging
 import os
+import pickle
 import queue
 import select
 import sys
@@ -16,6 +18,28 @@ import typing
 import uuid
 import yaml
 
+from lean_schema.cache import (
+    DEFAULT_CACHE_DIR,
+    GraphCache,
+    file_digest,
+    load_schema_with_digest,
+    open_atomic,
+)
+from lean_schema.graph import CompactGraph
+from lean_schema.output import (
+    RawJSON,
+    add_output_arguments,
+    get_dumps,
+    write_output_from_args,
+)
+from lean_schema.stats import (
+    Stats,
+    add_stats_arguments,
+    report_from_args,
+    stats_from_args,
+)
+from lean_schema.streaming import Span, load_span, scan_schema
+
 LOG_LEVELS = {
     "DEBUG": logging.DEBUG,
     "INFO": logging.INFO,
@@ -27,22 +51,119 @@ DEFAULT_LOG_FILE = "log.decomp"
 
 
 class SchemaNode(object):
+
+    __slots__ = ("key", "value", "inbound", "outbound", "refs")
+
     def __init__(self, key, value):
         self.key = key
         self.value = value
         self.inbound = []
         self.outbound = []
+        # The named Type reference objects in value, see iter_type_refs
+        self.refs = None
+
+    @property
+    def kind(self):
+        return self.value["kind"]
 
     def __repr__(self):
         return "SchemaNode -> {}".format(self.key)
 
 
+class LazySchemaNode(SchemaNode):
+    """
+    SchemaNode for a Type that was streamed from the Schema file. The
+    Type is only decoded again, from its span in the file, when its
+    value is needed ie when it's part of the sub-graph.
+
+    """
+
+    __slots__ = ("_kind", "_value", "file_path", "span")
+
+    def __init__(self, key, kind: str, file_path: str, span: Span):
+        super().__init__(key, None)
+        self._kind = kind
+        self.file_path = file_path
+        self.span = span
+
+    @property
+    def kind(self):
+        return self._kind
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = load_span(self.file_path, self.span)
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+
+
+def copy_json(value):
+    """
+    Deep copy of a JSON value, a lot faster than copy.deepcopy
+
+    """
+    if type(value) is dict:
+        return {key: copy_json(item) for key, item in value.items()}
+    if type(value) is list:
+        return [copy_json(item) for item in value]
+    return value
+
+
+class CopiedSchemaNode(SchemaNode):
+    """
+    SchemaNode over a Type that has to stay unchanged, ie because it's
+    decomposed again and again by a long running process. The Type is
+    only copied when its value is needed, so decompose modifies the
+    copy and only the Types in the sub-graph are ever copied.
+
+    """
+
+    __slots__ = ("_kind", "_value", "source")
+
+    def __init__(self, node: SchemaNode):
+        super().__init__(node.key, None)
+        self._kind = node.kind
+        self.source = node.value
+        # decompose never modifies the edges
+        self.inbound = node.inbound
+        self.outbound = node.outbound
+
+    @property
+    def kind(self):
+        return self._kind
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = copy_json(self.source)
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+
+
+def copy_graph(graph: dict) -> dict:
+    """
+    Copy of an Adjacency List that decompose can modify, see
+    CopiedSchemaNode
+
+    """
+    return {key: CopiedSchemaNode(node) for key, node in graph.items()}
+
+
 """
 User defined GraphQL Types. In GraphQL, Object is NOT the root of
 the Type heiarchy, it's just one of these
 
 """
 GRAPHQL_DEFINED_TYPES = {"enum", "input_object", "interface", "object", "union"}
+# Same as they appear in the Introspection format
+GRAPHQL_DEFINED_KINDS = {kind.upper() for kind in GRAPHQL_DEFINED_TYPES}
 
 
 class SwiftLanguage(object):
@@ -83,13 +204,13 @@ class GraphQLTypeRef(object):
     Proxy Type Reference for a a GraphQL Type.
 
     Possible fields for a Type seem to be:
-    ['kind', 
-    'name', 
-    'description', 
-    'fields', 
-    'inputFields', 
-    'interfaces', 
-    'enumValues', 
+    ['kind',
+    'name',
+    'description',
+    'fields',
+    'inputFields',
+    'interfaces',
+    'enumValues',
     'possibleTypes']
 
     """
@@ -182,11 +303,52 @@ def is_scalar_ref(node: dict) -> bool:
     return "kind" in node and node["kind"].lower() == "scalar"
 
 
+def unwrap_type_ref(ref: dict) -> dict:
+    """
+    Get the named Type reference inside List/NonNull wrappers, ie
+    [Character!]! -> Character
+
+    """
+    while ref.get("ofType") is not None:
+        ref = ref["ofType"]
+    return ref
+
+
+def iter_type_refs(root: dict) -> typing.Iterator[dict]:
+    """
+    Yield the named Type reference objects of a GraphQL Schema Type.
+
+    Only the parts of the Introspection format that can reference
+    other Types are visited:
+    - fields[].type
+    - fields[].args[].type
+    - inputFields[].type
+    - interfaces[]
+    - possibleTypes[]
+
+    Descriptions, default values, enum values etc. are skipped.
+
+    """
+    for field in root.get("fields") or ():
+        yield unwrap_type_ref(field["type"])
+        for arg in field.get("args") or ():
+            yield unwrap_type_ref(arg["type"])
+
+    for input_field in root.get("inputFields") or ():
+        yield unwrap_type_ref(input_field["type"])
+
+    for ref in root.get("interfaces") or ():
+        yield unwrap_type_ref(ref)
+
+    for ref in root.get("possibleTypes") or ():
+        yield unwrap_type_ref(ref)
+
+
 def get_outbound_type_refs(
     root: dict, res: typing.List[str] = None
 ) -> typing.List[str]:
     """
-    Get all outbound vertex keys for some GraphQL Schema Node.
+    Get all outbound vertex keys for some GraphQL Schema Type.
     Basically an adjacent node reference is defined as:
     A sub-JSON Object with obj['type']['kind'] == OBJECT
     Then the key is obj['type']['name']
@@ -198,69 +360,296 @@ def get_outbound_type_refs(
     if res is None:
         res = []
 
-    stack = [root]
-    while stack:
-        node = stack.pop()
-        if type(node) is list:
-            stack.extend(node)
-        elif type(node) is dict:
-            if is_graphql_type_ref(node):
-                res.append(node["name"])
-            stack.extend(node.items())
-        elif type(node) is tuple:
-            stack.append(node[0])
-            stack.append(node[1])
+    for ref in iter_type_refs(root):
+        if ref["kind"] in GRAPHQL_DEFINED_KINDS:
+            res.append(ref["name"])
 
     return res
 
 
-def update_type_refs(root, graph, subgraph_keys, scalars_dict: dict = None):
+def scan_type_refs(
+    root: dict, scalars: set
+) -> typing.Tuple[typing.List[dict], typing.List[str]]:
+    """
+    Single pass over the references of a GraphQL Schema Type. Adds
+    the Scalar Types it defines or references to scalars.
+
+    return: the named Type reference objects, and the de-duplicated
+    keys of the Types they reference
+
+    """
+    refs = list(iter_type_refs(root))
+    outbound = {}
+    for ref in refs:
+        kind = ref["kind"]
+        if kind in GRAPHQL_DEFINED_KINDS:
+            outbound[ref["name"]] = None
+        elif kind == "SCALAR":
+            scalars.add(ref["name"])
+
+    if root.get("kind") == "SCALAR":
+        scalars.add(root["name"])
+
+    return refs, list(outbound)
+
+
+def update_type_refs(
+    root, graph, subgraph_keys, scalars_dict: dict = None, refs: list = None
+):
     """
     Update all outbound refs of a GraphQL schema node to only
     reference things that are in the sub-graph
 
+    @param refs: the reference objects of root if they are already
+    known, see SchemaNode.refs
+
     """
     if scalars_dict is None:
         scalars_dict = {}
 
+    for node in iter_type_refs(root) if refs is None else refs:
+        node_kind = node["kind"]
+        # Is this an Object reference ie another non-Scalar type?
+        if node_kind in GRAPHQL_DEFINED_KINDS:
+            # Check name of object and if its allowed inthe subgraph
+            node_key = node["name"]
+            if node_key not in subgraph_keys:
+                type_ref = get_typeref_for(node_kind)
+                logging.debug(
+                    "Replacing {} with {}, is not in subgraph".format(
+                        node_key, type_ref.get_name()
+                    )
+                )
+                node["name"] = type_ref.get_name()
+                node["typeref_name"] = node_key
+
+        # Update Scalar Types if we need to
+        elif node_kind == "SCALAR":
+            scalar_key = node["name"]
+            if scalar_key in scalars_dict:
+                # Replace with the value
+                node["name"] = scalars_dict[scalar_key]
+
+
+# Cumulative --strip levels, each also strips what the previous ones do
+STRIP_LEVELS = ("none", "descriptions", "deprecated", "unused-fields")
+
+
+def json_size(value) -> int:
+    return len(json.dumps(value))
+
+
+def strip_descriptions(root: dict) -> int:
+    """
+    Null out the description of a Type or Directive and of all its
+    fields, arguments and enum values
+
+    return: about how many bytes of JSON output this saves
+
+    """
+    saved = 0
     stack = [root]
     while stack:
-        node = stack.pop()
-        if type(node) is list:
-            stack.extend(node)
-        elif type(node) is dict:
-            # Is this an Object reference ie another non-Scalar type?
-            if is_graphql_type_ref(node):
-                # Check name of object and if its allowed inthe subgraph
-                node_key = node["name"]
-                node_kind = node["kind"]
-                if node_key not in subgraph_keys:
-                    type_ref = get_typeref_for(node_kind)
-                    logging.debug(
-                        "Replacing {} with {}, is not in subgraph".format(
-                            node_key, type_ref.get_name()
-                        )
-                    )
-                    node["name"] = type_ref.get_name()
-                    node["typeref_name"] = node_key
+        obj = stack.pop()
+        if obj.get("description") is not None:
+            saved += json_size(obj["description"]) - len("null")
+            obj["description"] = None
+        for key in ("fields", "args", "inputFields", "enumValues"):
+            stack.extend(obj.get(key) or ())
 
-            # Update Scalar Types if we need to
-            elif is_scalar_ref(node):
-                scalar_key = node["name"]
-                if scalar_key in scalars_dict:
-                    # Replace with the value
-                    scalar_value = scalars_dict[scalar_key]
-                    node["name"] = scalar_value
+    return saved
 
-            for key in node:
-                value = node[key]
-                stack.append(value)
 
+def drop_items(items: list, drop: typing.Callable[[dict], bool]) -> int:
+    """
+    Remove the items of a list that drop() is True for, unless that
+    would leave the list empty, which isn't a valid Type
+
+    return: about how many bytes of JSON output this saves
 
-def mk_graph_from_schema(graphql_schema: dict) -> dict:
     """
-    Make a simple Adjacency List representation of the Schema Types
-    from a GraphQL Schema formatted Object.
+    kept = [item for item in items if not drop(item)]
+    if not kept or len(kept) == len(items):
+        return 0
+
+    saved = sum(json_size(item) + len(", ") for item in items if drop(item))
+    items[:] = kept
+    return saved
+
+
+def is_replaced_ref(ref: dict, subgraph_keys: set) -> bool:
+    """
+    Is a Type reference replaced by a GraphQLTypeRef, or will it be
+    once update_type_refs runs on its Type
+
+    """
+    ref = unwrap_type_ref(ref)
+    return "typeref_name" in ref or (
+        ref["kind"] in GRAPHQL_DEFINED_KINDS and ref["name"] not in subgraph_keys
+    )
+
+
+def strip_type(
+    root: dict,
+    level: str,
+    graph: dict,
+    subgraph_keys: set,
+    kept_fields: typing.Dict[str, typing.Set[str]] = None,
+) -> int:
+    """
+    Remove what codegen doesn't need from a Type of the sub-graph, up
+    to a --strip level:
+    - descriptions: all descriptions
+    - deprecated: deprecated fields and enum values
+    - unused-fields: fields and optional arguments and input fields
+      whose Type is outside the sub-graph. No Query can select them,
+      or their Type would be in the sub-graph. Fields that an
+      Interface of the Type declares with a Type in the sub-graph are
+      kept.
+
+    @param kept_fields: the names of the fields the Queries select per
+    Type, and of the enum values they use, these are never removed
+
+    return: about how many bytes of JSON output this saves
+
+    """
+    if kept_fields is None:
+        kept_fields = {}
+    rank = STRIP_LEVELS.index(level)
+    strip_deprecated = rank >= STRIP_LEVELS.index("deprecated")
+    strip_unused = rank >= STRIP_LEVELS.index("unused-fields")
+    saved = 0
+    if rank >= STRIP_LEVELS.index("descriptions"):
+        saved += strip_descriptions(root)
+
+    keep = kept_fields.get(root["name"], frozenset())
+
+    def unused_field(field, keep):
+        if field["name"] in keep:
+            return False
+        return (strip_deprecated and field.get("isDeprecated")) or (
+            strip_unused and is_replaced_ref(field["type"], subgraph_keys)
+        )
+
+    def unused_input(arg):
+        return (
+            strip_unused
+            and arg["type"]["kind"] != "NON_NULL"
+            and is_replaced_ref(arg["type"], subgraph_keys)
+        )
+
+    # Implementations must keep every field their Interfaces keep
+    interface_fields = set()
+    for ref in root.get("interfaces") or ():
+        interface_key = unwrap_type_ref(ref)["name"]
+        interface = graph.get(interface_key)
+        if interface is not None:
+            interface_keep = kept_fields.get(interface_key, frozenset())
+            for field in interface.value.get("fields") or ():
+                if not unused_field(field, interface_keep):
+                    interface_fields.add(field["name"])
+
+    if root.get("fields"):
+        saved += drop_items(
+            root["fields"],
+            lambda field: field["name"] not in interface_fields
+            and unused_field(field, keep),
+        )
+        for field in root["fields"]:
+            if field.get("args"):
+                saved += drop_items(field["args"], unused_input)
+    if root.get("inputFields"):
+        saved += drop_items(root["inputFields"], unused_input)
+    if strip_deprecated and root.get("enumValues"):
+        saved += drop_items(
+            root["enumValues"],
+            lambda value: value["isDeprecated"] and value["name"] not in keep,
+        )
+
+    return saved
+
+
+def index_possible_types(graph: dict) -> typing.Dict[str, typing.FrozenSet[str]]:
+    """
+    Map each Interface and Union of the Schema Graph to the names of
+    its possible Types.
+
+    get_types.get_possible_types_index builds the same index from a
+    GraphQLSchema.
+
+    """
+    return {
+        key: frozenset(
+            unwrap_type_ref(ref)["name"]
+            for ref in node.value.get("possibleTypes") or ()
+        )
+        for key, node in graph.items()
+        if node.kind in ("INTERFACE", "UNION")
+    }
+
+
+def get_kept_fields(
+    graph: dict,
+    selected_fields: dict,
+    prune_keys: typing.Iterable[str],
+    possible_types: typing.Dict[str, typing.FrozenSet[str]] = None,
+) -> typing.Dict[str, typing.Set[str]]:
+    """
+    The fields to keep of each Type in prune_keys when pruning fields:
+    the fields the Queries select, and all fields of the Interfaces it
+    implements, as an implementation must have every field of its
+    Interfaces. Interfaces that aren't pruned keep all their fields.
+
+    @param possible_types: the index of the possible Types of each
+    abstract Type, see index_possible_types
+
+    """
+    if possible_types is None:
+        possible_types = index_possible_types(graph)
+    prune_keys = set(prune_keys)
+    kept = {key: set(selected_fields.get(key, ())) for key in prune_keys}
+    for interface_key, implementations in possible_types.items():
+        if interface_key not in graph or graph[interface_key].kind != "INTERFACE":
+            continue
+        implementations = prune_keys.intersection(implementations)
+        if not implementations:
+            continue
+
+        if interface_key in prune_keys:
+            fields = selected_fields.get(interface_key, ())
+        else:
+            fields = [
+                field["name"]
+                for field in graph[interface_key].value.get("fields") or ()
+            ]
+        for key in implementations:
+            kept[key].update(fields)
+
+    return kept
+
+
+def prune_fields(root: dict, keep: typing.Set[str]) -> int:
+    """
+    Remove the fields of a Type that aren't in keep. A Type without
+    fields isn't valid, so if none are kept the first one stays.
+
+    return: the number of removed fields
+
+    """
+    fields = root.get("fields")
+    if not fields:
+        return 0
+
+    kept = [field for field in fields if field["name"] in keep] or fields[:1]
+    pruned = len(fields) - len(kept)
+    fields[:] = kept
+    return pruned
+
+
+def get_schema_root(graphql_schema: dict) -> dict:
+    """
+    Get the object with the 'types' of a GraphQL Schema formatted
+    Object.
 
     A GraphQL Schema is basically just something that looks like this:
     {"errors" : [],
@@ -272,33 +661,172 @@ def mk_graph_from_schema(graphql_schema: dict) -> dict:
     """
     # We don't care about anything other than types
     if "data" in graphql_schema:
-        types = graphql_schema["data"]["__schema"]["types"]
+        return graphql_schema["data"]["__schema"]
     elif "__schema" in graphql_schema:
-        types = graphql_schema["__schema"]["types"]
+        return graphql_schema["__schema"]
     elif "types" in graphql_schema:
-        types = graphql_schema["types"]
+        return graphql_schema
     else:
         raise ValueError("Invalid GraphQL Schema, must have a 'types' section")
-    adj = {}
 
-    for T in types:
-        K = T["name"]
-        V = T
-        node = SchemaNode(K, V)
-        node.outbound = get_outbound_type_refs(T)
-        adj[K] = node
 
+def get_schema_types(graphql_schema: dict) -> list:
+    """
+    Get the list of Types from a GraphQL Schema formatted Object, see
+    get_schema_root
+
+    """
+    return get_schema_root(graphql_schema)["types"]
+
+
+def link_inbound(adj: dict):
     for K in adj:
         node = adj[K]
         for K2 in node.outbound:
             node2 = adj[K2]
             node2.inbound.append(K)
 
+
+def index_schema(graphql_schema: dict) -> typing.Tuple[dict, set]:
+    """
+    Make a simple Adjacency List representation of the Schema Types
+    and collect all Scalar Types, in a single pass over the Schema.
+
+    Each SchemaNode also keeps the reference objects in its Type, so
+    update_type_refs can patch them without walking the Type again.
+
+    """
+    scalars = set()
+    adj = {}
+
+    for T in get_schema_types(graphql_schema):
+        K = T["name"]
+        node = SchemaNode(K, T)
+        node.refs, node.outbound = scan_type_refs(T, scalars)
+        adj[K] = node
+
+    scalars.update(directive_scalar_types(get_schema_root(graphql_schema)))
+    link_inbound(adj)
+    return adj, scalars
+
+
+def mk_graph_from_schema(graphql_schema: dict) -> dict:
+    """
+    Make a simple Adjacency List representation of the Schema Types
+    from a GraphQL Schema formatted Object, see index_schema
+
+    """
+    return index_schema(graphql_schema)[0]
+
+
+def mk_graph_from_record(graphql_schema: dict, record: dict) -> dict:
+    """
+    Make the Adjacency List from a GraphCache record instead of
+    walking every Type. The values still come from the loaded Schema.
+
+    return: the Adjacency List or None if the record doesn't match the
+    Schema
+
+    """
+    types = {T["name"]: T for T in get_schema_types(graphql_schema)}
+    names = record["names"]
+    if len(types) != len(names) or any(name not in types for name in names):
+        logging.warning("Graph cache record does not match the Schema, ignoring it")
+        return None
+
+    adj = {}
+    for i, K in enumerate(names):
+        node = SchemaNode(K, types[K])
+        node.outbound = [names[j] for j in record["outbound"][i]]
+        node.inbound = [names[j] for j in record["inbound"][i]]
+        adj[K] = node
+
+    return adj
+
+
+def mk_lazy_graph_from_record(file_path: str, record: dict) -> dict:
+    """
+    Make the Adjacency List of LazySchemaNodes from a GraphCache
+    record that has the spans of each Type in the Schema file
+
+    """
+    names = record["names"]
+    adj = {}
+    for i, K in enumerate(names):
+        node = LazySchemaNode(
+            K, record["kinds"][i], file_path, Span(*record["spans"][i])
+        )
+        node.outbound = [names[j] for j in record["outbound"][i]]
+        node.inbound = [names[j] for j in record["inbound"][i]]
+        adj[K] = node
+
     return adj
 
 
+def load_schema_streaming(
+    file_path: str, graph_cache: GraphCache = None, schema_digest: str = None
+) -> typing.Tuple[dict, dict, set]:
+    """
+    Stream the Schema file one Type at a time, so only the Graph and
+    the Types that end up in the sub-graph are held in memory.
+
+    @param schema_digest: the digest of the Schema file, if already known
+
+    return: the Schema without its Types, the Adjacency List of
+    LazySchemaNodes and all Scalar Types
+
+    """
+    if graph_cache is not None:
+        if schema_digest is None:
+            schema_digest = file_digest(file_path)
+        record = graph_cache.get(schema_digest)
+        if record is not None and "spans" in record:
+            graph = mk_lazy_graph_from_record(file_path, record)
+            return record["skeleton"], graph, set(record["scalars"])
+
+    adj = {}
+    scalars = set()
+
+    def on_type(T: dict, span: Span):
+        node = LazySchemaNode(T["name"], T["kind"], file_path, span)
+        # The reference objects go away with T
+        _, node.outbound = scan_type_refs(T, scalars)
+        adj[node.key] = node
+
+    schema = scan_schema(file_path, on_type)
+    scalars.update(all_scalar_types(schema))
+    link_inbound(adj)
+
+    if graph_cache is not None:
+        graph_cache.put(schema_digest, adj, scalars, skeleton=schema)
+
+    return schema, adj, scalars
+
+
+def build_graph(
+    graphql_schema: dict, graph_cache: GraphCache = None, schema_digest: str = None
+) -> typing.Tuple[dict, set]:
+    """
+    Get the Adjacency List and all Scalar Types of the Schema, from
+    the Graph cache if possible
+
+    """
+    use_cache = graph_cache is not None and schema_digest is not None
+    if use_cache:
+        record = graph_cache.get(schema_digest)
+        graph = mk_graph_from_record(graphql_schema, record) if record else None
+        if graph is not None:
+            return graph, set(record["scalars"])
+
+    graph, scalars = index_schema(graphql_schema)
+    if use_cache:
+        graph_cache.put(schema_digest, graph, scalars)
+
+    return graph, scalars
+
+
 def load_schema(file_path: str):
-    with open(file_path) as ifile:
+    with open(file_path, encoding="utf-8") as ifile:
         return json.load(ifile)
 
 
@@ -312,11 +840,15 @@ def convert_type_path_key(type_path: str, sep="/") -> str:
 
 def get_subtypes_of_domain(schema, domain, key_func=convert_type_path_key) -> list:
     """
-    Q&D version of this, just examine the paths of each type
+    Q&D version of this, just examine the paths of each type. A
+    CompactGraph answers with a range query on its sorted names.
 
     """
-    R = []
     norm_domain = key_func(domain)
+    if isinstance(schema, CompactGraph):
+        return schema.names_with_prefix(norm_domain)
+
+    R = []
 
     for type_path in schema:
         if type_path.startswith(norm_domain):
@@ -331,45 +863,235 @@ def reduce_graphql_schema(schema, graph, subgraph_keys):
     sub-graph
 
     """
-    # Get root set
+    # Get root set, in the order of the Graph so the output is the
+    # same from run to run
     schema["__schema"]["types"] = [
-        graph[key].value for key in subgraph_keys if key in graph
+        node.value for key, node in graph.items() if key in subgraph_keys
     ]
     return schema
 
 
-def all_scalar_types(root):
+# Bump whenever the state layout or the way Types are rendered changes
+DECOMP_STATE_FORMAT_VERSION = 3
 
-    stack = [root]
-    R = set()
 
-    while stack:
+class DecompState(object):
+    """
+    What decompose produced on the last run, so the next one only
+    renders the Types whose output can have changed. The state file is
+    a pickled dict like:
+
+    {"version": 3,
+     "schema_digest": "<sha256 of the Schema file>",
+     "options": {"target_language": "swift", "strip": "none", ...},
+     "subgraph": {"Query", "Human", "Character", ...},
+     "kept_fields": {"Human": {"name"}, ...},
+     "types": {"Query": b'{"kind": "OBJECT", ...}', ...}}
+
+    "types" has the serialized JSON of each Type of the Lean Schema,
+    in the format it's written in. A state for another Schema or other
+    options is discarded as a whole. The state file is unpickled, so
+    like a cache it must only be writable by the user running
+    LeanSchema.
+
+    A state without a path is only kept in memory, for the next
+    decompose by the same process.
+
+    """
+
+    def __init__(
+        self,
+        path: typing.Optional[str],
+        target_language: str = SwiftLanguage.KEY,
+        strip: str = "none",
+        prune_fields: bool = False,
+        compact: bool = False,
+        json_backend: str = "auto",
+    ):
+        self.path = os.path.abspath(path) if path is not None else None
+        self.schema_digest = None
+        self.options = {
+            "target_language": target_language,
+            "strip": strip,
+            "prune_fields": prune_fields,
+            "compact": compact,
+            "json_backend": json_backend,
+        }
+        self.dumps = get_dumps(compact, json_backend)
+        self.subgraph = set()
+        self.kept_fields = {}
+        self.types = {}
+
+    def load(self, schema_digest: str):
+        self.schema_digest = schema_digest
+        if self.path is None or not os.path.isfile(self.path):
+            return self
+
+        try:
+            with open(self.path, "rb") as ifile:
+                state = pickle.load(ifile)
+        except Exception:
+            logging.warning("Ignoring unreadable decomp state {}".format(self.path))
+            return self
+
+        if (
+            type(state) is dict
+            and state.get("version") == DECOMP_STATE_FORMAT_VERSION
+            and state.get("schema_digest") == schema_digest
+            and state.get("options") == self.options
+        ):
+            self.subgraph = state["subgraph"]
+            self.kept_fields = state["kept_fields"]
+            self.types = {key: RawJSON(T) for key, T in state["types"].items()}
+        else:
+            logging.debug(
+                "Decomp state {} is for another Schema or other options".format(
+                    self.path
+                )
+            )
 
-        node = stack.pop()
+        return self
+
+    def get_dirty_keys(
+        self, graph: dict, subgraph_keys: set, kept_fields: dict
+    ) -> typing.Set[str]:
+        """
+        The keys of the sub-graph Types that have to be rendered again:
+        Types that weren't in the last sub-graph, whose kept fields
+        changed, or that reference a Type that entered or left the
+        sub-graph, as those references are replaced by a GraphQLTypeRef
+        or restored. The Interfaces of a Type decide which of its
+        fields --strip keeps, so Types are also rendered again when
+        one of their Interfaces is.
+
+        """
+        crossed = self.subgraph.symmetric_difference(subgraph_keys)
+        dirty = set()
+        for key in subgraph_keys:
+            node = graph.get(key)
+            if (
+                node is None
+                or key not in self.types
+                or kept_fields.get(key) != self.kept_fields.get(key)
+                or not crossed.isdisjoint(node.outbound)
+            ):
+                dirty.add(key)
+
+        interfaces = {
+            key for key in dirty if key in graph and graph[key].kind == "INTERFACE"
+        }
+        if interfaces:
+            for key in subgraph_keys.difference(dirty):
+                if not interfaces.isdisjoint(graph[key].outbound):
+                    dirty.add(key)
+
+        return dirty
+
+    def reduce_graphql_schema(
+        self, schema: dict, graph: dict, subgraph_keys: set, dirty_keys: set
+    ) -> dict:
+        """
+        Same as reduce_graphql_schema, with the Types serialized: the
+        dirty ones anew, all others from the last run
+
+        """
+        types = {}
+        for key, node in graph.items():
+            if key in subgraph_keys:
+                if key in dirty_keys:
+                    types[key] = RawJSON(self.dumps(node.value))
+                else:
+                    types[key] = self.types[key]
+
+        self.types = types
+        schema["__schema"]["types"] = list(types.values())
+        return schema
+
+    def update(self, subgraph_keys: set, kept_fields: dict):
+        self.subgraph = set(subgraph_keys)
+        self.kept_fields = kept_fields
+
+    def save(self):
+        if self.path is None:
+            return
+
+        state = {
+            "version": DECOMP_STATE_FORMAT_VERSION,
+            "schema_digest": self.schema_digest,
+            "options": self.options,
+            "subgraph": self.subgraph,
+            "kept_fields": self.kept_fields,
+            "types": {key: bytes(T) for key, T in self.types.items()},
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open_atomic(self.path, "wb", suffix=".pickle") as ofile:
+                pickle.dump(state, ofile, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            logging.warning("Could not write decomp state {}: {}".format(self.path, e))
+
+
+def type_scalar_types(root: dict) -> typing.Set[str]:
+    """
+    All Scalar Types a GraphQL Schema Type defines or references
 
-        if type(node) is list:
-            stack.extend(node)
+    """
+    R = {ref["name"] for ref in iter_type_refs(root) if ref["kind"] == "SCALAR"}
+    if root.get("kind") == "SCALAR":
+        R.add(root["name"])
+
+    return R
 
-        elif type(node) is dict:
-            if "kind" in node and node["kind"].lower() == "scalar":
-                R.add(node["name"])
 
-            stack.extend(node.items())
+def all_scalar_types(root: dict) -> typing.Set[str]:
+    """
+    All Scalar Types defined or referenced in a GraphQL Schema
+    formatted Object (see get_schema_types), including Directive
+    arguments. A single Type is also accepted.
+
+    """
+    if "kind" in root:
+        return type_scalar_types(root)
 
-        elif type(node) is tuple:
-            stack.append(node[0])
-            stack.append(node[1])
+    schema = get_schema_root(root)
+    R = directive_scalar_types(schema)
+    for T in schema["types"]:
+        R.update(type_scalar_types(T))
 
     return R
 
 
-def get_neighboring_types(G: dict, type_key, depth_level):
+def directive_scalar_types(schema_root: dict) -> typing.Set[str]:
+    """
+    All Scalar Types referenced by Directive arguments, see
+    get_schema_root
+
+    """
+    R = set()
+    for directive in schema_root.get("directives") or ():
+        for arg in directive.get("args") or ():
+            ref = unwrap_type_ref(arg["type"])
+            if ref["kind"] == "SCALAR":
+                R.add(ref["name"])
+
+    return R
+
+
+def get_neighboring_types(G, type_key, depth_level):
+    """
+    All Types at most depth_level edges away from type_key, including
+    type_key. G is either an Adjacency List or a CompactGraph.
+
+    """
+    if isinstance(G, CompactGraph):
+        return G.bfs(type_key, depth_level)
+
     Q = queue.Queue()
     Q.put((type_key, 0))
     seen = set()
 
     while not Q.empty():
-        (node_key, depth) = Q.get()
+        node_key, depth = Q.get()
 
         if node_key not in seen:
             seen.add(node_key)
@@ -391,6 +1113,22 @@ def get_neighboring_types(G: dict, type_key, depth_level):
     return seen
 
 
+def get_neighborhood(G, depths: typing.Dict[str, int]) -> typing.Set[str]:
+    """
+    Union of get_neighboring_types(G, type_key, depth_level) for every
+    (type_key, depth_level) in depths. A CompactGraph does it in a
+    single traversal.
+
+    """
+    if isinstance(G, CompactGraph):
+        return G.multi_bfs(depths)
+
+    R = set()
+    for type_key, depth_level in depths.items():
+        R.update(get_neighboring_types(G, type_key, depth_level))
+    return R
+
+
 def get_types_from_file(G: dict, types_file: dict, types_set: set = None) -> set:
     """
     Get additional User-specified Types from a object from a file.
@@ -403,6 +1141,8 @@ def get_types_from_file(G: dict, types_file: dict, types_set: set = None) -> set
     if types_set is None:
         types_set = set()
 
+    # Types with a depth, collected for a single traversal
+    depths = {}
     if "types" in types_file:
         types_from_file = types_file["types"]
         if type(types_from_file) is str:
@@ -416,10 +1156,8 @@ def get_types_from_file(G: dict, types_file: dict, types_set: set = None) -> set
                     type_key = list(subtype.keys())[0]
                     if "depth" in subtype[type_key]:
                         depth = int(subtype[type_key]["depth"])
-                        neighbors = get_neighboring_types(
-                            G, convert_type_path_key(type_key), depth
-                        )
-                        types_set.update(neighbors)
+                        type_key = convert_type_path_key(type_key)
+                        depths[type_key] = max(depth, depths.get(type_key, depth))
         else:
 
             error_msg = "Unrecognized value for key 'types' in file {}, must have type list or str, but is {}".format(
@@ -428,17 +1166,31 @@ def get_types_from_file(G: dict, types_file: dict, types_set: set = None) -> set
             logging.error(error_msg)
             raise ValueError(error_msg)
 
-    # Load all types of domain
+    # Load all types of domain, optionally with a depth like the types
     if "domains" in types_file:
         for domain in types_file["domains"]:
-            types_set.update(get_subtypes_of_domain(G, convert_type_path_key(domain)))
+            depth = 0
+            if type(domain) is dict and len(domain.keys()) == 1:
+                domain, options = list(domain.items())[0]
+                depth = int((options or {}).get("depth", 0))
+
+            subtypes = get_subtypes_of_domain(G, convert_type_path_key(domain))
+            if depth > 0:
+                for type_key in subtypes:
+                    depths[type_key] = max(depth, depths.get(type_key, depth))
+            else:
+                types_set.update(subtypes)
 
+    types_set.update(get_neighborhood(G, depths))
     return types_set
 
 
-def get_types_from_input():
+def get_types_from_input(fields: dict = None):
     """
     Check any input JSON for additional Types
+
+    @param fields: if given, the selected fields per Type from the
+    input, ie from get_types, are added to it
     """
     types = set()
 
@@ -446,7 +1198,11 @@ def get_types_from_input():
         text_in = sys.stdin.read()
         if text_in.strip():
             logging.debug("Additional keys from stdin: {}".format(text_in))
-            types.update(json.loads(text_in)["types"])
+            input_json = json.loads(text_in)
+            types.update(input_json["types"])
+            if fields is not None:
+                for type_name, field_names in input_json.get("fields", {}).items():
+                    fields.setdefault(type_name, set()).update(field_names)
     else:
         logging.debug("No additional subgraph keys from stdin")
 
@@ -466,10 +1222,49 @@ def check_input_object_depth_level(value):
     return int(value)
 
 
-def main(args):
+def load_types_file(types_file_path: str) -> dict:
+    """
+    Load the (optional) Types YAML file, an empty dict if there isn't one
 
-    parser = argparse.ArgumentParser()
-    parser.add_argument("SCHEMA_FILE", help="Path to the Intuit Schema JSON file")
+    """
+    types_file = {}
+    if types_file_path is not None:
+        types_file_path = os.path.abspath(types_file_path)
+        if os.path.exists(types_file_path):
+            with open(types_file_path, encoding="utf-8") as ifile:
+                types_file = yaml.safe_load(ifile.read()) or {}
+
+    return types_file
+
+
+def setup_logging(log_level: str, log_file: str = DEFAULT_LOG_FILE):
+    """
+    Configure logging for all non-JSON output, exits on bad values
+
+    """
+    try:
+        level = LOG_LEVELS[log_level]
+    except KeyError:
+        print("Invalid logging level {}, use one of {}".format(log_level, LOG_LEVELS))
+        exit(1)
+
+    logfile_path_prefix = os.path.split(log_file)[0]
+    if logfile_path_prefix and not os.path.exists(logfile_path_prefix):
+        print("Log file directory {} does not exist".format(logfile_path_prefix))
+        exit(1)
+
+    log_file = log_file or DEFAULT_LOG_FILE
+
+    logging.basicConfig(filename=log_file, level=level)
+    logging.getLogger().addHandler(logging.StreamHandler())
+
+
+def add_decomp_arguments(parser: argparse.ArgumentParser):
+    """
+    Add the decomp options shared by every program that runs the
+    decomposition
+
+    """
     parser.add_argument(
         "--types-file", help="Path to the (optional) Types YAML file", default=None
     )
@@ -496,147 +1291,396 @@ def main(args):
         choices=LANGUAGES_TABLE.keys(),
         default=SwiftLanguage.KEY,
     )
-    args = parser.parse_args(args)
+    parser.add_argument(
+        "--graph-cache",
+        help="Cache the Schema Graph, keyed by the Schema file contents, so later runs against the same Schema don't build it again. Makes the first run against each Schema slower.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="PATH",
+        help="Directory to cache the Schema Graph in, implies --graph-cache",
+    )
+    parser.add_argument(
+        "--no-cache",
+        help="Don't read or write the Graph cache, even with --graph-cache or --cache-dir",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--strip",
+        help="Make the Lean Schema smaller by removing: descriptions; also deprecated fields and enum values the Queries don't use; also fields and optional arguments whose Type is not in the Lean Schema. Each level strips everything the previous ones do.",
+        choices=STRIP_LEVELS,
+        default="none",
+    )
+    parser.add_argument(
+        "--prune-fields",
+        help="Only keep the fields of Objects and Interfaces that the Queries select, and the fields their Interfaces need. Types from the Types file keep all their fields.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--incremental-state",
+        metavar="PATH",
+        help="Keep the sub-graph and the serialized Types of the Lean Schema in PATH, so the next run only renders the Types that changed. The output is the same as without it.",
+    )
 
-    with open(args.SCHEMA_FILE, encoding="utf-8") as ifile:
-        schema = json.load(ifile)
 
-    schema = schema["data"] if "data" in schema else schema
+def graph_cache_from_args(args) -> typing.Optional[GraphCache]:
+    if args.no_cache or not (args.graph_cache or args.cache_dir):
+        return None
+    return GraphCache(args.cache_dir or DEFAULT_CACHE_DIR)
 
-    # Types file is optional, data can come from stdin or it
-    types_file = {}
-    if args.types_file is not None:
-        types_file_path = os.path.abspath(args.types_file)
-        if os.path.exists(types_file_path):
-            with open(types_file_path, encoding="utf-8") as ifile:
-                types_file = yaml.load(ifile.read()) or {}
 
-    try:
-        log_level = LOG_LEVELS[args.log_level]
-    except KeyError:
-        print(
-            "Invalid logging level {}, use one of {}".format(args.log_level, LOG_LEVELS)
+def state_from_args(args) -> typing.Optional[DecompState]:
+    """
+    The DecompState of --incremental-state, for the decomp and output
+    options of args. Not loaded yet, see DecompState.load
+
+    """
+    if not args.incremental_state:
+        return None
+
+    return DecompState(
+        args.incremental_state,
+        target_language=args.target_language,
+        strip=args.strip,
+        prune_fields=args.prune_fields,
+        compact=args.compact,
+        json_backend=args.json_backend,
+    )
+
+
+def decompose(
+    schema: dict,
+    types_file: dict = None,
+    input_types: set = None,
+    input_object_depth_level: int = 0,
+    target_language: str = SwiftLanguage.KEY,
+    graph_cache: GraphCache = None,
+    schema_digest: str = None,
+    graph: dict = None,
+    scalar_types: set = None,
+    stats: Stats = None,
+    strip: str = "none",
+    selected_fields: dict = None,
+    prune: bool = False,
+    possible_types: typing.Dict[str, typing.FrozenSet[str]] = None,
+    state: DecompState = None,
+) -> dict:
+    """
+    Reduce a loaded GraphQL Schema to the sub-graph rooted at the
+    Types from the Types file and the input Types, ie the Types that
+    get_types found in the Queries.
+
+    @param schema: the GraphQL Schema object, with the top-level
+    "data" key already removed. Modified in place.
+    @param graph_cache: cache to get the Graph from, along with the
+    schema_digest of the Schema file it was loaded from
+    @param graph: the already built Graph and scalar_types of the
+    Schema, ie from load_schema_streaming
+    @param stats: records the cost of each phase, see lean_schema.stats
+    @param strip: one of STRIP_LEVELS, see strip_type
+    @param selected_fields: the field names the Queries select per
+    Type, and the enum values they use, ie from get_types. --strip
+    never removes them.
+    @param prune: Objects and Interfaces from the input Types only keep
+    their selected fields, see get_kept_fields. Types from the Types
+    file keep all their fields.
+    @param possible_types: the possible Types of each abstract Type, ie
+    from get_types.get_possible_types_index. Built from the Graph if
+    needed and not given, see index_possible_types.
+    @param state: the state of the last decompose with the same
+    options. Only the Types whose output can have changed are
+    rendered, the Types of the reduced schema are serialized as
+    RawJSON, and the state is updated for the next run.
+
+    return: the reduced schema
+
+    """
+    if types_file is None:
+        types_file = {}
+    if stats is None:
+        stats = Stats("decomp", enabled=False)
+
+    with stats.phase("graph_build") as phase:
+        if graph is None:
+            graph, scalar_types = build_graph(schema, graph_cache, schema_digest)
+
+        logging.debug("Adding GraphQLTypeRef types to Schema")
+        graph.update(
+            mk_graph_from_schema(
+                {"types": [T.to_dict() for T in GRAPHQL_TYPE_REF_DICT.values()]}
+            )
+        )
+        # All traversals run on the interned, de-duplicated Graph
+        compact_graph = CompactGraph.from_adjacency(graph)
+        logging.debug(
+            "Graph has {} Types and {} edges".format(
+                len(compact_graph), compact_graph.num_edges
+            )
+        )
+        phase.count(types=len(compact_graph), edges=compact_graph.num_edges)
+
+    with stats.phase("root_collection") as phase:
+        # Load all directly stated Types/Domains from file
+        root_keys = set()
+        types_size = 0
+        file_keys = get_types_from_file(compact_graph, types_file)
+        root_keys.update(file_keys)
+        types_size = len(root_keys)
+        logging.debug(
+            "Types increased from 0 to {} from types-from-file".format(types_size)
         )
-        exit(1)
 
-    logfile_path_prefix = os.path.split(args.log_file)[0]
-    if logfile_path_prefix and not os.path.exists(logfile_path_prefix):
-        print("Log file directory {} does not exist".format(logfile_path_prefix))
-        exit(1)
+        # Get any additional Root Keys, ie from stdin or get_types
+        if input_types:
+            root_keys.update(input_types)
+        logging.debug(
+            "Types increased from {} to {} from types-from-input".format(
+                types_size, len(root_keys)
+            )
+        )
+        types_size = len(root_keys)
+        phase.count(types=types_size)
+
+    with stats.phase("scalar_scan") as phase:
+        # Get the set of keys for the valid subgraph
+        subgraph_keys = {obj.get_name() for obj in GRAPHQL_TYPE_REF_DICT.values()}
+        subgraph_keys.update(root_keys)
+
+        # Stuff like {'BigDecimal', 'Boolean', 'Float', 'ID', 'Int',
+        # 'Long', 'String'} is defined in the Schema, so have to add it
+        # back. They were collected along with the Graph.
+        subgraph_keys.update(scalar_types)
+        logging.debug(
+            "Types increased from {} to {} by adding all scalar types".format(
+                types_size, len(subgraph_keys)
+            )
+        )
+        types_size = len(subgraph_keys)
+        # 'Hard-coded' types to add
+        subgraph_keys.add("Schema_Schema_StringSchema0")
+        logging.debug(
+            "Types increased from {} to {} by adding hard-coded types".format(
+                types_size, len(subgraph_keys)
+            )
+        )
+        types_size = len(subgraph_keys)
+        phase.count(scalars=len(scalar_types), types=types_size)
+
+    with stats.phase("input_object_unfolding") as phase:
+        # Unfold InputObjects up to some depth
+        input_objects = {
+            k: input_object_depth_level
+            for k in subgraph_keys
+            if k in graph and graph[k].kind == "INPUT_OBJECT"
+        }
+        subgraph_keys.update(get_neighborhood(compact_graph, input_objects))
 
-    log_file = args.log_file or DEFAULT_LOG_FILE
+        logging.debug(
+            "Types increased from {} to {} by unfolding InputObjects to depth = {}".format(
+                types_size, len(subgraph_keys), input_object_depth_level
+            )
+        )
+        phase.count(input_objects=len(input_objects), types=len(subgraph_keys))
+
+    with stats.phase("ref_rewrite") as phase:
+        # Prune/clean up subraph by removing references to Types not in
+        # the subraph. Also replace any Scalar Types that don't exist for
+        # our target language.
+        target_language = LANGUAGES_TABLE[target_language]
+        # Add all additional type from the target language, if any
+        if hasattr(target_language, "additional_types"):
+            for tkey in target_language.additional_types:
+                tvalue = target_language.additional_types[tkey]
+                # A copy, as the Type is modified like the others ie
+                # by --strip
+                schema_node = SchemaNode(tkey, copy_json(tvalue))
+                graph[tkey] = schema_node
+                subgraph_keys.add(tkey)
+                if "$decomp.type_replaces" in tvalue:
+                    replaced_type = tvalue["$decomp.type_replaces"]
+                    if replaced_type in graph:
+                        del graph[replaced_type]
+                        subgraph_keys.remove(replaced_type)
+                    else:
+                        logging.warning(
+                            "Cannot remove Scalar Type {}, does it exist in Schema?".format(
+                                replaced_type
+                            )
+                        )
 
-    logging.basicConfig(filename=log_file, level=log_level)
-    logging.getLogger().addHandler(logging.StreamHandler())
+        # The fields --strip and pruning keep per Type. Only
+        # --strip=deprecated and above can remove selected fields.
+        kept_fields = {}
+        pruned_types = {}
+        strips_fields = STRIP_LEVELS.index(strip) >= STRIP_LEVELS.index("deprecated")
+        if selected_fields is not None and strips_fields:
+            kept_fields = {
+                key: set(names)
+                for key, names in selected_fields.items()
+                if key in subgraph_keys
+            }
+        if selected_fields is not None and prune:
+            pruned_types = get_kept_fields(
+                graph,
+                selected_fields,
+                [
+                    key
+                    for key in input_types or ()
+                    if key not in file_keys
+                    and key in graph
+                    and graph[key].kind in ("OBJECT", "INTERFACE")
+                ],
+                possible_types,
+            )
+            kept_fields.update(pruned_types)
+        if state is None:
+            dirty_keys = subgraph_keys
+        else:
+            dirty_keys = state.get_dirty_keys(graph, subgraph_keys, kept_fields)
+            logging.debug(
+                "Rendering {} of {} Types, the others are unchanged".format(
+                    len(dirty_keys), len(subgraph_keys)
+                )
+            )
+        stripped = 0
+        pruned = 0
+        for key in dirty_keys:
+            if key in graph:
+                node = graph[key].value
+                update_type_refs(
+                    node,
+                    graph,
+                    subgraph_keys,
+                    scalars_dict=target_language.scalars_dict,
+                    refs=graph[key].refs,
+                )
+                assert graph[key].value == node
+                if key in pruned_types:
+                    pruned += prune_fields(node, kept_fields[key])
+                if strip != "none":
+                    stripped += strip_type(
+                        node,
+                        strip,
+                        graph,
+                        subgraph_keys,
+                        kept_fields,
+                    )
+            else:
+                logging.warning(
+                    "Bad Type key, is it defined in the Schema?: {}".format(key)
+                )
+        if strip != "none":
+            for directive in schema["__schema"].get("directives") or ():
+                stripped += strip_descriptions(directive)
+            logging.info(
+                "Stripped about {} bytes with --strip={}".format(stripped, strip)
+            )
+        if pruned_types:
+            logging.debug(
+                "Pruned {} unselected fields of {} Types".format(
+                    pruned, len(pruned_types)
+                )
+            )
+        phase.count(
+            types=len(subgraph_keys),
+            rendered=len(dirty_keys),
+            stripped_bytes=stripped,
+            pruned_fields=pruned,
+        )
+
+    with stats.phase("reduction") as phase:
+        # Shrink the schema to only include whats in the subgraph
+        if state is None:
+            schema = reduce_graphql_schema(schema, graph, subgraph_keys)
+        else:
+            schema = state.reduce_graphql_schema(
+                schema, graph, subgraph_keys, dirty_keys
+            )
+            state.update(subgraph_keys, kept_fields)
+        phase.count(types=len(schema["__schema"]["types"]))
+
+    return schema
+
+
+def main(args):
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("SCHEMA_FILE", help="Path to the Intuit Schema JSON file")
+    add_decomp_arguments(parser)
+    parser.add_argument(
+        "--streaming",
+        help="Stream the Schema file one Type at a time instead of loading it whole. Uses much less memory for large Schemas.",
+        action="store_true",
+    )
+    add_output_arguments(parser)
+    add_stats_arguments(parser)
+    args = parser.parse_args(args)
+
+    # Before anything logs, or logging configures itself
+    setup_logging(args.log_level, args.log_file)
     run_uuid = uuid.uuid4()
     logging.debug("START run {}".format(run_uuid))
 
-    logging.debug("Adding GraphQLTypeRef types to Schema")
-    for typeref_type in GRAPHQL_TYPE_REF_DICT.values():
-        schema["__schema"]["types"].append(typeref_type.to_dict())
-
-    graph = mk_graph_from_schema(schema)
-    # Load all directly stated Types/Domains from file
-    root_keys = set()
-    types_size = 0
-    root_keys.update(get_types_from_file(graph, types_file))
-    types_size = len(root_keys)
-    logging.debug(
-        "Types increased from 0 to {} from types-from-file".format(types_size)
-    )
+    stats = stats_from_args("decomp", args)
+    graph_cache = graph_cache_from_args(args)
+    state = state_from_args(args)
+    graph = scalar_types = schema_digest = None
+    with stats.phase("schema_load") as phase:
+        if args.streaming:
+            if state is not None:
+                schema_digest = file_digest(args.SCHEMA_FILE)
+            # The Graph is built while streaming
+            schema, graph, scalar_types = load_schema_streaming(
+                args.SCHEMA_FILE, graph_cache, schema_digest
+            )
+        elif graph_cache is not None or state is not None:
+            schema, schema_digest = load_schema_with_digest(args.SCHEMA_FILE)
+        else:
+            schema = load_schema(args.SCHEMA_FILE)
+        schema = schema["data"] if "data" in schema else schema
+        phase.count(
+            types=len(graph) if args.streaming else len(get_schema_types(schema))
+        )
+
+    # Types file is optional, data can come from stdin or it
+    types_file = load_types_file(args.types_file)
+    if state is not None:
+        state.load(schema_digest)
 
     # Get any additional Root Keys specified from stdin
     try:
-        root_keys.update(get_types_from_input())
+        selected_fields = {}
+        input_types = get_types_from_input(selected_fields)
     except:
         logging.debug(traceback.format_exc())
         logging.error("Error reading type keys from stdin, is it valid JSON?")
         exit(1)
-    logging.debug(
-        "Types increased from {} to {} from types-from-input".format(
-            types_size, len(root_keys)
-        )
-    )
-    types_size = len(root_keys)
-
-    # Get the set of keys for the valid subgraph
-    subgraph_keys = {obj.get_name() for obj in GRAPHQL_TYPE_REF_DICT.values()}
-    subgraph_keys.update(root_keys)
-
-    # Stuff like {'BigDecimal', 'Boolean', 'Float', 'ID', 'Int',
-    # 'Long', 'String'} is defined in the Schema, so have to add it
-    # back
-    subgraph_keys.update(all_scalar_types(schema))
-    logging.debug(
-        "Types increased from {} to {} by adding all scalar types".format(
-            types_size, len(subgraph_keys)
-        )
-    )
-    types_size = len(subgraph_keys)
-    # 'Hard-coded' types to add
-    subgraph_keys.add("Schema_Schema_StringSchema0")
-    logging.debug(
-        "Types increased from {} to {} by adding hard-coded types".format(
-            types_size, len(subgraph_keys)
-        )
-    )
-    types_size = len(subgraph_keys)
-
-    # Unfold InputObjects up to some depth
-    for input_object in [
-        k
-        for k in subgraph_keys
-        if k in graph and graph[k].value["kind"] == "INPUT_OBJECT"
-    ]:
-        nset = get_neighboring_types(graph, input_object, args.input_object_depth_level)
-        subgraph_keys.update(nset)
-
-    logging.debug(
-        "Types increased from {} to {} by unfolding InputObjects to depth = {}".format(
-            types_size, len(subgraph_keys), args.input_object_depth_level
-        )
-    )
 
-    # Prune/clean up subraph by removing references to Types not in
-    # the subraph. Also replace any Scalar Types that don't exist for
-    # our target language.
-    target_language = LANGUAGES_TABLE[args.target_language]
-    # Add all additional type from the target language, if any
-    if hasattr(target_language, "additional_types"):
-        for tkey in target_language.additional_types:
-            tvalue = target_language.additional_types[tkey]
-            schema_node = SchemaNode(tkey, tvalue)
-            graph[tkey] = schema_node
-            subgraph_keys.add(tkey)
-            if "$decomp.type_replaces" in tvalue:
-                replaced_type = tvalue["$decomp.type_replaces"]
-                if replaced_type in graph:
-                    del graph[replaced_type]
-                    subgraph_keys.remove(replaced_type)
-                else:
-                    logging.warning(
-                        "Cannot remove Scalar Type {}, does it exist in Schema?".format(
-                            replaced_type
-                        )
-                    )
-
-    for key in subgraph_keys:
-        if key in graph:
-            node = graph[key].value
-            update_type_refs(
-                node, graph, subgraph_keys, scalars_dict=target_language.scalars_dict
-            )
-            assert graph[key].value == node
-        else:
-            logging.warning(
-                "Bad Type key, is it defined in the Schema?: {}".format(key)
-            )
+    schema = decompose(
+        schema,
+        types_file=types_file,
+        input_types=input_types,
+        input_object_depth_level=args.input_object_depth_level,
+        target_language=args.target_language,
+        graph_cache=graph_cache,
+        schema_digest=schema_digest,
+        graph=graph,
+        scalar_types=scalar_types,
+        stats=stats,
+        strip=args.strip,
+        selected_fields=selected_fields,
+        prune=args.prune_fields,
+        state=state,
+    )
 
-    # Shrink the schema to only include whats in the subgraph
-    reduce_graphql_schema(schema, graph, subgraph_keys)
+    with stats.phase("serialization") as phase:
+        phase.count(bytes=write_output_from_args(schema, args))
+    if state is not None:
+        state.save()
 
     logging.debug("END run {}".format(run_uuid))
-    print(json.dumps(schema))
+    report_from_args(stats, args)
     return schema
 
 
@@ -30,18 +30,39 @@ actually breaks down the Graph by using the referenced Types as Roots.
 
 __author__ = "prussell"
 
+import concurrent.futures
 import json
 import os
 import sys
 import typing
 import argparse
 import enum
+import weakref
 import graphql
-from graphql.language import DocumentNode, visit
+from graphql.language import (
+    DocumentNode,
+    FragmentDefinitionNode,
+    print_ast,
+    visit,
+)
 from graphql.language.visitor import TypeInfoVisitor
 from graphql.utilities import TypeInfo
 from graphql.validation.validation_context import ValidationContext
+from lean_schema.cache import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_PARSE_CACHE_MAX_BYTES,
+    ParseCache,
+    QueryManifest,
+    digest_bytes,
+    load_schema_with_digest,
+)
 from lean_schema.project_logging import logger
+from lean_schema.stats import (
+    add_stats_arguments,
+    count_active,
+    report_from_args,
+    stats_from_args,
+)
 from lean_schema.visitors import AllTypesVisitor
 
 
@@ -58,27 +79,208 @@ class ExitErrorCodes(enum.Enum):
     QUERY_PATH_NOT_FILE_OR_DIRECTORY = 4
 
 
-def load_schema(schema_path):
-    """Load the Intuit Schema. Apparently it differs a bit from what
-    Graphene wants, specifically Graphene doesn't recognize the
-    top-level "errors" and "data" fields
+def load_schema_json(schema_path) -> dict:
+    """Load the Intuit Schema as a plain Introspection object. Apparently
+    it differs a bit from what Graphene wants, specifically Graphene
+    doesn't recognize the top-level "errors" and "data" fields
     """
 
-    with open(os.path.abspath(schema_path)) as ifile:
+    with open(os.path.abspath(schema_path), encoding="utf-8") as ifile:
         ischema = json.load(ifile)
     if "data" in ischema:
         ischema = ischema["data"]
-    return graphql.build_client_schema(ischema)
+    return ischema
+
+
+def load_schema(schema_path):
+    """Load the Intuit Schema as a GraphQLSchema"""
+    return graphql.build_client_schema(load_schema_json(schema_path))
+
+
+def parse_document_file(
+    query_path, parse_cache: ParseCache = None, digest: str = None
+) -> DocumentNode:
+    """
+    Parse a Query file, or get it from the parse cache if given
+
+    @param digest: the digest of the file contents, if already
+    known. A cached document is then returned without reading the file.
+
+    """
+    if parse_cache is None:
+        with open(os.path.abspath(query_path)) as ifile:
+            return graphql.parse(ifile.read())
+
+    if digest is not None:
+        document = parse_cache.get(digest)
+        if document is not None:
+            return document
+    with open(os.path.abspath(query_path), "rb") as ifile:
+        return parse_cache.parse(ifile.read(), digest)
+
+
+def visit_document_file(
+    query_path,
+    schema,
+    fields: dict = None,
+    parse_cache: ParseCache = None,
+    fragment_index: "FragmentIndex" = None,
+):
+    return visit_document(
+        parse_document_file(query_path, parse_cache), schema, fields, fragment_index
+    )
 
 
-def visit_document_file(query_path, schema):
-    with open(os.path.abspath(query_path)) as ifile:
-        doc = ifile.read()
+def visit_definition(def_ast, type_info: TypeInfo, context) -> AllTypesVisitor:
+    """
+    @param context: the ValidationContext of the document, or just the
+    TypeInfo, see AllTypesVisitor
+
+    """
+    visitor = AllTypesVisitor(context)
+    visit(def_ast, TypeInfoVisitor(type_info, visitor))
+    count_active(ast_nodes=visitor.num_nodes)
+    return visitor
+
+
+def add_fields(fields: dict, pairs: typing.Iterable[typing.Tuple[str, str]]):
+    for type_name, field_name in pairs:
+        fields.setdefault(type_name, set()).add(field_name)
+
+
+class Fragment(object):
+    """
+    A Fragment definition and, once visited, what it references
+
+    """
 
-    return visit_document(graphql.parse(doc), schema)
+    __slots__ = ("definition", "text", "types", "fields", "spreads")
 
+    def __init__(self, definition: FragmentDefinitionNode):
+        self.definition = definition
+        self.text = None
+        self.types = None
+        self.fields = None
+        self.spreads = None
 
-def visit_document(document_ast: DocumentNode, schema):
+    def get_text(self) -> str:
+        if self.text is None:
+            self.text = print_ast(self.definition)
+        return self.text
+
+
+class FragmentIndex(object):
+    """
+    The Fragment definitions of a corpus of Query documents by name,
+    so spreads of Fragments defined in other documents can be resolved.
+
+    Each distinct definition is visited once, when the first document
+    that defines or spreads it is visited, however many documents
+    define or spread it. Definitions are told apart by how they print,
+    since the same Fragment parsed from two documents has different
+    locations. Fragment names should be unique across the corpus; a
+    spread of a name with several definitions resolves to the one in
+    the same document if there is one, or else to all of them.
+
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.fragments = {}
+        self.type_info = TypeInfo(schema)
+
+    def add_document(self, document_ast: DocumentNode):
+        for def_ast in document_ast.definitions:
+            if isinstance(def_ast, FragmentDefinitionNode):
+                self.add(def_ast)
+
+    def add(self, definition: FragmentDefinitionNode) -> Fragment:
+        """
+        Index a Fragment definition, if it's new
+
+        return: the Fragment of the definition
+
+        """
+        name = definition.name.value
+        fragments = self.fragments.setdefault(name, [])
+        for fragment in fragments:
+            if fragment.definition is definition:
+                return fragment
+
+        if fragments:
+            text = print_ast(definition)
+            for fragment in fragments:
+                if fragment.get_text() == text:
+                    return fragment
+            logger.warning("Fragment %s has different definitions", name)
+
+        fragment = Fragment(definition)
+        fragments.append(fragment)
+        return fragment
+
+    def visit(self, fragment: Fragment) -> Fragment:
+        if fragment.types is None:
+            visitor = visit_definition(
+                fragment.definition, self.type_info, self.type_info
+            )
+            fragment.types = visitor.types
+            fragment.fields = visitor.fields
+            fragment.spreads = visitor.spreads
+            count_active(fragments=1)
+
+        return fragment
+
+    def resolve(
+        self, names: typing.Iterable[str], local: typing.Dict[str, Fragment] = None
+    ) -> typing.Tuple[set, set]:
+        """
+        Get the Types and (parent Type name, field name) pairs the
+        named Fragments reference, including those of the Fragments
+        they spread
+
+        @param local: the Fragments a document defines itself, by name
+
+        """
+        if local is None:
+            local = {}
+        types = set()
+        fields = set()
+        stack = list(names)
+        seen = set()
+        while stack:
+            name = stack.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            fragments = [local[name]] if name in local else self.fragments.get(name)
+            if not fragments:
+                logger.debug("Spread of unknown Fragment %s", name)
+                continue
+            for fragment in fragments:
+                self.visit(fragment)
+                types.update(fragment.types)
+                fields.update(fragment.fields)
+                stack.extend(fragment.spreads)
+
+        return types, fields
+
+
+def visit_document(
+    document_ast: DocumentNode,
+    schema,
+    fields: dict = None,
+    fragment_index: FragmentIndex = None,
+):
+    """
+    Get the Types a Query document references.
+
+    @param fields: if given, the names of the selected fields are added
+    to it per parent Type name
+    @param fragment_index: if given, the Fragments the document defines
+    or spreads are visited through it, see FragmentIndex. Without it,
+    spreads of Fragments defined in other documents are not resolved.
+
+    """
 
     if not document_ast or not isinstance(document_ast, DocumentNode):
         raise TypeError("You must provide a document node.")
@@ -91,14 +293,76 @@ def visit_document(document_ast: DocumentNode, schema):
     # Visit the whole document with each instance of all provided rules.
     # A single document can have multiple Fragments, and we assume a single Query
     all_types = set()
+    spreads = set()
+    local = {}
     for def_ast in document_ast.definitions:
-        visitor = AllTypesVisitor(context)
-        visit(def_ast, TypeInfoVisitor(type_info, visitor))
+        if fragment_index is not None and isinstance(def_ast, FragmentDefinitionNode):
+            # Fragments nothing spreads are still visited
+            local[def_ast.name.value] = fragment_index.add(def_ast)
+            spreads.add(def_ast.name.value)
+            continue
+
+        visitor = visit_definition(def_ast, type_info, context)
         all_types.update(visitor.types)
+        spreads.update(visitor.spreads)
+        if fields is not None:
+            add_fields(fields, visitor.fields)
+
+    if fragment_index is not None:
+        fragment_types, fragment_fields = fragment_index.resolve(spreads, local)
+        all_types.update(fragment_types)
+        if fields is not None:
+            add_fields(fields, fragment_fields)
 
     return all_types
 
 
+def visit_documents(
+    documents: typing.Iterable[DocumentNode],
+    schema,
+    fields: dict = None,
+    fragment_index: FragmentIndex = None,
+) -> typing.Set[str]:
+    """
+    Get the expanded Type names a batch of Query documents references.
+    Same as visit_document for each document followed by expand_types,
+    but a single TypeInfo and AllTypesVisitor visit all documents, and
+    the Types are only expanded once.
+
+    @param fields: if given, the names of the selected fields are added
+    to it per parent Type name
+    @param fragment_index: see visit_document
+
+    """
+    type_info = TypeInfo(schema)
+    visitor = AllTypesVisitor(type_info)
+    type_info_visitor = TypeInfoVisitor(type_info, visitor)
+    fragment_fields = set()
+    for document_ast in documents:
+        local = {}
+        visitor.spreads = spreads = set()
+        for def_ast in document_ast.definitions:
+            if fragment_index is not None and isinstance(
+                def_ast, FragmentDefinitionNode
+            ):
+                # Fragments nothing spreads are still visited
+                local[def_ast.name.value] = fragment_index.add(def_ast)
+                spreads.add(def_ast.name.value)
+            else:
+                visit(def_ast, type_info_visitor)
+
+        if fragment_index is not None:
+            types, document_fields = fragment_index.resolve(spreads, local)
+            visitor.types.update(types)
+            fragment_fields.update(document_fields)
+
+    count_active(ast_nodes=visitor.num_nodes)
+    if fields is not None:
+        add_fields(fields, visitor.fields)
+        add_fields(fields, fragment_fields)
+    return expand_types(visitor.types, schema)
+
+
 def get_named_type(_type):
     """Equivalent of this function from the Facebook GrapHQL lib from graphql/type/definitions.js:
 function getNamedType(type) {
@@ -124,100 +388,488 @@ function getNamedType(type) {
     return unwrapped_type
 
 
+# The possible Types index of each GraphQLSchema, see
+# get_possible_types_index
+_possible_types_indexes = weakref.WeakKeyDictionary()
+
+
+def get_possible_types_index(schema) -> typing.Dict[str, typing.FrozenSet[str]]:
+    """
+    Map each Interface and Union of a GraphQLSchema to the names of
+    its possible Types. The index is built once per GraphQLSchema.
+
+    decomp.index_possible_types builds the same index from the Schema
+    Graph.
+
+    """
+    index = _possible_types_indexes.get(schema)
+    if index is None:
+        index = {}
+        for _type in schema.type_map.values():
+            if graphql.is_abstract_type(_type):
+                try:
+                    possible_types = schema.get_possible_types(_type)
+                except KeyError:
+                    # An Interface without implementations
+                    possible_types = ()
+                index[_type.name] = frozenset(
+                    sub_type.name for sub_type in possible_types
+                )
+        _possible_types_indexes[schema] = index
+
+    return index
+
+
 def expand_type(_type, schema, type_names: set = None) -> typing.Set[str]:
     if type_names is None:
         type_names = set()
 
-    if hasattr(_type, "name"):
-        type_names.add(_type.name)
-        try:
-            for sub_type in schema.get_possible_types(_type):
-                type_names.add(sub_type.name)
-        except KeyError:
-            logger.debug("No sub-types for %s", _type.name)
-
-    if hasattr(_type, "of_type"):
-        type_names.add(get_named_type(_type).name)
+    if _type:
+        name = get_named_type(_type).name
+        type_names.add(name)
+        type_names.update(get_possible_types_index(schema).get(name, ()))
 
     return type_names
 
 
 def expand_types(types, schema) -> typing.Set[str]:
-    type_names = set()
-    for _type in types:
-        if _type:
-            type_names.update(expand_type(_type, schema, type_names))
+    """
+    Get the names of the Types, unwrapped, and of the possible Types of
+    the abstract ones
+
+    """
+    type_names = {get_named_type(_type).name for _type in types if _type}
+    possible_types = get_possible_types_index(schema)
+    for name in possible_types.keys() & type_names:
+        type_names.update(possible_types[name])
 
     return type_names
 
 
+def find_document_files(
+    root_path: str, file_extensions=("graphql", "gql")
+) -> typing.List[str]:
+    """
+    Get the sorted paths of all Query files under root_path
+
+    """
+    if os.path.isfile(root_path):
+        return [root_path]
+
+    file_paths = []
+    for root, _, files in os.walk(root_path):
+        for filename in files:
+            if filename.split(".")[-1] in file_extensions:
+                file_paths.append(os.path.join(root, filename))
+
+    return sorted(file_paths)
+
+
 def visit_document_directory(
-    root_path: str, schema, file_extensions=("graphql", "gql"), all_types: set = None
+    root_path: str,
+    schema,
+    file_extensions=("graphql", "gql"),
+    all_types: set = None,
+    fields: dict = None,
+    parse_cache: ParseCache = None,
 ) -> set:
+    """
+    Get the Types the Query files under root_path reference. All files
+    are parsed and their Fragments indexed first, so each Fragment is
+    visited once and spreads across files are resolved, see
+    FragmentIndex.
+
+    """
     if all_types is None:
         all_types = set()
 
-    for root, _, files in os.walk(root_path):
-        for filename in files:
-            if filename.split(".")[-1] in file_extensions:
-                full_path = os.path.join(root, filename)
-                logger.debug("Processing file %s", full_path)
-                all_types.update(visit_document_file(full_path, schema))
+    fragment_index = FragmentIndex(schema)
+    documents = []
+    for full_path in find_document_files(root_path, file_extensions):
+        document_ast = parse_document_file(full_path, parse_cache)
+        fragment_index.add_document(document_ast)
+        documents.append((full_path, document_ast))
+
+    for full_path, document_ast in documents:
+        logger.debug("Processing file %s", full_path)
+        all_types.update(visit_document(document_ast, schema, fields, fragment_index))
+        count_active(files=1)
 
     return all_types
 
 
-def main(main_args):
-    parser = argparse.ArgumentParser(main_args)
-    parser.add_argument("SCHEMA_FILE", help="The Schema File to load")
-    parser.add_argument(
-        "INPUT_TLD", help="Top-level-directory of the set of Queries to process"
+def merge_fields(fields: dict, other: dict) -> dict:
+    """
+    Add the selected fields of other to fields, both keyed by parent
+    Type name
+
+    """
+    for type_name, field_names in other.items():
+        fields.setdefault(type_name, set()).update(field_names)
+    return fields
+
+
+def sorted_fields(fields: dict) -> typing.Dict[str, typing.List[str]]:
+    return {type_name: sorted(fields[type_name]) for type_name in sorted(fields)}
+
+
+def visit_document_file_result(
+    query_path, schema, parse_cache: ParseCache = None, digest: str = None
+) -> typing.Tuple[typing.List[str], typing.Dict[str, typing.List[str]]]:
+    """
+    Get the sorted, expanded Type names and the sorted selected fields
+    per Type of a single Query file. Expansion is done per file, which
+    gives the same result as expanding the Types of all files at once.
+
+    @param digest: see parse_document_file
+
+    """
+    fields = {}
+    type_names = visit_documents(
+        [parse_document_file(query_path, parse_cache, digest)], schema, fields
     )
-    parser.add_argument(
-        "--verbose", help="Verbose output, DEBUG and below", action="store_true"
+    return sorted(type_names), sorted_fields(fields)
+
+
+# The GraphQLSchema and ParseCache of a visit_document_files worker
+# process
+_worker_schema = None
+_worker_parse_cache = None
+
+
+def _init_worker(schema_path: str, parse_cache: ParseCache = None):
+    global _worker_schema, _worker_parse_cache
+    _worker_schema = load_schema(schema_path)
+    _worker_parse_cache = parse_cache
+
+
+def _visit_document_file_result_in_worker(query_path, digest=None):
+    return visit_document_file_result(
+        query_path, _worker_schema, _worker_parse_cache, digest
     )
-    parser.add_argument(
-        "--sorted", help="Sort the output type names", action="store_true"
+
+
+def visit_document_files(
+    file_paths: typing.Sequence[str],
+    schema,
+    jobs: int = 1,
+    schema_path: str = None,
+    parse_cache: ParseCache = None,
+    digests: typing.Sequence[str] = None,
+) -> typing.List[typing.Tuple[typing.List[str], typing.Dict[str, typing.List[str]]]]:
+    """
+    Get the expanded Type names and selected fields of each Query
+    file, in the same order as file_paths. See
+    visit_document_file_result.
+
+    @param jobs: number of worker processes to visit the files with.
+    Each worker builds its own GraphQLSchema from schema_path once.
+    @param parse_cache: if given, parsed documents are taken from and
+    added to it
+    @param digests: the digests of the file contents, in the same
+    order as file_paths, if already known
+
+    """
+    count_active(files=len(file_paths))
+    if digests is None:
+        digests = [None] * len(file_paths)
+    if jobs <= 1 or len(file_paths) <= 1:
+        return [
+            visit_document_file_result(path, schema, parse_cache, digest)
+            for path, digest in zip(file_paths, digests)
+        ]
+
+    if schema_path is None:
+        raise ValueError("schema_path is required to visit files with jobs > 1")
+
+    jobs = min(jobs, len(file_paths))
+    logger.debug("Visiting %s files with %s processes", len(file_paths), jobs)
+    # Several files per task, or the IPC overhead outweighs the
+    # visiting of small Queries
+    chunksize = max(1, len(file_paths) // (jobs * 4))
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(os.path.abspath(schema_path), parse_cache),
+    ) as pool:
+        return list(
+            pool.map(
+                _visit_document_file_result_in_worker,
+                file_paths,
+                digests,
+                chunksize=chunksize,
+            )
+        )
+
+
+def visit_document_files_incremental(
+    file_paths: typing.Iterable[str],
+    schema,
+    manifest: QueryManifest,
+    jobs: int = 1,
+    schema_path: str = None,
+    fields: dict = None,
+    parse_cache: ParseCache = None,
+) -> typing.Set[str]:
+    """
+    Get the expanded Type names of each Query file, only parsing and
+    visiting files that changed since the manifest was saved.
+
+    @param fields: if given, the selected fields are added to it, see
+    visit_document
+    @param parse_cache: see visit_document_files
+
+    """
+    type_names = set()
+    if fields is None:
+        fields = {}
+    changed = []
+    for file_path in file_paths:
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        entry = manifest.get_by_stat(file_path, stat)
+        if entry is not None:
+            manifest.keep(file_path, entry)
+            type_names.update(entry["types"])
+            merge_fields(fields, entry["fields"])
+            continue
+
+        with open(file_path, "rb") as ifile:
+            digest = digest_bytes(ifile.read())
+        entry = manifest.get_by_digest(file_path, digest)
+        if entry is not None:
+            manifest.update(file_path, stat, digest, entry["types"], entry["fields"])
+            type_names.update(entry["types"])
+            merge_fields(fields, entry["fields"])
+        else:
+            changed.append((file_path, stat, digest))
+
+    logger.debug("Visiting %s new or changed files", len(changed))
+    changed_results = visit_document_files(
+        [file_path for file_path, _, _ in changed],
+        schema,
+        jobs,
+        schema_path,
+        parse_cache,
+        [digest for _, _, digest in changed],
     )
-    args = parser.parse_args()
+    for (file_path, stat, digest), (file_types, file_fields) in zip(
+        changed, changed_results
+    ):
+        manifest.update(file_path, stat, digest, file_types, file_fields)
+        type_names.update(file_types)
+        merge_fields(fields, file_fields)
+
+    manifest.save()
+    return type_names
 
-    if not args.verbose:
-        logger.setLevel("WARNING")
 
-    if not os.path.exists(os.path.abspath(args.SCHEMA_FILE)):
-        print(
-            "SCHEMA_FILE does not exist: {}".format(args.SCHEMA_FILE), file=sys.stderr
+def get_types(
+    input_path: str,
+    schema,
+    manifest: QueryManifest = None,
+    jobs: int = 1,
+    schema_path: str = None,
+    fields: dict = None,
+    parse_cache: ParseCache = None,
+) -> typing.Set[str]:
+    """
+    Visit a single Query file or a top-level-directory of Queries and
+    return the expanded set of referenced Type names
+
+    @param manifest: if given, only re-visit Query files that changed
+    since the last run
+    @param jobs: number of processes to visit Query files with, see
+    visit_document_files. With jobs or a manifest each file is visited
+    on its own, without resolving spreads of Fragments from other
+    files. Those Fragments are visited in their own files, so the
+    result is the same.
+    @param fields: if given, the names of the selected fields are added
+    to it per parent Type name
+    @param parse_cache: if given, Query files are only parsed if their
+    contents aren't in it yet. Least recently used documents are
+    evicted from it afterwards.
+
+    """
+    try:
+        return _get_types(
+            input_path, schema, manifest, jobs, schema_path, fields, parse_cache
         )
+    finally:
+        if parse_cache is not None:
+            parse_cache.prune()
+
+
+def _get_types(input_path, schema, manifest, jobs, schema_path, fields, parse_cache):
+    if manifest is not None:
+        return visit_document_files_incremental(
+            find_document_files(input_path),
+            schema,
+            manifest.load(),
+            jobs,
+            schema_path,
+            fields,
+            parse_cache,
+        )
+
+    if jobs > 1:
+        results = visit_document_files(
+            find_document_files(input_path), schema, jobs, schema_path, parse_cache
+        )
+        type_names = set()
+        for file_types, file_fields in results:
+            type_names.update(file_types)
+            if fields is not None:
+                merge_fields(fields, file_fields)
+        return type_names
+
+    # Support both single file / top-level-directory. All files are
+    # parsed and their Fragments indexed first, see FragmentIndex.
+    fragment_index = FragmentIndex(schema)
+    documents = []
+    for file_path in find_document_files(input_path):
+        logger.debug("Processing file %s", file_path)
+        document_ast = parse_document_file(file_path, parse_cache)
+        fragment_index.add_document(document_ast)
+        documents.append(document_ast)
+    count_active(files=len(documents))
+
+    return visit_documents(documents, schema, fields, fragment_index)
+
+
+def check_input_paths(schema_file: str, input_tld: str):
+    """
+    Exit with an ExitErrorCodes value if the Schema file or Query
+    path are not usable
+
+    """
+    if not os.path.exists(os.path.abspath(schema_file)):
+        print("SCHEMA_FILE does not exist: {}".format(schema_file), file=sys.stderr)
         sys.exit(ExitErrorCodes.SCHEMA_FILE_NOT_EXISTS)
 
-    if not os.path.isfile(os.path.abspath(args.SCHEMA_FILE)):
-        print("SCHEMA_FILE is not a file: {}".format(args.SCHEMA_FILE), file=sys.stderr)
+    if not os.path.isfile(os.path.abspath(schema_file)):
+        print("SCHEMA_FILE is not a file: {}".format(schema_file), file=sys.stderr)
         sys.exit(ExitErrorCodes.SCHEMA_FILE_NOT_A_FILE)
 
-    abs_input_tld = os.path.abspath(args.INPUT_TLD)
+    abs_input_tld = os.path.abspath(input_tld)
     if not os.path.exists(abs_input_tld):
-        print("INPUT_TLD does not exist: {}".format(args.INPUT_TLD), file=sys.stderr)
+        print("INPUT_TLD does not exist: {}".format(input_tld), file=sys.stderr)
         sys.exit(ExitErrorCodes.QUERY_PATH_NOT_EXISTS)
 
-    input_is_file = os.path.isfile(abs_input_tld)
-    if not input_is_file and not os.path.isdir(abs_input_tld):
+    if not os.path.isfile(abs_input_tld) and not os.path.isdir(abs_input_tld):
         print(
-            "INPUT_TLD is not a file or directory: {}".format(args.INPUT_TLD),
+            "INPUT_TLD is not a file or directory: {}".format(input_tld),
             file=sys.stderr,
         )
         sys.exit(ExitErrorCodes.QUERY_PATH_NOT_FILE_OR_DIRECTORY)
 
-    schema = load_schema(os.path.abspath(args.SCHEMA_FILE))
-    all_types = set()
-    # Support both single file / top-level-directory
-    if input_is_file:
-        all_types.update(visit_document_file(abs_input_tld, schema))
-    else:
-        visit_document_directory(abs_input_tld, schema, all_types=all_types)
 
-    type_names = expand_types(all_types, schema)
+def check_jobs(value):
+    try:
+        if int(value) < 1:
+            raise ValueError
+    except ValueError:
+        raise argparse.ArgumentTypeError("{} must be an integer >= 1".format(value))
+
+    return int(value)
+
+
+def add_visit_arguments(parser: argparse.ArgumentParser, manifest: bool = True):
+    if manifest:
+        parser.add_argument(
+            "--manifest",
+            help="Path of the manifest of Types found per Query file. If given, only Query files that changed since the last run are parsed and visited.",
+            default=None,
+        )
+    parser.add_argument(
+        "--jobs",
+        help="Number of processes to parse and visit Query files with",
+        default=1,
+        type=check_jobs,
+    )
+    parser.add_argument(
+        "--parse-cache",
+        help="Cache parsed Query files, keyed by their contents, so unchanged Queries aren't parsed again",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--parse-cache-dir",
+        metavar="PATH",
+        help="Directory to cache parsed Query files in, implies --parse-cache",
+    )
+    parser.add_argument(
+        "--parse-cache-max-mb",
+        help="Evict the least recently used parsed Query files once the parse cache is larger than this",
+        type=int,
+        default=DEFAULT_PARSE_CACHE_MAX_BYTES >> 20,
+    )
+
+
+def parse_cache_from_args(args) -> typing.Optional[ParseCache]:
+    if not args.parse_cache and not args.parse_cache_dir:
+        return None
+    return ParseCache(
+        args.parse_cache_dir or DEFAULT_CACHE_DIR, args.parse_cache_max_mb << 20
+    )
+
+
+def main(main_args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("SCHEMA_FILE", help="The Schema File to load")
+    parser.add_argument(
+        "INPUT_TLD", help="Top-level-directory of the set of Queries to process"
+    )
+    parser.add_argument(
+        "--verbose", help="Verbose output, DEBUG and below", action="store_true"
+    )
+    parser.add_argument(
+        "--sorted", help="Sort the output type names", action="store_true"
+    )
+    add_visit_arguments(parser)
+    add_stats_arguments(parser)
+    args = parser.parse_args(main_args)
+
+    if not args.verbose:
+        logger.setLevel("WARNING")
+
+    check_input_paths(args.SCHEMA_FILE, args.INPUT_TLD)
+    abs_input_tld = os.path.abspath(args.INPUT_TLD)
+    stats = stats_from_args("get_types", args)
+
+    with stats.phase("schema_load") as phase:
+        if args.manifest is not None:
+            ischema, schema_digest = load_schema_with_digest(args.SCHEMA_FILE)
+            ischema = ischema["data"] if "data" in ischema else ischema
+            schema = graphql.build_client_schema(ischema)
+            manifest = QueryManifest(args.manifest, schema_digest)
+        else:
+            schema = load_schema(os.path.abspath(args.SCHEMA_FILE))
+            manifest = None
+        phase.count(types=len(schema.type_map))
+
+    # AST nodes are only counted for files visited in this process
+    with stats.phase("visit") as phase:
+        fields = {}
+        type_names = get_types(
+            abs_input_tld,
+            schema,
+            manifest=manifest,
+            jobs=args.jobs,
+            schema_path=args.SCHEMA_FILE,
+            fields=fields,
+            parse_cache=parse_cache_from_args(args),
+        )
+        phase.count(types=len(type_names))
+
+    with stats.phase("serialization") as phase:
+        type_names = sorted(type_names) if args.sorted else list(type_names)
+        text = json.dumps(
+            {"types": type_names, "fields": sorted_fields(fields)}, indent=2
+        )
+        phase.count(bytes=len(text))
 
-    return json.dumps({"types": list(type_names)}, indent=2)
+    report_from_args(stats, args)
+    return text
 
 
 if __name__ == "__main__":
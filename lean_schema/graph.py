@@ -0,0 +1,169 @@
+"""
+Compact representation of the Schema Graph for traversals.
+
+The Adjacency List from decomp.mk_graph_from_schema keeps a list of
+Type name strings per node. CompactGraph interns every Type name to an
+integer id and stores the (de-duplicated) edges CSR style: the
+outbound neighbors of node i are targets[offsets[i]:offsets[i + 1]].
+Traversals then only touch machine integers and a bytearray of seen
+flags.
+
+"""
+
+__author__ = "prussell"
+
+import bisect
+import logging
+import typing
+from array import array
+
+
+class CompactGraph(object):
+
+    __slots__ = ("names", "ids", "num_defined", "offsets", "targets", "sorted_names")
+
+    def __init__(
+        self,
+        names: typing.List[str],
+        num_defined: int,
+        offsets: array,
+        targets: array,
+    ):
+        # Ids below num_defined are Types defined in the Schema, the
+        # rest are referenced but not defined
+        self.names = names
+        self.ids = {name: i for i, name in enumerate(names)}
+        self.num_defined = num_defined
+        self.offsets = offsets
+        self.targets = targets
+        # Defined Type names in order, for prefix queries
+        self.sorted_names = sorted(names[:num_defined])
+
+    @classmethod
+    def from_adjacency(cls, adj: dict) -> "CompactGraph":
+        """
+        Build from an Adjacency List of SchemaNodes, see
+        decomp.mk_graph_from_schema
+
+        """
+        names = list(adj)
+        ids = {name: i for i, name in enumerate(names)}
+        num_defined = len(names)
+        offsets = array("i", [0])
+        targets = array("i")
+
+        for name in adj:
+            seen = set()
+            for neighbor in adj[name].outbound:
+                i = ids.get(neighbor)
+                if i is None:
+                    i = ids[neighbor] = len(names)
+                    names.append(neighbor)
+                if i not in seen:
+                    seen.add(i)
+                    targets.append(i)
+            offsets.append(len(targets))
+
+        # Undefined Types have no outbound edges
+        offsets.extend([len(targets)] * (len(names) - num_defined))
+        return cls(names, num_defined, offsets, targets)
+
+    def __contains__(self, name) -> bool:
+        i = self.ids.get(name)
+        return i is not None and i < self.num_defined
+
+    def __iter__(self):
+        return iter(self.names[: self.num_defined])
+
+    def __len__(self) -> int:
+        return self.num_defined
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.targets)
+
+    def neighbors(self, name) -> typing.List[str]:
+        i = self.ids[name]
+        names = self.names
+        return [names[j] for j in self.targets[self.offsets[i] : self.offsets[i + 1]]]
+
+    def names_with_prefix(self, prefix: str) -> typing.List[str]:
+        """
+        All defined Type names that start with prefix, in sorted order
+
+        """
+        sorted_names = self.sorted_names
+        start = bisect.bisect_left(sorted_names, prefix)
+        end = start
+        while end < len(sorted_names) and sorted_names[end].startswith(prefix):
+            end += 1
+        return sorted_names[start:end]
+
+    def bfs(self, type_key, depth_level: int) -> typing.Set[str]:
+        """
+        All Types at most depth_level edges away from type_key,
+        including type_key itself
+
+        """
+        return self.multi_bfs({type_key: depth_level})
+
+    def multi_bfs(self, depths: typing.Dict[str, int]) -> typing.Set[str]:
+        """
+        Union of bfs(type_key, depth_level) for every (type_key,
+        depth_level) in depths, in a single traversal.
+
+        Each node keeps the most remaining depth it has been reached
+        with, and nodes are expanded in order of decreasing remaining
+        depth, so every node is expanded at most once no matter how
+        many roots reach it.
+
+        """
+        budget = array("i", [-1]) * len(self.names)
+        names = self.names
+        visited = set()
+        buckets = [[]]
+
+        for type_key, depth_level in depths.items():
+            i = self.ids.get(type_key)
+            if i is None:
+                if depth_level > 0:
+                    self.warn_missing(type_key)
+                visited.add(type_key)
+                continue
+
+            depth_level = max(depth_level, 0)
+            if depth_level > budget[i]:
+                budget[i] = depth_level
+                while len(buckets) <= depth_level:
+                    buckets.append([])
+                buckets[depth_level].append(i)
+
+        offsets = self.offsets
+        targets = self.targets
+        for remaining in range(len(buckets) - 1, -1, -1):
+            for i in buckets[remaining]:
+                # Stale entry, reached again with more depth to go
+                if budget[i] != remaining:
+                    continue
+                visited.add(names[i])
+                if remaining == 0:
+                    continue
+                if i >= self.num_defined:
+                    self.warn_missing(names[i])
+                    continue
+                next_remaining = remaining - 1
+                next_bucket = buckets[next_remaining]
+                for j in targets[offsets[i] : offsets[i + 1]]:
+                    if budget[j] < next_remaining:
+                        budget[j] = next_remaining
+                        next_bucket.append(j)
+
+        return visited
+
+    @staticmethod
+    def warn_missing(type_key):
+        logging.warning(
+            "Invalid Type Key {} not in Schema, cannot find any neighboring Types for it".format(
+                type_key
+            )
+        )
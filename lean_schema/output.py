@@ -0,0 +1,195 @@
+"""
+Writing the Lean Schema JSON.
+
+print(json.dumps(schema)) builds the whole output as one string before
+writing any of it. write_schema instead serializes the Schema one Type
+at a time and writes it out in chunks, straight to the --output file.
+
+Two formats are supported:
+
+* The default is byte-identical to json.dumps(schema), as decomp has
+  always printed it. Only the stdlib json module writes it.
+* --compact has no whitespace and writes non-ASCII characters as
+  UTF-8. orjson or ujson are used for it when installed, with the same
+  bytes as the stdlib json module.
+
+Types that are already serialized, ie kept from an earlier run by
+decomp.DecompState, are written as they are.
+
+"""
+
+__author__ = "prussell"
+
+import argparse
+import json
+import typing
+
+from lean_schema.cache import open_atomic
+
+CHUNK_SIZE = 1 << 20
+JSON_BACKENDS = ("auto", "orjson", "ujson", "json")
+
+
+class RawJSON(bytes):
+    """A value that is already serialized, in the format being written"""
+
+
+def stdlib_dumps(value) -> bytes:
+    return json.dumps(value).encode("ascii")
+
+
+def stdlib_dumps_compact(value) -> bytes:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def get_compact_dumps(backend: str = "auto") -> typing.Callable[[typing.Any], bytes]:
+    """
+    Get the function that serializes values to compact JSON bytes
+    with the given backend. "auto" picks the fastest one installed.
+
+    """
+    if backend in ("auto", "orjson"):
+        try:
+            import orjson
+
+            return orjson.dumps
+        except ImportError:
+            if backend == "orjson":
+                raise
+
+    if backend in ("auto", "ujson"):
+        try:
+            import ujson
+
+            return lambda value: ujson.dumps(
+                value, ensure_ascii=False, escape_forward_slashes=False
+            ).encode("utf-8")
+        except ImportError:
+            if backend == "ujson":
+                raise
+
+    return stdlib_dumps_compact
+
+
+def get_dumps(
+    compact: bool = False, backend: str = "auto"
+) -> typing.Callable[[typing.Any], bytes]:
+    """
+    Get the function that serializes values to JSON bytes in the
+    format write_schema writes
+
+    """
+    return get_compact_dumps(backend) if compact else stdlib_dumps
+
+
+def iter_json_chunks(
+    value, dumps: typing.Callable[[typing.Any], bytes], compact: bool
+) -> typing.Iterator[bytes]:
+    """
+    Serialize a Schema object piece by piece. The objects down to the
+    __schema object are written key by key, and its list of Types one
+    Type at a time, so no more than one Type is ever serialized at
+    once.
+
+    """
+    item_sep, key_sep = (b",", b":") if compact else (b", ", b": ")
+    yield b"{"
+    for i, (key, item) in enumerate(value.items()):
+        if i:
+            yield item_sep
+        yield dumps(key) + key_sep
+        if key in ("data", "__schema") and type(item) is dict:
+            yield from iter_json_chunks(item, dumps, compact)
+        elif key == "types" and type(item) is list:
+            yield b"["
+            for j, T in enumerate(item):
+                if j:
+                    yield item_sep
+                yield T if type(T) is RawJSON else dumps(T)
+            yield b"]"
+        else:
+            yield dumps(item)
+    yield b"}"
+
+
+def write_schema(
+    ofile: typing.BinaryIO,
+    schema: dict,
+    compact: bool = False,
+    backend: str = "auto",
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """
+    Write a Schema as JSON, followed by a newline, in chunks of about
+    chunk_size bytes.
+
+    return: the number of bytes written
+
+    """
+    dumps = get_dumps(compact, backend)
+    chunk = []
+    chunk_len = 0
+    written = 0
+    for part in iter_json_chunks(schema, dumps, compact):
+        chunk.append(part)
+        chunk_len += len(part)
+        if chunk_len >= chunk_size:
+            ofile.write(b"".join(chunk))
+            written += chunk_len
+            chunk = []
+            chunk_len = 0
+
+    chunk.append(b"\n")
+    ofile.write(b"".join(chunk))
+    return written + chunk_len + 1
+
+
+def write_schema_file(file_path: str, schema: dict, **kwargs) -> int:
+    """
+    Write a Schema to a file, see write_schema. Readers never see a
+    partially written file.
+
+    """
+    with open_atomic(file_path, "wb") as ofile:
+        return write_schema(ofile, schema, **kwargs)
+
+
+def add_output_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--output",
+        metavar="PATH",
+        help="Write the Lean Schema to PATH instead of stdout",
+    )
+    parser.add_argument(
+        "--compact",
+        help="Write the Lean Schema JSON without whitespace",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--json-backend",
+        help="JSON library to write --compact output with, the fastest installed one by default",
+        choices=JSON_BACKENDS,
+        default="auto",
+    )
+
+
+def write_output_from_args(schema: dict, args: argparse.Namespace) -> int:
+    """
+    Write the Lean Schema where the CLI arguments say, see
+    add_output_arguments
+
+    return: the number of bytes written
+
+    """
+    if args.output:
+        return write_schema_file(
+            args.output, schema, compact=args.compact, backend=args.json_backend
+        )
+
+    data = b"".join(
+        iter_json_chunks(
+            schema, get_dumps(args.compact, args.json_backend), args.compact
+        )
+    )
+    print(data.decode("utf-8"))
+    return len(data) + 1
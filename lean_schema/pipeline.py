@@ -0,0 +1,173 @@
+"""
+Run get_types and decomp in a single process.
+
+The lean_schema make target used to run `get_types | decomp`, which
+loads and parses the Schema file twice and round-trips the Type names
+through JSON on stdin. Here the Schema JSON is loaded once: it is used
+to build the GraphQLSchema for visiting the Queries, then the same
+object is decomposed using the visited Types as Roots.
+
+"""
+
+__author__ = "prussell"
+
+import argparse
+import logging
+import os
+import sys
+import typing
+import uuid
+
+import graphql
+
+from lean_schema import decomp, get_types
+from lean_schema.cache import (
+    GraphCache,
+    ParseCache,
+    QueryManifest,
+    load_schema_with_digest,
+)
+from lean_schema.output import add_output_arguments, write_output_from_args
+from lean_schema.project_logging import logger
+from lean_schema.stats import (
+    Stats,
+    add_stats_arguments,
+    report_from_args,
+    stats_from_args,
+)
+
+
+def run(
+    schema_path: str,
+    input_path: str,
+    types_file: dict = None,
+    input_object_depth_level: int = 0,
+    target_language: str = decomp.SwiftLanguage.KEY,
+    graph_cache: GraphCache = None,
+    manifest_path: str = None,
+    jobs: int = 1,
+    stats: Stats = None,
+    strip: str = "none",
+    prune_fields: bool = False,
+    parse_cache: ParseCache = None,
+    state: decomp.DecompState = None,
+) -> dict:
+    """
+    Create the Lean Schema for the Queries under input_path.
+
+    @param schema_path: path to the Introspection format Schema file
+    @param input_path: a Query file or a top-level-directory of Queries
+    @param types_file: the object loaded from the Types YAML file
+    @param graph_cache: optional cache for the decomp Schema Graph
+    @param manifest_path: optional get_types manifest, to only visit
+    Query files that changed since the last run
+    @param jobs: number of processes to visit the Queries with
+    @param stats: records the cost of each phase, see lean_schema.stats
+    @param strip: what to strip from the Lean Schema, see decomp.strip_type
+    @param prune_fields: only keep the fields the Queries select, see
+    decomp.get_kept_fields
+    @param parse_cache: optional cache of parsed Query files
+    @param state: optional state of the last run, to only render the
+    Types that changed, see decomp.DecompState. Loaded here.
+
+    return: the reduced schema
+
+    """
+    if stats is None:
+        stats = Stats("pipeline", enabled=False)
+
+    with stats.phase("schema_load") as phase:
+        schema, schema_digest = load_schema_with_digest(schema_path)
+        schema = schema["data"] if "data" in schema else schema
+        # build_client_schema doesn't copy the Introspection object, so
+        # all visiting has to be done before decomp modifies it in place
+        client_schema = graphql.build_client_schema(schema)
+        phase.count(types=len(schema["__schema"]["types"]))
+        if state is not None:
+            state.load(schema_digest)
+
+    with stats.phase("visit") as phase:
+        manifest = (
+            QueryManifest(manifest_path, schema_digest) if manifest_path else None
+        )
+        selected_fields = {}
+        type_names = get_types.get_types(
+            os.path.abspath(input_path),
+            client_schema,
+            manifest=manifest,
+            jobs=jobs,
+            schema_path=schema_path,
+            fields=selected_fields,
+            parse_cache=parse_cache,
+        )
+        logger.debug("Found %s Types in the Queries", len(type_names))
+        phase.count(types=len(type_names))
+
+    return decomp.decompose(
+        schema,
+        types_file=types_file,
+        input_types=type_names,
+        input_object_depth_level=input_object_depth_level,
+        target_language=target_language,
+        graph_cache=graph_cache,
+        schema_digest=schema_digest,
+        stats=stats,
+        strip=strip,
+        selected_fields=selected_fields,
+        prune=prune_fields,
+        # The same index get_types expanded the Types with
+        possible_types=get_types.get_possible_types_index(client_schema),
+        state=state,
+    )
+
+
+def main(args: typing.List[str]):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("SCHEMA_FILE", help="Path to the Intuit Schema JSON file")
+    parser.add_argument(
+        "INPUT_TLD", help="Top-level-directory of the set of Queries to process"
+    )
+    decomp.add_decomp_arguments(parser)
+    get_types.add_visit_arguments(parser)
+    add_output_arguments(parser)
+    add_stats_arguments(parser)
+    args = parser.parse_args(args)
+
+    get_types.check_input_paths(args.SCHEMA_FILE, args.INPUT_TLD)
+    types_file = decomp.load_types_file(args.types_file)
+
+    decomp.setup_logging(args.log_level, args.log_file)
+    logger.setLevel(args.log_level)
+    run_uuid = uuid.uuid4()
+    logging.debug("START run {}".format(run_uuid))
+
+    stats = stats_from_args("pipeline", args)
+    state = decomp.state_from_args(args)
+    schema = run(
+        args.SCHEMA_FILE,
+        args.INPUT_TLD,
+        types_file=types_file,
+        input_object_depth_level=args.input_object_depth_level,
+        target_language=args.target_language,
+        graph_cache=decomp.graph_cache_from_args(args),
+        manifest_path=args.manifest,
+        jobs=args.jobs,
+        stats=stats,
+        strip=args.strip,
+        prune_fields=args.prune_fields,
+        parse_cache=get_types.parse_cache_from_args(args),
+        state=state,
+    )
+
+    with stats.phase("serialization") as phase:
+        phase.count(bytes=write_output_from_args(schema, args))
+    if state is not None:
+        state.save()
+
+    logging.debug("END run {}".format(run_uuid))
+    report_from_args(stats, args)
+    return schema
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -4,16 +4,426 @@
 Post processing for Lean Schema Codegen. Does stuff like:
 - Copy/match codegen files to the source queries directory
 
+Files whose destination already has the same contents are skipped with
+--skip-unchanged, so their mtimes don't change and build tools like
+Xcode don't recompile them.
+
+With --dst-index, codegen files are matched against the .graphql and
+.gql files of dst_dir through an index cached between runs, see
+DstIndex, instead of walking the whole tree.
+
 """
 
 __author__ = "prussell"
 
 import argparse
+import concurrent.futures
+import errno
+import functools
+import json
 import os
 import shutil
 import sys
+import time
 import typing
 
+LINK_MODES = ("copy", "hardlink", "reflink")
+# From linux/fs.h, clones the extents of one file into another on
+# file systems that support it ie Btrfs and XFS
+FICLONE = 0x40049409
+COMPARE_CHUNK_SIZE = 1 << 16
+QUERY_FILE_EXTENSIONS = (".graphql", ".gql")
+DST_INDEX_FORMAT_VERSION = 1
+# Directories modified this close to an index save are scanned again
+# even if their mtime matches
+RACY_MTIME_WINDOW_NS = 2000000000
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def is_unchanged(src: str, dst: str, link_mode: str = "copy") -> bool:
+    """
+    Does dst exist with the same contents as src. Sizes are compared
+    first, so only files of the same size are read. A dst hard linked
+    to src is only unchanged when link_mode is hardlink, else it has
+    to be replaced by a copy.
+
+    """
+    try:
+        src_stat = os.stat(src)
+        dst_stat = os.stat(dst)
+    except FileNotFoundError:
+        return False
+
+    if os.path.samestat(src_stat, dst_stat):
+        return link_mode == "hardlink"
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+
+    with open(src, "rb") as src_file, open(dst, "rb") as dst_file:
+        while True:
+            src_chunk = src_file.read(COMPARE_CHUNK_SIZE)
+            if src_chunk != dst_file.read(COMPARE_CHUNK_SIZE):
+                return False
+            if not src_chunk:
+                return True
+
+
+def reflink(src: str, dst: str):
+    """
+    Make dst a copy-on-write clone of src. Falls back to copying where
+    the platform or file system can't clone files.
+
+    """
+    if fcntl is None or not sys.platform.startswith("linux"):
+        shutil.copyfile(src, dst)
+        return
+
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+            return
+        except OSError:
+            pass
+
+    shutil.copyfile(src, dst)
+
+
+def hardlink(src: str, dst: str):
+    """
+    Replace dst with a hard link to src. Falls back to copying when
+    they are on different file systems or links aren't supported.
+
+    """
+    dst_dir, dst_fname = os.path.split(dst)
+    tmp_path = os.path.join(dst_dir, ".tmp-{}-{}".format(os.getpid(), dst_fname))
+    # Left by an interrupted run
+    try:
+        os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, tmp_path)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+        shutil.copyfile(src, dst)
+        return
+
+    try:
+        os.replace(tmp_path, dst)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+PLACE_FUNCTIONS = {"copy": shutil.copyfile, "hardlink": hardlink, "reflink": reflink}
+
+
+def find_codegen_files(
+    src_dir: str, src_files_extension: str, default_dst: typing.Optional[str]
+) -> dict:
+    """
+    Get all codegen filenames and store as a dict. Apollo
+    (currently) dumps them out as a flat directory
+
+    """
+    return {
+        filename.split(".")[0]: {
+            "src": os.path.join(os.path.abspath(src_dir), filename),
+            "dst": default_dst,
+        }
+        for filename in os.listdir(src_dir)
+        if filename.endswith(src_files_extension)
+    }
+
+
+def match_dst_files(files_table: dict, dst_dir: str):
+    """
+    Trawl through the dst tree and match by file prefix to find the
+    dest file-path
+
+    """
+    for root, dirs, files in os.walk(dst_dir):
+        for fname in files:
+            key = fname.split(".")[0]
+            if key in files_table:
+                files_table[key]["dst"] = os.path.join(root, fname)
+
+
+class DstIndex(object):
+    """
+    The query files of each directory under dst_dir, so later runs
+    only scan the directories that changed. The index file is a JSON
+    object like:
+
+    {"version": 1,
+     "root": "/abs/path/of/dst_dir",
+     "saved_at_ns": 1600000000000000000,
+     "dirs": {"/abs/path/of/dst_dir": {"mtime_ns": ...,
+                                       "subdirs": ["trips", ...],
+                                       "queries": ["getTrip.graphql", ...]}}}
+
+    Adding, removing or renaming a file or directory changes the mtime
+    of the directory it's in, so every directory is still stat'ed but
+    only those with a new mtime are listed again.
+
+    """
+
+    def __init__(self, path: typing.Optional[str], root: str):
+        self.path = os.path.abspath(path) if path is not None else None
+        self.root = os.path.abspath(root)
+        self.saved_at_ns = 0
+        self.dirs = {}
+
+    def load(self):
+        if self.path is None or not os.path.isfile(self.path):
+            return self
+
+        try:
+            with open(self.path, encoding="utf-8") as ifile:
+                index = json.load(ifile)
+        except (OSError, ValueError):
+            print("Ignoring unreadable dst index {}".format(self.path), file=sys.stderr)
+            return self
+
+        if (
+            type(index) is dict
+            and index.get("version") == DST_INDEX_FORMAT_VERSION
+            and index.get("root") == self.root
+        ):
+            self.saved_at_ns = index["saved_at_ns"]
+            self.dirs = index["dirs"]
+
+        return self
+
+    @staticmethod
+    def scan_dir(path: str, mtime_ns: int) -> dict:
+        subdirs = []
+        queries = []
+        with os.scandir(path) as it:
+            for entry in it:
+                # Like os.walk, symlinks to directories aren't followed
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.name.endswith(QUERY_FILE_EXTENSIONS) and entry.is_file():
+                    queries.append(entry.name)
+
+        return {"mtime_ns": mtime_ns, "subdirs": subdirs, "queries": queries}
+
+    def refresh(self) -> int:
+        """
+        Bring the index up to date with dst_dir
+
+        return: the number of directories that were listed again
+
+        """
+        dirs = {}
+        scanned = 0
+        stack = [self.root]
+        while stack:
+            path = stack.pop()
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+                entry = self.dirs.get(path)
+                if (
+                    entry is None
+                    or entry["mtime_ns"] != mtime_ns
+                    or mtime_ns >= self.saved_at_ns - RACY_MTIME_WINDOW_NS
+                ):
+                    entry = self.scan_dir(path, mtime_ns)
+                    scanned += 1
+            except OSError:
+                # Removed, or not readable, since it was listed
+                continue
+            dirs[path] = entry
+            stack.extend(os.path.join(path, name) for name in entry["subdirs"])
+
+        self.dirs = dirs
+        return scanned
+
+    def get_matches(self) -> typing.Dict[str, typing.List[str]]:
+        """
+        return: the paths of the query files for each file prefix, ie
+        "getTrip" -> ["/dst_dir/trips/getTrip.graphql"]
+
+        """
+        matches = {}
+        for path, entry in self.dirs.items():
+            for fname in entry["queries"]:
+                matches.setdefault(fname.split(".")[0], []).append(
+                    os.path.join(path, fname)
+                )
+
+        return matches
+
+    def save(self):
+        if self.path is None:
+            return
+
+        index = {
+            "version": DST_INDEX_FORMAT_VERSION,
+            "root": self.root,
+            "saved_at_ns": time.time_ns(),
+            "dirs": self.dirs,
+        }
+        tmp_path = "{}.tmp-{}".format(self.path, os.getpid())
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as ofile:
+                json.dump(index, ofile, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(
+                "Could not write dst index {}: {}".format(self.path, e),
+                file=sys.stderr,
+            )
+
+
+def match_dst_files_indexed(files_table: dict, dst_index: DstIndex):
+    """
+    Match by file prefix against the query files of the DstIndex.
+    Prefixes with query files in more than one directory are reported,
+    and the first of them in path order is used.
+
+    """
+    matches = dst_index.get_matches()
+    for key, value in files_table.items():
+        paths = matches.get(key)
+        if not paths:
+            continue
+
+        paths.sort()
+        dirs = sorted({os.path.dirname(path) for path in paths})
+        if len(dirs) > 1:
+            print(
+                "Warning: codegen file {} matches query files in {} directories, using {}: {}".format(
+                    value["src"], len(dirs), dirs[0], ", ".join(dirs)
+                ),
+                file=sys.stderr,
+            )
+        value["dst"] = paths[0]
+
+
+def plan_copies(
+    files_table: dict,
+) -> typing.Tuple[typing.List[typing.Tuple[str, str]], typing.List[str]]:
+    """
+    return: the (src, dst) path of every codegen file to copy, and the
+    codegen files without a match
+
+    """
+    copies = []
+    unmatched = []
+    for value in files_table.values():
+        src = value["src"]
+        dst = value["dst"]
+        if dst is None:
+            unmatched.append(src)
+            continue
+
+        if not os.path.isdir(dst):
+            dst_dir = os.path.split(os.path.abspath(dst))[0]
+        else:
+            dst_dir = dst
+
+        src_fname = os.path.split(src)[1]
+        copies.append((src, os.path.join(dst_dir, src_fname)))
+
+    return copies, unmatched
+
+
+def place_file(
+    src: str, dst: str, link_mode: str = "copy", skip_unchanged: bool = False
+) -> bool:
+    """
+    Copy, hard link or reflink src to dst, see LINK_MODES
+
+    return: whether dst was written, False if it was skipped
+
+    """
+    if skip_unchanged and is_unchanged(src, dst, link_mode):
+        return False
+
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        if link_mode == "hardlink":
+            return False
+        # Left by an earlier --link-mode=hardlink, writing to it would
+        # truncate src
+        os.remove(dst)
+
+    PLACE_FUNCTIONS[link_mode](src, dst)
+    return True
+
+
+def try_place_file(
+    src: str, dst: str, link_mode: str, skip_unchanged: bool
+) -> typing.Tuple[bool, typing.Optional[OSError]]:
+    try:
+        return place_file(src, dst, link_mode, skip_unchanged), None
+    except OSError as e:
+        return False, e
+
+
+def execute_copies(
+    copies: typing.List[typing.Tuple[str, str]],
+    link_mode: str = "copy",
+    skip_unchanged: bool = False,
+    debug: bool = False,
+    jobs: int = 1,
+) -> typing.Tuple[int, int, typing.List[typing.Tuple[str, str, OSError]]]:
+    """
+    Place every file of the plan, on a pool of jobs threads if more
+    than one. A file that can't be placed doesn't stop the others.
+
+    return: the number of files written, the number skipped as
+    unchanged, and the (src, dst, error) of every file that failed
+
+    """
+    written = 0
+    skipped = 0
+    errors = []
+    place = functools.partial(
+        try_place_file, link_mode=link_mode, skip_unchanged=skip_unchanged
+    )
+    if jobs > 1:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        results = executor.map(lambda copy: place(*copy), copies)
+    else:
+        executor = None
+        results = (place(*copy) for copy in copies)
+
+    try:
+        # In the order of the plan, whatever order the copies finish in
+        for (src, dst), (was_written, error) in zip(copies, results):
+            if error is not None:
+                errors.append((src, dst, error))
+            elif was_written:
+                if debug:
+                    print("Copying {} to {}".format(src, dst))
+                written += 1
+            else:
+                if debug:
+                    print("Skipping {}, {} is unchanged".format(src, dst))
+                skipped += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return written, skipped, errors
+
+
+def check_jobs(value):
+    try:
+        if int(value) < 1:
+            raise ValueError
+    except ValueError:
+        raise argparse.ArgumentTypeError("{} must be an integer >= 1".format(value))
+
+    return int(value)
+
 
 def main(prog_args: typing.List[str]):
     parser = argparse.ArgumentParser(prog_args)
@@ -45,6 +455,28 @@ def main(prog_args: typing.List[str]):
         help="Directory to copy unmatched code-generated files to",
         default=None,
     )
+    parser.add_argument(
+        "--skip-unchanged",
+        help="Don't copy codegen files whose destination already has the same contents, so their mtimes don't change",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--link-mode",
+        help="How to place the codegen files: copy them, hard link them, or clone them copy-on-write where the file system supports it. Hard links and clones fall back to copying. Only hard link files that codegen replaces rather than rewrites in place.",
+        choices=LINK_MODES,
+        default="copy",
+    )
+    parser.add_argument(
+        "--jobs",
+        help="Number of threads to copy the codegen files with. Helps on network or encrypted file systems, where each copy waits on I/O.",
+        type=check_jobs,
+        default=1,
+    )
+    parser.add_argument(
+        "--dst-index",
+        metavar="PATH",
+        help="Only match codegen files against .graphql and .gql files, through an index of dst_dir kept in PATH. Later runs only list the directories that changed. Matches in more than one directory are reported.",
+    )
 
     args = parser.parse_args(prog_args)
 
@@ -83,42 +515,43 @@ def main(prog_args: typing.List[str]):
     else:
         copy_unmatched_files_dir = None
 
-    # Get all codegen filenames and store as a dict. Apollo
-    # (currently) dumps them out as a flat directory
-    files_table = {
-        filename.split(".")[0]: {
-            "src": os.path.join(os.path.abspath(src_dir), filename),
-            "dst": copy_unmatched_files_dir,
-        }
-        for filename in os.listdir(src_dir)
-        if filename.endswith(args.src_files_extension)
-    }
-
-    # Trawl through the dst tree and match by file prefix to find the dest file-path
-    for root, dirs, files in os.walk(dst_dir):
-        for fname in files:
-            key = fname.split(".")[0]
-            if key in files_table:
-                files_table[key]["dst"] = os.path.join(root, fname)
+    files_table = find_codegen_files(
+        src_dir, args.src_files_extension, copy_unmatched_files_dir
+    )
+    if args.dst_index:
+        dst_index = DstIndex(args.dst_index, dst_dir).load()
+        scanned = dst_index.refresh()
+        if args.debug:
+            print(
+                "Listed {} of {} directories in {}".format(
+                    scanned, len(dst_index.dirs), dst_dir
+                )
+            )
+        match_dst_files_indexed(files_table, dst_index)
+        dst_index.save()
+    else:
+        match_dst_files(files_table, dst_dir)
 
     # We now have a complete mapping of src->dst, just copy everything
-    for value in files_table.values():
-        src = value["src"]
-        dst = value["dst"]
-        if dst is None:
-            print("Error: codegen file {} does not have a match in dst?".format(src))
-            continue
-
-        if not os.path.isdir(dst):
-            dst_dir = os.path.split(os.path.abspath(dst))[0]
-        else:
-            dst_dir = dst
-
-        src_fname = os.path.split(src)[1]
-        dst_fname = os.path.join(dst_dir, src_fname)
-        if args.debug:
-            print("Copying {} to {}".format(src, dst_fname))
-        shutil.copyfile(src, dst_fname)
+    copies, unmatched = plan_copies(files_table)
+    for src in unmatched:
+        print("Error: codegen file {} does not have a match in dst?".format(src))
+    written, skipped, errors = execute_copies(
+        copies,
+        link_mode=args.link_mode,
+        skip_unchanged=args.skip_unchanged,
+        debug=args.debug,
+        jobs=args.jobs,
+    )
+    for src, dst, error in errors:
+        print("Error: could not copy {} to {}: {}".format(src, dst, error))
+    print(
+        "Copied {} files, skipped {} unchanged, {} unmatched, {} failed".format(
+            written, skipped, len(unmatched), len(errors)
+        )
+    )
+    if errors:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,201 @@
+"""
+Opt-in per phase instrumentation of decomp, get_types and pipeline.
+
+With --profile or --stats-json PATH, each phase of a run records its
+wall time, CPU time, memory and counts like the number of Types, edges
+or Query files. --profile prints a table of the phases to stderr and
+--stats-json writes them as JSON:
+
+{"program": "decomp",
+ "phases": [{"phase": "schema_load",
+             "wall_s": 0.51,
+             "cpu_s": 0.49,
+             "peak_rss_kb": 136164,
+             "rss_growth_kb": 120340,
+             "counts": {"types": 5009}}, ...],
+ "total_wall_s": 1.2,
+ "total_cpu_s": 1.1}
+
+peak_rss_kb is the high-water mark of the process at the end of the
+phase, rss_growth_kb how much the phase raised it.
+
+"""
+
+__author__ = "prussell"
+
+import argparse
+import contextlib
+import json
+import sys
+import time
+import typing
+
+from lean_schema.cache import write_atomic
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_kb() -> typing.Optional[int]:
+    if resource is None:
+        return None
+
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB everywhere else
+    return usage // 1024 if sys.platform == "darwin" else usage
+
+
+class Phase(object):
+
+    __slots__ = ("name", "wall_s", "cpu_s", "peak_rss_kb", "rss_growth_kb", "counts")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.peak_rss_kb = None
+        self.rss_growth_kb = None
+        self.counts = {}
+
+    def count(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        return {
+            "phase": self.name,
+            "wall_s": round(self.wall_s, 6),
+            "cpu_s": round(self.cpu_s, 6),
+            "peak_rss_kb": self.peak_rss_kb,
+            "rss_growth_kb": self.rss_growth_kb,
+            "counts": self.counts,
+        }
+
+
+class NullPhase(Phase):
+    """Phase of a disabled Stats, ignores all counts"""
+
+    def count(self, **counts):
+        pass
+
+
+# The Stats that count_active adds to, see Stats.activate
+_active_stats = None
+
+
+class Stats(object):
+    """
+    Collects a Phase for each `with stats.phase(name)` block. A
+    disabled Stats records nothing and costs next to nothing.
+
+    """
+
+    def __init__(self, program: str, enabled: bool = True):
+        self.program = program
+        self.enabled = enabled
+        self.phases = []
+        self.current = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> typing.Iterator[Phase]:
+        if not self.enabled:
+            yield NullPhase(name)
+            return
+
+        phase = Phase(name)
+        outer, self.current = self.current, phase
+        rss_before = peak_rss_kb()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield phase
+        finally:
+            phase.cpu_s = time.process_time() - cpu_start
+            phase.wall_s = time.perf_counter() - wall_start
+            phase.peak_rss_kb = peak_rss_kb()
+            if rss_before is not None:
+                phase.rss_growth_kb = phase.peak_rss_kb - rss_before
+            self.current = outer
+            self.phases.append(phase)
+
+    def activate(self):
+        """
+        Make this the Stats that count_active adds to, for code that
+        doesn't have the Stats passed to it
+
+        """
+        global _active_stats
+        _active_stats = self if self.enabled else None
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "program": self.program,
+            "phases": [phase.to_dict() for phase in self.phases],
+            "total_wall_s": round(sum(phase.wall_s for phase in self.phases), 6),
+            "total_cpu_s": round(sum(phase.cpu_s for phase in self.phases), 6),
+        }
+
+    def format_table(self) -> str:
+        lines = [
+            "{:<24}{:>10}{:>10}{:>14}{:>14}  {}".format(
+                "phase", "wall (s)", "cpu (s)", "peak RSS (KB)", "growth (KB)", "counts"
+            )
+        ]
+        for phase in self.phases:
+            lines.append(
+                "{:<24}{:>10.3f}{:>10.3f}{:>14}{:>14}  {}".format(
+                    phase.name,
+                    phase.wall_s,
+                    phase.cpu_s,
+                    str(phase.peak_rss_kb),
+                    str(phase.rss_growth_kb),
+                    " ".join(
+                        "{}={}".format(key, value)
+                        for key, value in sorted(phase.counts.items())
+                    ),
+                )
+            )
+        return "\n".join(lines)
+
+    def report(self, profile: bool = False, stats_json: str = None):
+        if not self.enabled:
+            return
+
+        if profile:
+            print(self.format_table(), file=sys.stderr)
+        if stats_json:
+            write_atomic(stats_json, json.dumps(self.to_dict(), indent=2))
+
+
+def count_active(**counts):
+    """
+    Add counts to the current phase of the active Stats, if any
+
+    """
+    stats = _active_stats
+    if stats is not None and stats.current is not None:
+        stats.current.count(**counts)
+
+
+def add_stats_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--profile",
+        help="Print the wall time, CPU time, memory and counts of each phase to stderr",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--stats-json",
+        metavar="PATH",
+        help="Write the wall time, CPU time, memory and counts of each phase to PATH as JSON",
+    )
+
+
+def stats_from_args(program: str, args: argparse.Namespace) -> Stats:
+    return Stats(program, enabled=args.profile or bool(args.stats_json)).activate()
+
+
+def report_from_args(stats: Stats, args: argparse.Namespace):
+    stats.report(profile=args.profile, stats_json=args.stats_json)
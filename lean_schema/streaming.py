@@ -0,0 +1,183 @@
+"""
+Streaming scan of Introspection format Schema files.
+
+json.load keeps the whole Schema in memory as Python objects, which
+for large Schemas is many times the size of the file. scan_schema
+reads the file in chunks and decodes the entries of __schema.types
+one at a time, handing each to a callback along with its byte span in
+the file. The callback can keep whatever it needs and let the rest go;
+any Type can be decoded again later with load_span.
+
+"""
+
+__author__ = "prussell"
+
+import codecs
+import json
+import re
+import typing
+
+CHUNK_SIZE = 1 << 20
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+DECODER = json.JSONDecoder()
+
+
+class Span(typing.NamedTuple):
+    """Byte offset and length of a JSON value in a file"""
+
+    start: int
+    length: int
+
+
+def load_span(file_path: str, span: Span):
+    with open(file_path, "rb") as ifile:
+        ifile.seek(span.start)
+        return json.loads(ifile.read(span.length))
+
+
+def utf8_len(text: str, start: int, end: int) -> int:
+    segment = text[start:end]
+    return len(segment) if segment.isascii() else len(segment.encode("utf-8"))
+
+
+class Scanner(object):
+    """
+    Just enough of a JSON tokenizer to walk objects and arrays
+    without decoding them, while keeping track of the byte offset in
+    the file. Values are decoded with the C accelerated raw_decode.
+
+    """
+
+    def __init__(self, ifile: typing.BinaryIO, chunk_size: int = CHUNK_SIZE):
+        self.ifile = ifile
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        # Byte offset in the file of self.buf[self.pos]
+        self.offset = 0
+        self.eof = False
+
+    def fill(self, size: int = None):
+        data = self.ifile.read(size or self.chunk_size)
+        self.eof = not data
+        self.buf = self.buf[self.pos :] + self.decoder.decode(data, final=self.eof)
+        self.pos = 0
+
+    def skip_whitespace(self):
+        while True:
+            end = WHITESPACE.match(self.buf, self.pos).end()
+            self.offset += end - self.pos
+            self.pos = end
+            if self.pos < len(self.buf) or self.eof:
+                return
+            self.fill()
+
+    def peek(self) -> str:
+        self.skip_whitespace()
+        return self.buf[self.pos] if self.pos < len(self.buf) else ""
+
+    def expect(self, token: str):
+        if self.peek() != token:
+            raise ValueError(
+                "Invalid Schema JSON, expected '{}' at byte {}".format(
+                    token, self.offset
+                )
+            )
+        self.pos += 1
+        self.offset += 1
+
+    def decode_value(self) -> typing.Tuple[typing.Any, Span]:
+        """
+        Decode the next JSON value, reading more of the file until
+        the whole value is in the buffer
+
+        """
+        size = self.chunk_size
+        while True:
+            self.skip_whitespace()
+            try:
+                value, end = DECODER.raw_decode(self.buf, self.pos)
+                # A number could continue past the end of the buffer
+                if end < len(self.buf) or self.eof:
+                    break
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill(size)
+            size *= 2
+
+        span = Span(self.offset, utf8_len(self.buf, self.pos, end))
+        self.offset += span.length
+        self.pos = end
+        return value, span
+
+
+def scan_types(scanner: Scanner, on_type: typing.Callable[[dict, Span], None]):
+    scanner.expect("[")
+    if scanner.peek() == "]":
+        scanner.expect("]")
+        return
+
+    while True:
+        on_type(*scanner.decode_value())
+        if scanner.peek() == ",":
+            scanner.expect(",")
+        else:
+            scanner.expect("]")
+            return
+
+
+def scan_object(
+    scanner: Scanner, on_type: typing.Callable[[dict, Span], None], in_schema=False
+) -> dict:
+    """
+    Decode a JSON object, except for the __schema.types array which
+    is streamed to on_type and left empty
+
+    """
+    obj = {}
+    scanner.expect("{")
+    if scanner.peek() == "}":
+        scanner.expect("}")
+        return obj
+
+    while True:
+        key, _ = scanner.decode_value()
+        scanner.expect(":")
+        if in_schema and key == "types" and scanner.peek() == "[":
+            scan_types(scanner, on_type)
+            obj[key] = []
+        elif not in_schema and key in ("data", "__schema") and scanner.peek() == "{":
+            obj[key] = scan_object(scanner, on_type, in_schema=key == "__schema")
+        else:
+            obj[key], _ = scanner.decode_value()
+
+        if scanner.peek() == ",":
+            scanner.expect(",")
+        else:
+            scanner.expect("}")
+            return obj
+
+
+def scan_schema(
+    file_path: str,
+    on_type: typing.Callable[[dict, Span], None],
+    chunk_size: int = CHUNK_SIZE,
+) -> dict:
+    """
+    Scan a Schema file, calling on_type(type_dict, span) for each
+    entry of __schema.types.
+
+    return: the rest of the Schema, with an empty __schema.types list
+
+    """
+    with open(file_path, "rb") as ifile:
+        scanner = Scanner(ifile, chunk_size)
+        schema = scan_object(scanner, on_type)
+        if scanner.peek() != "":
+            raise ValueError(
+                "Invalid Schema JSON, extra data at byte {}".format(scanner.offset)
+            )
+
+    return schema
@@ -1,4 +1,7 @@
+import functools
+
 from graphql.language.visitor import Visitor
+from graphql.type import get_named_type
 
 
 class AllTypesVisitor(Visitor):
@@ -7,36 +10,78 @@ class AllTypesVisitor(Visitor):
     a single Set. Abstract types are expanded in get_types.py, then the
     entire Root Set is passed to decomp.py to create the actual sub-graph.
 
+    The selected fields are collected as (parent Type name, field name)
+    pairs, for decomp to keep them when it prunes or strips fields,
+    along with the enum values used as literals as (Enum name, value
+    name) pairs, and the names of spread Fragments so they can be
+    resolved across documents.
+
+    The context is the ValidationContext of the document, or the
+    TypeInfo that visits it, which has the same Type getters.
+
+    Only the kinds of nodes that make the TypeInfo enter a new Type are
+    handled, and each only looks up the Type it entered: an Operation,
+    Fragment or Field enters an output Type, a SelectionSet a parent
+    Type, and a Variable definition, Argument, List value or Object
+    field an input Type. Every Type the TypeInfo is ever in is entered
+    by one of those nodes, so this finds the same Types as looking up
+    all four of them at every node. There must be no generic enter,
+    or it would be called for all other nodes.
+
     """
 
     __slots__ = ("context",)
 
     def __init__(self, context):
         self.types = set()
+        self.fields = set()
+        self.spreads = set()
         self.context = context
+        self.num_nodes = 0
 
-    def enter(
-        self,
-        node,  # type: Field
-        key,  # type: int
-        parent,  # type: Union[List[Union[Field, InlineFragment]], List[Field]]
-        path,  # type: List[Union[int, str]]
-        ancestors,  # type: List[Any]
-    ):
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def get_visit_fn(cls, kind, is_leaving=False):
+        # TypeInfoVisitor looks up the enter and leave functions of
+        # every node, and most kinds have neither
+        return super().get_visit_fn(kind, is_leaving)
+
+    def enter_operation_definition(self, node, *args):
+        self.num_nodes += 1
         self.types.add(self.context.get_type())
-        self.types.add(self.context.get_input_type())
+
+    enter_fragment_definition = enter_operation_definition
+    enter_inline_fragment = enter_operation_definition
+
+    def enter_selection_set(self, node, *args):
+        self.num_nodes += 1
         self.types.add(self.context.get_parent_type())
-        self.types.add(self.context.get_parent_input_type())
-
-    def enter_FragmentSpread(
-        self,
-        node,  # type: Field
-        key,  # type: int
-        parent,  # type: Union[List[Union[Field, InlineFragment]], List[Field]]
-        path,  # type: List[Union[int, str]]
-        ancestors,  # type: List[Any]
-    ):
-        fragName = node.name.value
-        fragType = self.context.getFragmentType(fragName)
-        if fragType:
-            self.types.add(fragType)
+
+    def enter_field(self, node, *args):
+        self.num_nodes += 1
+        self.types.add(self.context.get_type())
+        parent_type = self.context.get_parent_type()
+        field_name = node.name.value
+        if parent_type is not None and not field_name.startswith("__"):
+            self.fields.add((parent_type.name, field_name))
+
+    def enter_variable_definition(self, node, *args):
+        self.num_nodes += 1
+        self.types.add(self.context.get_input_type())
+
+    enter_argument = enter_variable_definition
+    enter_list_value = enter_variable_definition
+    enter_object_field = enter_variable_definition
+
+    def enter_enum_value(self, node, *args):
+        # Its Enum was entered by the Argument, List value, Object
+        # field or Variable definition it's in
+        self.num_nodes += 1
+        enum_type = get_named_type(self.context.get_input_type())
+        if enum_type is not None:
+            self.fields.add((enum_type.name, node.value))
+
+    def enter_fragment_spread(self, node, *args):
+        # The Fragment is visited where it's defined, see
+        # get_types.FragmentIndex
+        self.spreads.add(node.name.value)
@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from lean_schema import daemon, decomp, pipeline
+
+SWAPI_SCHEMA_PATH = "tests/swapi_schema.json"
+SWAPI_QUERIES_PATH = "tests/swapi_queries"
+TYPES_FILE_PATH = "tests/types.yaml"
+
+
+@pytest.fixture
+def queries_dir(tmp_path):
+    queries_dir = str(tmp_path / "queries")
+    shutil.copytree(SWAPI_QUERIES_PATH, queries_dir)
+    return queries_dir
+
+
+def expected_output(queries_dir):
+    schema = pipeline.run(
+        SWAPI_SCHEMA_PATH,
+        queries_dir,
+        types_file=decomp.load_types_file(TYPES_FILE_PATH),
+        prune_fields=True,
+    )
+    return json.loads(json.dumps(schema))
+
+
+def load_output(output_path):
+    with open(output_path) as ifile:
+        return json.load(ifile)
+
+
+def test_refresh_matches_pipeline(queries_dir, tmp_path):
+    output_path = str(tmp_path / "lean_schema.json")
+    lean_schema_daemon = daemon.LeanSchemaDaemon(
+        SWAPI_SCHEMA_PATH,
+        queries_dir,
+        output_path,
+        types_file_path=TYPES_FILE_PATH,
+        prune_fields=True,
+    )
+    assert lean_schema_daemon.refresh()
+    assert load_output(output_path) == expected_output(queries_dir)
+    # Nothing changed
+    assert not lean_schema_daemon.refresh()
+
+    with open(os.path.join(queries_dir, "starship.graphql"), "w") as ofile:
+        ofile.write(
+            'query Starship {\n  starship(id: "1") {\n    coordinates\n  }\n}\n'
+        )
+    assert lean_schema_daemon.refresh()
+    output = load_output(output_path)
+    assert output == expected_output(queries_dir)
+    starship = [T for T in output["__schema"]["types"] if T["name"] == "Starship"][0]
+    assert {field["name"] for field in starship["fields"]} >= {"coordinates"}
+
+    # The loaded Schema is never modified
+    os.remove(output_path)
+    assert lean_schema_daemon.refresh()
+    assert load_output(output_path) == output
+
+
+def test_wait_and_stop(queries_dir, tmp_path):
+    output_path = str(tmp_path / "lean_schema.json")
+    socket_path = str(tmp_path / "daemon.sock")
+    lean_schema_daemon = daemon.LeanSchemaDaemon(
+        SWAPI_SCHEMA_PATH, queries_dir, output_path
+    )
+    thread = threading.Thread(
+        target=daemon.serve, args=(lean_schema_daemon, socket_path, 60)
+    )
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not daemon.is_listening(socket_path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    try:
+        assert daemon.main(["wait", "--socket", socket_path]) == 0
+        assert os.path.isfile(output_path)
+
+        with open(os.path.join(queries_dir, "broken.graphql"), "w") as ofile:
+            ofile.write("query Broken {\n")
+        # Not the next poll, a wait refreshes right away
+        assert daemon.main(["wait", "--socket", socket_path, "--timeout", "10"]) == 1
+        os.remove(os.path.join(queries_dir, "broken.graphql"))
+        assert daemon.main(["wait", "--socket", socket_path]) == 0
+    finally:
+        assert daemon.main(["stop", "--socket", socket_path]) == 0
+        thread.join(10)
+
+    assert not thread.is_alive()
+    assert not os.path.exists(socket_path)
+    assert daemon.main(["wait", "--socket", socket_path]) == 2
@@ -1,5 +1,8 @@
 from lean_schema import decomp
+from lean_schema.cache import GraphCache, digest_bytes, load_schema_with_digest
+from lean_schema.graph import CompactGraph
 from unittest import mock
+import io
 import json
 import os
 
@@ -26,11 +29,298 @@ def test_get_types_from_file():
 
 @mock.patch("sys.stdin")
 @mock.patch("builtins.print")
-def test_main(print_mock, stdin_mock):
+def test_main(print_mock, stdin_mock, tmp_path):
     stdin_mock.fileno = lambda: 2
     stdin_mock.read = lambda: json.dumps({"types": ["Human"]})
-    args = [SWAPI_SCHEMA_PATH, "--log-level=DEBUG"]
+    args = [
+        SWAPI_SCHEMA_PATH,
+        "--no-cache",
+        "--log-level=DEBUG",
+        "--log-file",
+        str(tmp_path / "log.decomp"),
+    ]
     subschema = decomp.main(args)
     subgraph = decomp.mk_graph_from_schema(subschema)
     assert print_mock.call_count == 1
     assert "Human" in subgraph
+
+
+def test_build_graph_uses_cache(tmp_path):
+    graph_cache = GraphCache(str(tmp_path))
+    schema, digest = load_schema_with_digest(SWAPI_SCHEMA_PATH)
+    cold, cold_scalars = decomp.build_graph(schema, graph_cache, digest)
+    assert os.path.isfile(graph_cache.path_for(digest))
+
+    with mock.patch.object(decomp, "index_schema") as index_schema_mock:
+        warm, warm_scalars = decomp.build_graph(schema, graph_cache, digest)
+    assert index_schema_mock.call_count == 0
+    assert warm_scalars == cold_scalars
+    assert warm.keys() == cold.keys()
+    for key in cold:
+        assert warm[key].value is cold[key].value
+        assert warm[key].outbound == cold[key].outbound
+        assert warm[key].inbound == cold[key].inbound
+
+
+def test_build_graph_ignores_bad_cache_entries(tmp_path):
+    graph_cache = GraphCache(str(tmp_path))
+    schema, digest = load_schema_with_digest(SWAPI_SCHEMA_PATH)
+    with open(graph_cache.path_for(digest), "w") as ofile:
+        ofile.write('{"version": ')
+    assert graph_cache.get(digest) is None
+
+    graph, _ = decomp.build_graph(schema, graph_cache, digest)
+    assert "Human" in graph
+    # A different Schema never matches the entry for this one
+    assert graph_cache.get(digest_bytes(b"{}")) is None
+    assert graph_cache.get(digest)["digest"] == digest
+
+
+def test_graph_cache_prunes_other_format_versions(tmp_path):
+    graph_cache = GraphCache(str(tmp_path))
+    schema, digest = load_schema_with_digest(SWAPI_SCHEMA_PATH)
+    stale = ["graph-v1-{}.json".format(digest), "graph-v2-{}.json".format("0" * 64)]
+    for fname in stale + ["other.json"]:
+        (tmp_path / fname).write_text("{}")
+
+    decomp.build_graph(schema, graph_cache, digest)
+    assert sorted(os.listdir(str(tmp_path))) == sorted(
+        [os.path.basename(graph_cache.path_for(digest)), "other.json"]
+    )
+
+
+def types_by_name(schema):
+    return {T["name"]: T for T in schema["__schema"]["types"]}
+
+
+@mock.patch("sys.stdin")
+@mock.patch("builtins.print")
+def test_main_streaming_matches_json_load(print_mock, stdin_mock, tmp_path):
+    stdin_mock.fileno = lambda: 2
+    stdin_mock.read = lambda: json.dumps({"types": ["Human", "ReviewInput"]})
+    args = [
+        SWAPI_SCHEMA_PATH,
+        "--input-object-depth-level=1",
+        "--log-file",
+        str(tmp_path / "log.decomp"),
+    ]
+    expected = decomp.main(args + ["--no-cache"])
+
+    for _ in range(2):
+        # Cold, then warm from the cached spans
+        subschema = decomp.main(args + ["--streaming", "--cache-dir", str(tmp_path)])
+        assert types_by_name(subschema) == types_by_name(expected)
+        assert subschema["__schema"]["queryType"] == {"name": "Query"}
+
+
+def test_load_schema_streaming_only_decodes_subgraph():
+    schema, graph, scalars = decomp.load_schema_streaming(SWAPI_SCHEMA_PATH)
+    expected = decomp.mk_graph_from_schema(decomp.load_schema(SWAPI_SCHEMA_PATH))
+
+    assert schema["__schema"]["types"] == []
+    assert scalars == decomp.all_scalar_types(decomp.load_schema(SWAPI_SCHEMA_PATH))
+    for key in expected:
+        assert graph[key].outbound == expected[key].outbound
+        assert graph[key].kind == expected[key].kind
+        assert graph[key]._value is None
+    assert graph["Human"].value == expected["Human"].value
+
+
+def test_outbound_type_refs_follow_introspection_shape():
+    types = types_by_name(decomp.load_schema(SWAPI_SCHEMA_PATH))
+
+    assert set(decomp.get_outbound_type_refs(types["Human"])) == {
+        "Character",
+        "Episode",
+        "FriendsConnection",
+        "LengthUnit",
+        "Starship",
+    }
+    assert set(decomp.get_outbound_type_refs(types["SearchResult"])) == {
+        "Human",
+        "Droid",
+        "Starship",
+    }
+    assert decomp.type_scalar_types(types["Starship"]) == {"ID", "String", "Float"}
+
+
+def test_update_type_refs_replaces_refs_outside_subgraph():
+    human = types_by_name(decomp.load_schema(SWAPI_SCHEMA_PATH))["Human"]
+    decomp.update_type_refs(
+        human, None, {"Human", "Character"}, scalars_dict={"Float": "Double"}
+    )
+    fields = {f["name"]: f for f in human["fields"]}
+
+    starship_ref = decomp.unwrap_type_ref(fields["starships"]["type"])
+    assert starship_ref["name"] == "GraphQLObjectTypeRef"
+    assert starship_ref["typeref_name"] == "Starship"
+    assert decomp.unwrap_type_ref(fields["friends"]["type"])["name"] == "Character"
+    assert fields["mass"]["type"]["name"] == "Double"
+
+
+def test_index_schema_records_reference_sites():
+    schema = decomp.load_schema(SWAPI_SCHEMA_PATH)
+    graph, scalars = decomp.index_schema(schema)
+    assert scalars == decomp.all_scalar_types(schema)
+
+    human = graph["Human"]
+    assert human.outbound == list(
+        dict.fromkeys(decomp.get_outbound_type_refs(human.value))
+    )
+    assert "Human" in graph["Character"].inbound
+
+    # Patching the recorded sites is the same as walking the Type again
+    decomp.update_type_refs(
+        human.value, graph, {"Human"}, refs=human.refs, scalars_dict={"Float": "Double"}
+    )
+    assert all(
+        K.endswith("TypeRef") for K in decomp.get_outbound_type_refs(human.value)
+    )
+    assert "Double" in decomp.type_scalar_types(human.value)
+
+
+def test_get_types_from_file_domain_depth():
+    G = decomp.mk_graph_from_schema(decomp.load_schema(SWAPI_SCHEMA_PATH))
+    compact = CompactGraph.from_adjacency(G)
+
+    R = decomp.get_types_from_file(compact, {"domains": ["Starship"]})
+    assert R == {"Starship"}
+    R = decomp.get_types_from_file(compact, {"domains": [{"Starship": {"depth": 1}}]})
+    assert R == decomp.get_neighboring_types(G, "Starship", 1)
+    assert decomp.get_types_from_file(G, {"domains": [{"Starship": {"depth": 1}}]}) == R
+
+
+def test_decompose_strip_levels():
+    sizes = []
+    for level in decomp.STRIP_LEVELS:
+        schema = decomp.load_schema(SWAPI_SCHEMA_PATH)
+        lean = decomp.decompose(schema, input_types={"Human", "Query"}, strip=level)
+        sizes.append(len(json.dumps(lean)))
+        types = {T["name"]: T for T in lean["__schema"]["types"]}
+        human_fields = {f["name"]: f for f in types["Human"]["fields"]}
+
+        descriptions = [T["description"] for T in types.values()] + [
+            f["description"] for f in human_fields.values()
+        ]
+        if level == "none":
+            assert any(descriptions)
+        else:
+            assert not any(descriptions)
+
+        # Starship is outside the sub-graph
+        if level == "unused-fields":
+            assert "starships" not in human_fields
+            assert "friends" not in human_fields
+            assert "name" in human_fields
+        else:
+            assert "starships" in human_fields
+
+    assert sizes == sorted(sizes, reverse=True)
+    assert sizes[0] > sizes[-1]
+
+
+def test_decompose_strip_leaves_language_types_unchanged():
+    decomp.decompose(
+        decomp.load_schema(SWAPI_SCHEMA_PATH),
+        input_types={"Human"},
+        strip="descriptions",
+    )
+    lean = decomp.decompose(
+        decomp.load_schema(SWAPI_SCHEMA_PATH), input_types={"Human"}
+    )
+    decimal = decomp.SwiftLanguage.additional_types["Decimal"]
+    assert decimal["description"] is not None
+    assert types_by_name(lean)["Decimal"]["description"] == decimal["description"]
+
+
+def test_decompose_prune_fields():
+    from lean_schema import get_types
+    import graphql
+
+    client_schema = get_types.load_schema(SWAPI_SCHEMA_PATH)
+    selected_fields = {}
+    input_types = get_types.get_types(
+        "tests/swapi_queries", client_schema, fields=selected_fields
+    )
+    schema = decomp.load_schema(SWAPI_SCHEMA_PATH)
+    lean = decomp.decompose(
+        schema,
+        types_file={"types": ["Droid"]},
+        input_types=input_types,
+        selected_fields=selected_fields,
+        prune=True,
+    )
+    types = {T["name"]: T for T in lean["__schema"]["types"]}
+
+    def field_names(key):
+        return {f["name"] for f in types[key]["fields"]}
+
+    assert field_names("Query") == {"hero", "search"}
+    assert field_names("Mutation") == {"createReview"}
+    assert field_names("Character") == {"name", "friends"}
+    # Implementations keep the fields of their Interfaces
+    assert field_names("Human") == {"name", "friends"}
+    assert field_names("Starship") == {"name", "length"}
+    # Types from the Types file are never pruned
+    assert "primaryFunction" in field_names("Droid")
+    # Neither are InputObjects
+    assert len(types["ReviewInput"]["inputFields"]) == 3
+
+    # No Query subscribes, so the Subscription Type isn't in the Lean Schema
+    lean["__schema"]["subscriptionType"] = None
+    lean_schema = graphql.build_client_schema(lean)
+    lean_schema._validation_errors = []
+    for path in get_types.find_document_files("tests/swapi_queries"):
+        with open(path) as ifile:
+            document = graphql.parse(ifile.read())
+        assert graphql.validate(lean_schema, document) == []
+
+
+def test_possible_types_index_matches_get_types():
+    from lean_schema import get_types
+
+    graph = decomp.mk_graph_from_schema(decomp.load_schema(SWAPI_SCHEMA_PATH))
+    index = decomp.index_possible_types(graph)
+    assert index["Character"] == {"Human", "Droid"}
+    assert index["SearchResult"] == {"Human", "Droid", "Starship"}
+    client_schema = get_types.load_schema(SWAPI_SCHEMA_PATH)
+    assert get_types.get_possible_types_index(client_schema) == index
+
+
+def test_decompose_incremental_matches_full(tmp_path):
+    from lean_schema import output
+
+    def render(schema):
+        ofile = io.BytesIO()
+        output.write_schema(ofile, schema)
+        return ofile.getvalue()
+
+    state_path = str(tmp_path / "decomp.state")
+    state = decomp.DecompState(state_path, strip="unused-fields").load("digest")
+    for input_types in [
+        {"Human"},
+        # Starship enters the sub-graph, so Human's refs to it are restored
+        {"Human", "Starship"},
+        {"Human", "Starship"},
+        {"Droid", "ReviewInput"},
+    ]:
+        kwargs = dict(input_types=input_types, strip="unused-fields")
+        expected = render(
+            decomp.decompose(decomp.load_schema(SWAPI_SCHEMA_PATH), **kwargs)
+        )
+        previous_types = dict(state.types)
+        lean = decomp.decompose(
+            decomp.load_schema(SWAPI_SCHEMA_PATH), state=state, **kwargs
+        )
+        assert render(lean) == expected
+        if previous_types:
+            # Scalars never reference a Type that enters or leaves the sub-graph
+            assert state.types["String"] is previous_types["String"]
+        state.save()
+
+    loaded = decomp.DecompState(state_path, strip="unused-fields").load("digest")
+    assert loaded.types == state.types
+    assert loaded.subgraph == state.subgraph
+    # The state of another Schema or for other options is never used
+    assert decomp.DecompState(state_path, strip="unused-fields").load("x").types == {}
+    assert decomp.DecompState(state_path).load("digest").types == {}
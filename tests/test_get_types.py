@@ -3,3 +3,264 @@ import pytest
 from lean_schema.get_types import main
 from unittest import mock
 import lean_schema
+from lean_schema import get_types
+from lean_schema.cache import ParseCache, QueryManifest
+import json
+import os
+import shutil
+
+SWAPI_SCHEMA_PATH = "tests/swapi_schema.json"
+SWAPI_QUERIES_PATH = "tests/swapi_queries"
+
+
+@pytest.fixture(scope="module")
+def schema():
+    return get_types.load_schema(SWAPI_SCHEMA_PATH)
+
+
+@pytest.fixture
+def queries_dir(tmp_path):
+    queries_dir = str(tmp_path / "queries")
+    shutil.copytree(SWAPI_QUERIES_PATH, queries_dir)
+    return queries_dir
+
+
+def test_main():
+    output = json.loads(main([SWAPI_SCHEMA_PATH, SWAPI_QUERIES_PATH]))
+    assert {"Query", "Character", "Human", "Droid", "ReviewInput"} <= set(
+        output["types"]
+    )
+
+
+def test_incremental_get_types_matches_cold_run(schema, queries_dir, tmp_path):
+    manifest_path = str(tmp_path / "manifest.json")
+
+    def incremental():
+        return get_types.get_types(
+            queries_dir, schema, manifest=QueryManifest(manifest_path, "digest")
+        )
+
+    assert incremental() == get_types.get_types(queries_dir, schema)
+
+    # Nothing changed, so nothing is parsed
+    with mock.patch("graphql.parse") as parse_mock:
+        incremental()
+    assert parse_mock.call_count == 0
+
+    # Only the modified file is parsed
+    with open(os.path.join(queries_dir, "search.graphql"), "w") as ofile:
+        ofile.write("query { starship(id: 1) { name } }")
+    with mock.patch("graphql.parse", wraps=get_types.graphql.parse) as parse_mock:
+        type_names = incremental()
+    assert parse_mock.call_count == 1
+    assert type_names == get_types.get_types(queries_dir, schema)
+    assert "SearchResult" not in type_names
+
+    # Deleted files drop their Types
+    shutil.rmtree(os.path.join(queries_dir, "reviews"))
+    type_names = incremental()
+    assert type_names == get_types.get_types(queries_dir, schema)
+    assert "ReviewInput" not in type_names
+
+
+def test_incremental_get_types_ignores_manifest_for_other_schema(
+    schema, queries_dir, tmp_path
+):
+    manifest_path = str(tmp_path / "manifest.json")
+    get_types.get_types(
+        queries_dir, schema, manifest=QueryManifest(manifest_path, "digest")
+    )
+
+    with mock.patch("graphql.parse", wraps=get_types.graphql.parse) as parse_mock:
+        get_types.get_types(
+            queries_dir, schema, manifest=QueryManifest(manifest_path, "other")
+        )
+    assert parse_mock.call_count == 3
+
+
+def test_parallel_get_types_matches_serial(schema, queries_dir, tmp_path):
+    serial = get_types.get_types(queries_dir, schema)
+    parallel = get_types.get_types(
+        queries_dir, schema, jobs=2, schema_path=SWAPI_SCHEMA_PATH
+    )
+    assert parallel == serial
+
+    manifest = QueryManifest(str(tmp_path / "manifest.json"), "digest")
+    incremental = get_types.get_types(
+        queries_dir, schema, manifest=manifest, jobs=2, schema_path=SWAPI_SCHEMA_PATH
+    )
+    assert incremental == serial
+
+
+def test_main_sorted_output():
+    output = json.loads(main([SWAPI_SCHEMA_PATH, SWAPI_QUERIES_PATH, "--sorted"]))
+    assert output["types"] == sorted(output["types"])
+
+
+def test_selected_fields(schema, queries_dir, tmp_path):
+    output = json.loads(main([SWAPI_SCHEMA_PATH, SWAPI_QUERIES_PATH]))
+    assert "hero" in output["fields"]["Query"]
+    assert "length" in output["fields"]["Starship"]
+    assert all(
+        not name.startswith("__")
+        for field_names in output["fields"].values()
+        for name in field_names
+    )
+
+    serial = {}
+    get_types.get_types(queries_dir, schema, fields=serial)
+    parallel = {}
+    get_types.get_types(
+        queries_dir, schema, jobs=2, schema_path=SWAPI_SCHEMA_PATH, fields=parallel
+    )
+    assert parallel == serial
+
+    manifest_path = str(tmp_path / "manifest.json")
+    for _ in range(2):
+        incremental = {}
+        get_types.get_types(
+            queries_dir,
+            schema,
+            manifest=QueryManifest(manifest_path, "digest"),
+            fields=incremental,
+        )
+        assert incremental == serial
+
+
+def test_parse_cache(schema, queries_dir, tmp_path):
+    cold_fields = {}
+    cold = get_types.get_types(queries_dir, schema, fields=cold_fields)
+
+    parse_cache = ParseCache(str(tmp_path / "cache"))
+    fields = {}
+    assert (
+        get_types.get_types(queries_dir, schema, fields=fields, parse_cache=parse_cache)
+        == cold
+    )
+    assert fields == cold_fields
+    entries = os.listdir(parse_cache.cache_dir)
+    assert len(entries) == len(get_types.find_document_files(queries_dir))
+
+    # All documents come from the cache now
+    with mock.patch("graphql.parse", side_effect=AssertionError):
+        fields = {}
+        assert (
+            get_types.get_types(
+                queries_dir, schema, fields=fields, parse_cache=parse_cache
+            )
+            == cold
+        )
+        assert fields == cold_fields
+
+    # The least recently used documents are evicted first
+    paths = sorted(os.path.join(parse_cache.cache_dir, entry) for entry in entries)
+    for i, path in enumerate(paths):
+        os.utime(path, ns=(i * 10**9, i * 10**9))
+    assert parse_cache.prune(max_bytes=os.path.getsize(paths[-1])) == len(paths) - 1
+    assert os.listdir(parse_cache.cache_dir) == [os.path.basename(paths[-1])]
+
+
+def test_incremental_get_types_hashes_changed_files_once(schema, queries_dir, tmp_path):
+    parse_cache = ParseCache(str(tmp_path / "cache"))
+    cold = get_types.get_types(queries_dir, schema, parse_cache=parse_cache)
+
+    manifest = QueryManifest(str(tmp_path / "manifest.json"), "digest")
+    with mock.patch(
+        "lean_schema.cache.digest_bytes", side_effect=AssertionError
+    ), mock.patch("graphql.parse", side_effect=AssertionError):
+        assert (
+            get_types.get_types(
+                queries_dir, schema, manifest=manifest, parse_cache=parse_cache
+            )
+            == cold
+        )
+
+
+def test_all_types_visitor_matches_generic_lookup(schema):
+    from graphql.language import visit
+    from graphql.language.visitor import TypeInfoVisitor, Visitor
+    from graphql.utilities import TypeInfo
+
+    class GenericVisitor(Visitor):
+        def __init__(self, type_info):
+            self.type_info = type_info
+            self.types = set()
+
+        def enter(self, node, *args):
+            self.types.add(self.type_info.get_type())
+            self.types.add(self.type_info.get_input_type())
+            self.types.add(self.type_info.get_parent_type())
+            self.types.add(self.type_info.get_parent_input_type())
+
+    for path in get_types.find_document_files(SWAPI_QUERIES_PATH):
+        document = get_types.parse_document_file(path)
+        type_info = TypeInfo(schema)
+        expected = set()
+        for definition in document.definitions:
+            visitor = GenericVisitor(type_info)
+            visit(definition, TypeInfoVisitor(type_info, visitor))
+            expected.update(str(T) for T in visitor.types if T)
+
+        types = get_types.visit_document(document, schema)
+        assert {str(T) for T in types if T} == expected
+
+
+def test_fragment_index_resolves_spreads_across_files(schema, tmp_path):
+    fragment = "fragment HumanHeight on Human {\n  height\n}\n"
+    (tmp_path / "fragments.graphql").write_text(fragment)
+    (tmp_path / "hero.graphql").write_text(
+        "query Hero {\n  hero {\n    ...HumanHeight\n  }\n}\n"
+    )
+    # The same Fragment, copied into another document
+    (tmp_path / "human.graphql").write_text(
+        'query Human {\n  human(id: "1") {\n    ...HumanHeight\n  }\n}\n' + fragment
+    )
+
+    index = get_types.FragmentIndex(schema)
+    documents = [
+        get_types.parse_document_file(str(tmp_path / name))
+        for name in ("fragments.graphql", "hero.graphql", "human.graphql")
+    ]
+    for document in documents:
+        index.add_document(document)
+    assert len(index.fragments["HumanHeight"]) == 1
+
+    fields = {}
+    types = get_types.visit_document(documents[1], schema, fields, index)
+    assert "Human" in {str(T) for T in types}
+    assert fields == {"Query": {"hero"}, "Human": {"height"}}
+    # Without the index, the spread can't be resolved
+    fields = {}
+    types = get_types.visit_document(documents[1], schema, fields)
+    assert "Human" not in {str(T) for T in types}
+    assert fields == {"Query": {"hero"}}
+
+    # Visiting each file on its own gives the same result
+    fields = {}
+    per_file_fields = {}
+    assert get_types.get_types(str(tmp_path), schema, fields=fields) == (
+        get_types.get_types(
+            str(tmp_path),
+            schema,
+            manifest=QueryManifest(str(tmp_path / "manifest.json"), "digest"),
+            fields=per_file_fields,
+        )
+    )
+    assert fields == per_file_fields
+
+
+def test_visit_documents_matches_visit_document(schema):
+    documents = [
+        get_types.parse_document_file(path)
+        for path in get_types.find_document_files(SWAPI_QUERIES_PATH)
+    ]
+    expected_fields = {}
+    expected = set()
+    for document in documents:
+        expected.update(get_types.visit_document(document, schema, expected_fields))
+
+    fields = {}
+    assert get_types.visit_documents(documents, schema, fields) == (
+        get_types.expand_types(expected, schema)
+    )
+    assert fields == expected_fields
@@ -0,0 +1,57 @@
+from lean_schema import decomp
+from lean_schema.graph import CompactGraph
+
+SWAPI_SCHEMA_PATH = "tests/swapi_schema.json"
+
+
+def test_bfs_matches_adjacency_list():
+    G = decomp.mk_graph_from_schema(decomp.load_schema(SWAPI_SCHEMA_PATH))
+    compact = CompactGraph.from_adjacency(G)
+
+    assert len(compact) == len(G)
+    assert set(compact) == set(G)
+    for key in G:
+        for depth in range(4):
+            assert compact.bfs(key, depth) == decomp.get_neighboring_types(
+                G, key, depth
+            )
+
+
+def test_edges_are_deduplicated():
+    G = {
+        "A": decomp.SchemaNode("A", {"kind": "OBJECT"}),
+        "B": decomp.SchemaNode("B", {"kind": "OBJECT"}),
+    }
+    G["A"].outbound = ["B", "B", "Missing", "B"]
+    compact = CompactGraph.from_adjacency(G)
+
+    assert compact.num_edges == 2
+    assert compact.neighbors("A") == ["B", "Missing"]
+    assert "Missing" not in compact
+    assert compact.bfs("A", 2) == {"A", "B", "Missing"}
+    assert compact.bfs("Nope", 1) == {"Nope"}
+
+
+def test_multi_bfs_matches_union_of_bfs():
+    G = decomp.mk_graph_from_schema(decomp.load_schema(SWAPI_SCHEMA_PATH))
+    compact = CompactGraph.from_adjacency(G)
+    keys = sorted(G)
+
+    for n in range(1, 6):
+        depths = {key: (i * n) % 4 for i, key in enumerate(keys[::n])}
+        depths["Nope"] = 2
+        expected = set()
+        for key, depth in depths.items():
+            expected.update(decomp.get_neighboring_types(G, key, depth))
+        assert compact.multi_bfs(depths) == expected
+        assert decomp.get_neighborhood(G, depths) == expected
+
+
+def test_names_with_prefix_matches_scan():
+    G = decomp.mk_graph_from_schema(decomp.load_schema(SWAPI_SCHEMA_PATH))
+    compact = CompactGraph.from_adjacency(G)
+
+    for prefix in ["", "S", "St", "Starship", "__", "Zzz"]:
+        assert compact.names_with_prefix(prefix) == sorted(
+            decomp.get_subtypes_of_domain(G, prefix, key_func=lambda d: d)
+        )
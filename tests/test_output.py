@@ -0,0 +1,46 @@
+from lean_schema import decomp, output
+import io
+import json
+
+SWAPI_SCHEMA_PATH = "tests/swapi_schema.json"
+
+
+def swapi_schema() -> dict:
+    schema = decomp.load_schema(SWAPI_SCHEMA_PATH)
+    # Non-ASCII and characters that need escaping
+    decomp.get_schema_types(schema)[0]["description"] = 'Café   "/\\\n'
+    return schema
+
+
+def test_write_schema_matches_json_dumps():
+    schema = swapi_schema()
+    for chunk_size in [1, 100, output.CHUNK_SIZE]:
+        ofile = io.BytesIO()
+        written = output.write_schema(ofile, schema, chunk_size=chunk_size)
+        expected = (json.dumps(schema) + "\n").encode("ascii")
+        assert ofile.getvalue() == expected
+        assert written == len(expected)
+
+
+def test_compact_output_is_the_same_for_all_backends():
+    schema = swapi_schema()
+    expected = (
+        json.dumps(schema, separators=(",", ":"), ensure_ascii=False) + "\n"
+    ).encode("utf-8")
+    for backend in ["json", "orjson", "ujson"]:
+        try:
+            output.get_compact_dumps(backend)
+        except ImportError:
+            continue
+        ofile = io.BytesIO()
+        output.write_schema(ofile, schema, compact=True, backend=backend)
+        assert ofile.getvalue() == expected
+
+
+def test_write_schema_file(tmp_path):
+    schema = swapi_schema()
+    path = str(tmp_path / "lean_schema.json")
+    output.write_schema_file(path, schema, compact=True)
+    with open(path, encoding="utf-8") as ifile:
+        assert json.load(ifile) == schema
+    assert [p.name for p in tmp_path.iterdir()] == ["lean_schema.json"]
@@ -0,0 +1,92 @@
+from lean_schema import decomp, get_types, pipeline
+from unittest import mock
+import json
+
+SWAPI_SCHEMA_PATH = "tests/swapi_schema.json"
+SWAPI_QUERIES_PATH = "tests/swapi_queries"
+
+
+def type_names(schema):
+    return {T["name"] for T in schema["__schema"]["types"]}
+
+
+def test_run_matches_get_types_piped_to_decomp():
+    schema = get_types.load_schema(SWAPI_SCHEMA_PATH)
+    piped_types = get_types.get_types(SWAPI_QUERIES_PATH, schema)
+    expected = decomp.decompose(
+        decomp.load_schema(SWAPI_SCHEMA_PATH), input_types=piped_types
+    )
+
+    lean_schema = pipeline.run(SWAPI_SCHEMA_PATH, SWAPI_QUERIES_PATH)
+
+    assert type_names(lean_schema) == type_names(expected)
+    assert {"Query", "Mutation", "Starship", "ReviewInput"} <= type_names(lean_schema)
+    assert "FriendsConnection" not in type_names(lean_schema)
+
+
+@mock.patch("builtins.print")
+def test_main(print_mock, tmp_path):
+    lean_schema = pipeline.main(
+        [
+            SWAPI_SCHEMA_PATH,
+            SWAPI_QUERIES_PATH,
+            "--no-cache",
+            "--log-file",
+            str(tmp_path / "log.decomp"),
+        ]
+    )
+    assert print_mock.call_count == 1
+    assert json.loads(print_mock.call_args[0][0]) == lean_schema
+
+
+def test_run_strip_deprecated_keeps_what_queries_use(tmp_path):
+    import graphql
+
+    with open(SWAPI_SCHEMA_PATH) as ifile:
+        schema = json.load(ifile)
+    deprecated = {
+        "Character": {"name"},
+        "Human": {"name", "height", "mass"},
+        "Droid": {"name"},
+        "LengthUnit": {"FOOT", "METER"},
+    }
+    for T in schema["__schema"]["types"]:
+        for item in (T.get("fields") or []) + (T.get("enumValues") or []):
+            if item["name"] in deprecated.get(T["name"], ()):
+                item["isDeprecated"] = True
+                item["deprecationReason"] = "Test"
+    schema_path = str(tmp_path / "schema.json")
+    with open(schema_path, "w") as ofile:
+        json.dump(schema, ofile)
+
+    queries_dir = tmp_path / "queries"
+    queries_dir.mkdir()
+    query = """
+    query Deprecated {
+      hero { name }
+      human(id: "1000") { height(unit: FOOT) }
+    }
+    """
+    (queries_dir / "deprecated.graphql").write_text(query)
+
+    for prune_fields in (False, True):
+        lean_schema = pipeline.run(
+            schema_path,
+            str(queries_dir),
+            strip="deprecated",
+            prune_fields=prune_fields,
+        )
+        types = {T["name"]: T for T in lean_schema["__schema"]["types"]}
+        human_fields = {f["name"] for f in types["Human"]["fields"]}
+        assert {"name", "height"} <= human_fields
+        assert "mass" not in human_fields
+        # Droid implements Character, which keeps the selected name
+        assert "name" in {f["name"] for f in types["Droid"]["fields"]}
+        assert [v["name"] for v in types["LengthUnit"]["enumValues"]] == ["FOOT"]
+
+        # The Query doesn't mutate or subscribe
+        lean_schema["__schema"]["mutationType"] = None
+        lean_schema["__schema"]["subscriptionType"] = None
+        client_schema = graphql.build_client_schema(lean_schema)
+        client_schema._validation_errors = []
+        assert graphql.validate(client_schema, graphql.parse(query)) == []
@@ -2,6 +2,8 @@ from lean_schema import post_process
 import unittest
 import os
 import shutil
+import time
+import unittest.mock
 
 TEST_SRC_DIR = './test-src-dir'
 TEST_DST_DIR = './test-dst-dir'
@@ -170,5 +172,207 @@ class TestPostProcess(unittest.TestCase):
         shutil.rmtree(TEST_SRC_DIR)
         shutil.rmtree(TEST_DST_DIR)
 
+    def test_main_skips_unchanged_files(self):
+        os.mkdir(TEST_SRC_DIR)
+        os.mkdir(TEST_DST_DIR)
+
+        with open('{}/1.test'.format(TEST_SRC_DIR), 'w') as f:
+            f.write("src")
+
+        with open('{}/1.test'.format(TEST_DST_DIR), 'w') as f:
+            f.write("src")
+        os.utime('{}/1.test'.format(TEST_DST_DIR), ns=(0, 0))
+
+        with open('{}/2.test'.format(TEST_SRC_DIR), 'w') as f:
+            f.write("new")
+
+        with open('{}/2.test'.format(TEST_DST_DIR), 'w') as f:
+            f.write("old")
+        os.utime('{}/2.test'.format(TEST_DST_DIR), ns=(0, 0))
+
+        post_process.main([
+            "--src-files-extension", "test",
+            "--skip-unchanged",
+            TEST_SRC_DIR,
+            TEST_DST_DIR
+            ])
+
+        assert os.stat('{}/1.test'.format(TEST_DST_DIR)).st_mtime_ns == 0
+        assert os.stat('{}/2.test'.format(TEST_DST_DIR)).st_mtime_ns != 0
+        with open('{}/2.test'.format(TEST_DST_DIR), 'r') as f:
+            assert f.read() == "new"
+
+    def test_main_link_modes(self):
+        os.mkdir(TEST_SRC_DIR)
+        os.mkdir(TEST_DST_DIR)
+
+        with open('{}/1.test'.format(TEST_SRC_DIR), 'w') as f:
+            f.write("src")
+
+        with open('{}/1.test'.format(TEST_DST_DIR), 'w') as f:
+            f.write("dst")
+
+        for link_mode in ("hardlink", "reflink", "copy"):
+            post_process.main([
+                "--src-files-extension", "test",
+                "--link-mode", link_mode,
+                TEST_SRC_DIR,
+                TEST_DST_DIR
+                ])
+
+            with open('{}/1.test'.format(TEST_DST_DIR), 'r') as f:
+                assert f.read() == "src"
+            with open('{}/1.test'.format(TEST_SRC_DIR), 'r') as f:
+                assert f.read() == "src"
+
+        # Copying over a hard link doesn't write through to the source
+        assert not os.path.samefile(
+            '{}/1.test'.format(TEST_SRC_DIR), '{}/1.test'.format(TEST_DST_DIR)
+        )
+        assert os.listdir(TEST_DST_DIR) == ['1.test']
+
+    def test_main_skip_unchanged_replaces_hard_links(self):
+        os.mkdir(TEST_SRC_DIR)
+        os.mkdir(TEST_DST_DIR)
+        src = '{}/1.test'.format(TEST_SRC_DIR)
+        dst = '{}/1.test'.format(TEST_DST_DIR)
+
+        with open(src, 'w') as f:
+            f.write("src")
+
+        with open(dst, 'w') as f:
+            f.write("dst")
+
+        for link_mode in ("hardlink", "copy"):
+            post_process.main([
+                "--src-files-extension", "test",
+                "--link-mode", link_mode,
+                "--skip-unchanged",
+                TEST_SRC_DIR,
+                TEST_DST_DIR
+                ])
+            assert os.path.samefile(src, dst) == (link_mode == "hardlink")
+
+        assert not os.path.samefile(src, dst)
+        with open(dst, 'r') as f:
+            assert f.read() == "src"
+
+    def test_hardlink_removes_stale_tmp_file(self):
+        os.mkdir(TEST_SRC_DIR)
+        os.mkdir(TEST_DST_DIR)
+        src = '{}/1.test'.format(TEST_SRC_DIR)
+        dst = '{}/1.test'.format(TEST_DST_DIR)
+
+        with open(src, 'w') as f:
+            f.write("src")
+
+        # As left by an interrupted run with the same pid
+        with open('{}/.tmp-{}-1.test'.format(TEST_DST_DIR, os.getpid()), 'w') as f:
+            f.write("stale")
+
+        post_process.hardlink(src, dst)
+        assert os.path.samefile(src, dst)
+        assert os.listdir(TEST_DST_DIR) == ['1.test']
+
+    @unittest.mock.patch('builtins.print')
+    def test_main_with_dst_index(self, builtins_print):
+        os.mkdir(TEST_SRC_DIR)
+        os.makedirs('{}/a'.format(TEST_DST_DIR))
+        os.makedirs('{}/b'.format(TEST_DST_DIR))
+        index_path = '{}/index.json'.format(TEST_SRC_DIR)
+
+        with open('{}/1.graphql.swift'.format(TEST_SRC_DIR), 'w') as f:
+            f.write("src")
+
+        with open('{}/a/1.graphql'.format(TEST_DST_DIR), 'w') as f:
+            f.write("query")
+
+        # Only query files are indexed
+        with open('{}/b/1.kt'.format(TEST_DST_DIR), 'w') as f:
+            f.write("other")
+
+        args = ["--dst-index", index_path, TEST_SRC_DIR, TEST_DST_DIR]
+        post_process.main(args)
+        assert os.path.isfile('{}/a/1.graphql.swift'.format(TEST_DST_DIR))
+        assert not os.path.isfile('{}/b/1.graphql.swift'.format(TEST_DST_DIR))
+        assert builtins_print.call_count == 1
+
+        with open('{}/b/1.gql'.format(TEST_DST_DIR), 'w') as f:
+            f.write("query")
+
+        post_process.main(args)
+        # Matches in more than one directory are reported
+        assert builtins_print.call_count == 3
+        assert "2 directories" in builtins_print.call_args_list[1][0][0]
+
+    def test_dst_index_only_lists_changed_directories(self):
+        os.makedirs('{}/a/b'.format(TEST_DST_DIR))
+        os.makedirs('{}/c'.format(TEST_DST_DIR))
+        index = post_process.DstIndex(None, TEST_DST_DIR)
+        assert index.refresh() == 4
+        # As if saved long after the directories were last changed
+        index.saved_at_ns = time.time_ns() + 10 ** 10
+        assert index.refresh() == 0
+
+        with open('{}/a/b/1.graphql'.format(TEST_DST_DIR), 'w') as f:
+            f.write("query")
+        os.utime('{}/a/b'.format(TEST_DST_DIR), ns=(0, 0))
+        assert index.refresh() == 1
+        assert index.get_matches() == {
+            "1": [os.path.join(os.path.abspath(TEST_DST_DIR), "a", "b", "1.graphql")]
+        }
+
+        shutil.rmtree('{}/a'.format(TEST_DST_DIR))
+        os.utime(TEST_DST_DIR, ns=(0, 0))
+        assert index.refresh() == 1
+        assert index.get_matches() == {}
+
+    @unittest.mock.patch('builtins.print')
+    def test_main_with_jobs_collects_errors(self, builtins_print):
+        os.mkdir(TEST_SRC_DIR)
+        os.mkdir(TEST_DST_DIR)
+
+        for i in range(8):
+            with open('{}/{}.test'.format(TEST_SRC_DIR, i), 'w') as f:
+                f.write("src")
+            with open('{}/{}.graphql'.format(TEST_DST_DIR, i), 'w') as f:
+                f.write("query")
+        with open('{}/unmatched.test'.format(TEST_SRC_DIR), 'w') as f:
+            f.write("src")
+        # Can't be copied over
+        os.remove('{}/3.test'.format(TEST_SRC_DIR))
+        os.mkdir('{}/3.test'.format(TEST_SRC_DIR))
+
+        with self.assertRaises(SystemExit) as se:
+            post_process.main([
+                "--src-files-extension", "test",
+                "--skip-unchanged",
+                "--jobs", "4",
+                TEST_SRC_DIR,
+                TEST_DST_DIR
+                ])
+        assert se.exception.code == 1
+
+        for i in range(8):
+            assert os.path.isfile('{}/{}.test'.format(TEST_DST_DIR, i)) == (i != 3)
+        messages = [call[0][0] for call in builtins_print.call_args_list]
+        assert sum("could not copy" in message for message in messages) == 1
+        assert messages[-1] == (
+            "Copied 7 files, skipped 0 unchanged, 1 unmatched, 1 failed"
+        )
+
+        builtins_print.reset_mock()
+        with self.assertRaises(SystemExit):
+            post_process.main([
+                "--src-files-extension", "test",
+                "--skip-unchanged",
+                "--jobs", "4",
+                TEST_SRC_DIR,
+                TEST_DST_DIR
+                ])
+        assert builtins_print.call_args[0][0] == (
+            "Copied 0 files, skipped 7 unchanged, 1 unmatched, 1 failed"
+        )
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,78 @@
+from lean_schema import decomp, get_types
+from lean_schema.stats import Stats, count_active
+from unittest import mock
+import json
+
+SWAPI_SCHEMA_PATH = "tests/swapi_schema.json"
+DECOMP_PHASES = [
+    "schema_load",
+    "graph_build",
+    "root_collection",
+    "scalar_scan",
+    "input_object_unfolding",
+    "ref_rewrite",
+    "reduction",
+    "serialization",
+]
+
+
+def test_disabled_stats_record_nothing():
+    stats = Stats("test", enabled=False).activate()
+    with stats.phase("load") as phase:
+        phase.count(types=1)
+        count_active(files=1)
+
+    assert stats.phases == []
+
+
+def test_phases_and_counts():
+    stats = Stats("test").activate()
+    with stats.phase("load") as phase:
+        phase.count(types=2)
+        count_active(types=1, files=1)
+    count_active(files=1)
+
+    record = stats.to_dict()
+    assert [phase["phase"] for phase in record["phases"]] == ["load"]
+    assert record["phases"][0]["counts"] == {"types": 3, "files": 1}
+    assert record["phases"][0]["wall_s"] >= 0
+
+
+@mock.patch("sys.stdin")
+@mock.patch("builtins.print")
+def test_decomp_main_stats_json(print_mock, stdin_mock, tmp_path):
+    stdin_mock.fileno = lambda: 2
+    stdin_mock.read = lambda: json.dumps({"types": ["Human"]})
+    stats_path = str(tmp_path / "stats.json")
+    log_path = str(tmp_path / "log.decomp")
+    decomp.main(
+        [
+            SWAPI_SCHEMA_PATH,
+            "--no-cache",
+            "--stats-json",
+            stats_path,
+            "--log-file",
+            log_path,
+        ]
+    )
+
+    with open(stats_path) as ifile:
+        record = json.load(ifile)
+    assert record["program"] == "decomp"
+    assert [phase["phase"] for phase in record["phases"]] == DECOMP_PHASES
+    phases = {phase["phase"]: phase for phase in record["phases"]}
+    assert phases["graph_build"]["counts"]["edges"] > 0
+
+
+def test_get_types_main_stats_json(tmp_path):
+    stats_path = str(tmp_path / "stats.json")
+    get_types.main(
+        [SWAPI_SCHEMA_PATH, "tests/swapi_queries", "--stats-json", stats_path]
+    )
+
+    with open(stats_path) as ifile:
+        record = json.load(ifile)
+    phases = {phase["phase"]: phase for phase in record["phases"]}
+    assert list(phases) == ["schema_load", "visit", "serialization"]
+    assert phases["visit"]["counts"]["files"] == 3
+    assert phases["visit"]["counts"]["ast_nodes"] > 0